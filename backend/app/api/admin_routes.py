@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from datetime import datetime
+from typing import Optional
+
+from app.core.config import settings
+from app.models.database.user import User
+from app.services.auth_service import admin_required
+from app.services.ingest_sharding import ingest_sharding
+from app.services.profiling_service import sampling_profiler, loop_block_monitor
+from app.services.traffic_recorder import traffic_recorder
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.post("/profiler/start")
+async def start_profiler(
+    seconds: float = Query(30, gt=0, description="How long to sample for"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="Time between samples"),
+    current_user: User = Depends(admin_required)
+):
+    """Start sampling the stacks of all threads of this process (admin only)"""
+    try:
+        sampling_profiler.start(seconds, interval_ms / 1000.0)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return sampling_profiler.get_status()
+
+
+@router.post("/profiler/stop")
+async def stop_profiler(current_user: User = Depends(admin_required)):
+    """Stop the running profile early, keeping the samples taken so far (admin only)"""
+    await sampling_profiler.stop()
+    return sampling_profiler.get_status()
+
+
+@router.get("/profiler")
+async def get_profiler_status(current_user: User = Depends(admin_required)):
+    """State of the current or last profile (admin only)"""
+    return sampling_profiler.get_status()
+
+
+@router.get("/profiler/collapsed", response_class=PlainTextResponse)
+async def get_profile(current_user: User = Depends(admin_required)):
+    """
+    Samples of the current or last profile as collapsed stacks, one
+    'frame;frame;frame count' line per distinct stack. Feed it to
+    flamegraph.pl or load it in speedscope (admin only).
+    """
+    status = sampling_profiler.get_status()
+    if not status["samples"]:
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    started = datetime.fromtimestamp(status["started_at"]).strftime("%Y%m%d-%H%M%S")
+    return PlainTextResponse(
+        sampling_profiler.get_collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{started}.folded"'}
+    )
+
+
+@router.get("/event-loop")
+async def get_event_loop_blocks(current_user: User = Depends(admin_required)):
+    """Event loop lag and the stacks of recent callbacks that blocked it (admin only)"""
+    return {
+        **loop_block_monitor.get_stats(),
+        "recent_blocks": loop_block_monitor.get_recent_blocks()
+    }
+
+
+@router.post("/traffic-capture/start")
+async def start_traffic_capture(
+    name: Optional[str] = Query(None, description="File name inside the capture directory (default: timestamped)"),
+    current_user: User = Depends(admin_required)
+):
+    """Start appending every incoming MQTT message to a capture file for offline replay (admin only)"""
+    if settings.INGEST_MODE == "process":
+        # API workers only receive the fan-out topic; sensor traffic goes to the ingest process
+        raise HTTPException(
+            status_code=409,
+            detail="Traffic capture is not available with INGEST_MODE=process; the API workers do not receive sensor traffic"
+        )
+    try:
+        traffic_recorder.start(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (RuntimeError, FileExistsError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return traffic_recorder.get_status()
+
+
+@router.post("/traffic-capture/stop")
+async def stop_traffic_capture(current_user: User = Depends(admin_required)):
+    """Stop recording and close the capture file (admin only)"""
+    traffic_recorder.stop()
+    return traffic_recorder.get_status()
+
+
+@router.get("/traffic-capture")
+async def get_traffic_capture_status(current_user: User = Depends(admin_required)):
+    """State of the current or last capture (admin only)"""
+    return traffic_recorder.get_status()
+
+
+@router.get("/ingest")
+async def get_ingest_sharding(current_user: User = Depends(admin_required)):
+    """Which readings this worker processes when ingest is sharded (admin only)"""
+    return ingest_sharding.get_status()
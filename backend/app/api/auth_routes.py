@@ -3,7 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.sessions import get_session
 from pydantic import BaseModel, field_validator
 from app.services.auth_service import (
-    get_password_hash, authenticate_user, create_access_token, get_user_by_username, admin_required
+    get_password_hash_async, authenticate_user, create_access_token, get_user_by_username, admin_required,
+    password_hasher
 )
 from app.models.database.user import User
 from sqlalchemy.future import select
@@ -45,7 +46,7 @@ async def register_user(
         username=payload.username,
         email=payload.email,
         full_name=payload.full_name,
-        password_hash=get_password_hash(payload.password),
+        password_hash=await get_password_hash_async(payload.password),
         is_admin=False
     )
     async for session in get_session():
@@ -55,3 +56,7 @@ async def register_user(
         return {"message": "User created", "username": user.username}
 
 
+@router.get("/password-pool/stats")
+async def get_password_pool_stats(current_user: User = Depends(admin_required)):
+    """Load and latency of the bcrypt worker pool (admin only)"""
+    return password_hasher.get_stats()
@@ -1,22 +1,241 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import and_, desc
 from app.db.sessions import get_session
 from app.models.database.daily_averages import DailyAverageDB
+from app.models.database.period_averages import PeriodAverageDB
 from app.models.database.unit import UnitDB
+from app.services.daily_averages_service import daily_average_versions
+from app.services.mqtt_cache_manager import mqtt_cache_manager
+from app.services.downsampling import downsample_columns, columns_to_rows
+from app.services.period_averages_service import choose_period, period_start
+from app.services.averages_block_cache import averages_block_cache
+from app.api.http_cache import make_etag, etag_matches, not_modified, set_cache_headers, REVALIDATE, HISTORICAL
 from datetime import date, datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional
 
 router = router = APIRouter(prefix="/api")
 router.tags = ["averages"]
 
+# Upper bound on units per batch request
+MAX_BATCH_UNITS = 200
+
+
+def _resolve_date_range(start_date: Optional[str], end_date: Optional[str], days: int):
+    """Parse an explicit date range or fall back to the last N days"""
+    if start_date and end_date:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    else:
+        end = date.today()
+        start = end - timedelta(days=days)
+    return start, end
+
+
+def _alert_levels(unit: UnitDB) -> dict:
+    return {
+        "normal": unit.normal_level,
+        "warning": unit.warning_level,
+        "high": unit.high_level,
+        "critical": unit.critical_level
+    }
+
+
+def _point_date(avg) -> date:
+    """Date of a daily row, or the first day of a week/month/year rollup row"""
+    return avg.period_start if isinstance(avg, PeriodAverageDB) else avg.date
+
+
+async def _load_series(session: AsyncSession, unit_ids: List[str], start: date, end: date, period: Optional[str]) -> Dict[str, list]:
+    """
+    Fetch the series of several units in one query: daily rows, or the
+    period_averages rows of the given rollup level overlapping the range.
+    """
+    series = {unit_id: [] for unit_id in unit_ids}
+    if not unit_ids:
+        return series
+
+    if period is None:
+        query = select(DailyAverageDB).where(
+            and_(
+                DailyAverageDB.unit_id.in_(unit_ids),
+                DailyAverageDB.date >= start,
+                DailyAverageDB.date <= end
+            )
+        ).order_by(DailyAverageDB.unit_id, DailyAverageDB.date)
+    else:
+        query = select(PeriodAverageDB).where(
+            and_(
+                PeriodAverageDB.unit_id.in_(unit_ids),
+                PeriodAverageDB.period == period,
+                PeriodAverageDB.period_start >= period_start(start, period),
+                PeriodAverageDB.period_start <= end
+            )
+        ).order_by(PeriodAverageDB.unit_id, PeriodAverageDB.period_start)
+
+    result = await session.execute(query)
+    for avg in result.scalars().all():
+        series[avg.unit_id].append(avg)
+    return series
+
+
+def _averages_to_columns(averages) -> dict:
+    """One list per field instead of one dict per day"""
+    return {
+        "date": [_point_date(avg).isoformat() for avg in averages],
+        "avg_height": [avg.avg_height for avg in averages],
+        "min_height": [avg.min_height for avg in averages],
+        "max_height": [avg.max_height for avg in averages],
+        "p10_height": [avg.p10_height for avg in averages],
+        "p50_height": [avg.p50_height for avg in averages],
+        "p90_height": [avg.p90_height for avg in averages],
+        "avg_temperature": [avg.avg_temperature for avg in averages],
+        "avg_battery": [avg.avg_battery for avg in averages],
+        "avg_rssi": [avg.avg_rssi for avg in averages],
+        "avg_snr": [avg.avg_snr for avg in averages],
+        "measurement_count": [avg.measurement_count for avg in averages]
+    }
+
+
+def _format_series(averages, response_format: str, max_points: Optional[int]):
+    """
+    Shape a unit's daily averages for the response.
+    Downsamples to max_points with LTTB on avg_height, then returns either
+    rows (one dict per day) or columns (one array per field).
+    """
+    if response_format == "rows" and (max_points is None or len(averages) <= max_points):
+        return [_average_to_dict(avg) for avg in averages]
+
+    x = [_point_date(avg).toordinal() for avg in averages]
+    return _format_columns(x, _averages_to_columns(averages), response_format, max_points)
+
+
+def _format_columns(x: List[int], columns: dict, response_format: str, max_points: Optional[int]):
+    """Same as _format_series, for a series that is already columnar (x = date ordinals)"""
+    if max_points is not None:
+        columns = downsample_columns(columns, x, "avg_height", max_points)
+    if response_format == "columnar":
+        return columns
+    return columns_to_rows(columns)
+
+
+def _series_length(data) -> int:
+    return len(data["date"]) if isinstance(data, dict) else len(data)
+
+
+def _average_to_dict(avg) -> dict:
+    return {
+        "date": _point_date(avg).isoformat(),
+        "avg_height": avg.avg_height,
+        "min_height": avg.min_height,
+        "max_height": avg.max_height,
+        "p10_height": avg.p10_height,
+        "p50_height": avg.p50_height,
+        "p90_height": avg.p90_height,
+        "avg_temperature": avg.avg_temperature,
+        "avg_battery": avg.avg_battery,
+        "avg_rssi": avg.avg_rssi,
+        "avg_snr": avg.avg_snr,
+        "measurement_count": avg.measurement_count
+    }
+
+
+@router.get("/averages")
+async def get_multi_unit_averages(
+    request: Request,
+    response: Response,
+    unit_ids: str = Query(..., description="Comma-separated unit IDs, e.g. 001,002,003"),
+    start_date: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
+    end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD format"),
+    days: Optional[int] = Query(30, description="Number of days to fetch (default 30, used if dates not provided)"),
+    format: str = Query("rows", pattern="^(rows|columnar)$", description="'rows' (one object per day) or 'columnar' (one array per field)"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample to at most this many points (shape-preserving LTTB)"),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Get daily average values for several units at once (river-wide comparison charts).
+
+    Unit metadata and daily averages for all requested units are fetched in two
+    queries in total, and returned grouped by unit in the requested order.
+    Unknown unit IDs are listed in "missing_units".
+    Supports the same format / max_points / resolution options as /averages/{unit_id}.
+    """
+    try:
+        requested = list(dict.fromkeys(u.strip() for u in unit_ids.split(",") if u.strip()))
+        if not requested:
+            raise HTTPException(status_code=400, detail="unit_ids must contain at least one unit ID")
+        if len(requested) > MAX_BATCH_UNITS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UNITS} units per request")
+
+        start, end = _resolve_date_range(start_date, end_date, days)
+
+        cache_control = HISTORICAL if end < date.today() else REVALIDATE
+        etag = make_etag(
+            "batch_averages", start, end, format, max_points,
+            *(f"{unit_id}={daily_average_versions.get(unit_id)}" for unit_id in requested),
+            mqtt_cache_manager.get_unit_metadata_fingerprint()
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, cache_control)
+
+        # Query 1: metadata for every requested unit
+        unit_result = await session.execute(
+            select(UnitDB).where(UnitDB.unit_id.in_(requested))
+        )
+        units = {unit.unit_id: unit for unit in unit_result.scalars().all()}
+
+        # Query 2: averages for every found unit over the range
+        period = choose_period((end - start).days + 1, max_points)
+        averages_by_unit = await _load_series(session, list(units), start, end, period)
+
+        units_data = []
+        for unit_id in requested:
+            unit = units.get(unit_id)
+            if not unit:
+                continue
+            data = _format_series(averages_by_unit[unit_id], format, max_points)
+            units_data.append({
+                "unit_id": unit_id,
+                "unit_name": unit.name,
+                "location": unit.location,
+                "alert_levels": _alert_levels(unit),
+                "data_points": _series_length(data),
+                "source_points": len(averages_by_unit[unit_id]),
+                "data": data
+            })
+
+        set_cache_headers(response, etag, cache_control)
+        return {
+            "format": format,
+            "resolution": period or "day",
+            "date_range": {
+                "start": start.isoformat(),
+                "end": end.isoformat()
+            },
+            "units": units_data,
+            "missing_units": [unit_id for unit_id in requested if unit_id not in units]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving averages: {str(e)}")
+
+
 @router.get("/averages/{unit_id}")
 async def get_unit_averages(
     unit_id: str,
+    request: Request,
+    response: Response,
     start_date: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
     end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD format"),
     days: Optional[int] = Query(30, description="Number of days to fetch (default 30, used if dates not provided)"),
+    format: str = Query("rows", pattern="^(rows|columnar)$", description="'rows' (one object per day) or 'columnar' (one array per field)"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample to at most this many points (shape-preserving LTTB)"),
     session: AsyncSession = Depends(get_session)
 ):
     """
@@ -27,11 +246,33 @@ async def get_unit_averages(
     - start_date: Optional start date (YYYY-MM-DD)
     - end_date: Optional end date (YYYY-MM-DD)
     - days: Number of days to fetch if dates not provided (default 30)
+    - format: 'rows' (default) or 'columnar' (one array per field)
+    - max_points: Optional server-side downsampling (LTTB on avg_height)
     
     Returns:
-    - Daily average data including height, temperature, battery, rssi, snr
+    - Daily average data including height (avg, min, max, p10, p50, p90), temperature, battery, rssi, snr
+
+    With max_points, long ranges are served from the coarsest weekly, monthly
+    or yearly rollup whose periods still fit the requested resolution (see
+    "resolution"), then downsampled if still above max_points.
+
+    Supports conditional GET: the ETag changes only when a daily average of
+    this unit is written or unit metadata changes.
     """
     try:
+        # Determine date range
+        start, end = _resolve_date_range(start_date, end_date, days)
+
+        # Past ranges only change on backfill; ranges reaching today must be revalidated
+        cache_control = HISTORICAL if end < date.today() else REVALIDATE
+        etag = make_etag(
+            "averages", unit_id, start, end, format, max_points,
+            daily_average_versions.get(unit_id),
+            mqtt_cache_manager.get_unit_metadata_fingerprint()
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, cache_control)
+
         # Verify unit exists
         unit_result = await session.execute(
             select(UnitDB).where(UnitDB.unit_id == unit_id)
@@ -41,29 +282,17 @@ async def get_unit_averages(
         if not unit:
             raise HTTPException(status_code=404, detail=f"Unit {unit_id} not found")
         
-        # Determine date range
-        if start_date and end_date:
-            try:
-                start = datetime.strptime(start_date, "%Y-%m-%d").date()
-                end = datetime.strptime(end_date, "%Y-%m-%d").date()
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+        # Daily averages come from the month block cache; long ranges use a coarser rollup
+        period = choose_period((end - start).days + 1, max_points)
+        if period is None:
+            x, columns = await averages_block_cache.get_daily_series(session, unit_id, start, end)
+            source_points = len(x)
+            data = _format_columns(x, columns, format, max_points)
         else:
-            end = date.today()
-            start = end - timedelta(days=days)
-        
-        # Query daily averages
-        query = select(DailyAverageDB).where(
-            and_(
-                DailyAverageDB.unit_id == unit_id,
-                DailyAverageDB.date >= start,
-                DailyAverageDB.date <= end
-            )
-        ).order_by(DailyAverageDB.date)
-        
-        result = await session.execute(query)
-        averages = result.scalars().all()
-        
+            averages = (await _load_series(session, [unit_id], start, end, period))[unit_id]
+            source_points = len(averages)
+            data = _format_series(averages, format, max_points)
+
         # Format response for graphing
         graph_data = {
             "unit_id": unit_id,
@@ -73,29 +302,15 @@ async def get_unit_averages(
                 "start": start.isoformat(),
                 "end": end.isoformat()
             },
-            "alert_levels": {
-                "normal": unit.normal_level,
-                "warning": unit.warning_level,
-                "high": unit.high_level,
-                "critical": unit.critical_level
-            },
-            "data_points": len(averages),
-            "data": []
+            "alert_levels": _alert_levels(unit),
+            "format": format,
+            "resolution": period or "day",
+            "data_points": _series_length(data),
+            "source_points": source_points,
+            "data": data
         }
         
-        for avg in averages:
-            graph_data["data"].append({
-                "date": avg.date.isoformat(),
-                "avg_height": avg.avg_height,
-                "min_height": avg.min_height,
-                "max_height": avg.max_height,
-                "avg_temperature": avg.avg_temperature,
-                "avg_battery": avg.avg_battery,
-                "avg_rssi": avg.avg_rssi,
-                "avg_snr": avg.avg_snr,
-                "measurement_count": avg.measurement_count
-            })
-        
+        set_cache_headers(response, etag, cache_control)
         return graph_data
         
     except HTTPException:
@@ -107,14 +322,25 @@ async def get_unit_averages(
 @router.get("/averages/{unit_id}/latest")
 async def get_latest_averages(
     unit_id: str,
+    request: Request,
+    response: Response,
     limit: int = Query(7, description="Number of latest records to fetch (default 7)"),
     session: AsyncSession = Depends(get_session)
 ):
     """
     Get the latest N daily average records for a unit.
     Useful for quick overview charts.
+    Supports conditional GET (ETag / If-None-Match).
     """
     try:
+        etag = make_etag(
+            "latest_averages", unit_id, limit,
+            daily_average_versions.get(unit_id),
+            mqtt_cache_manager.get_unit_metadata_fingerprint()
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, REVALIDATE)
+
         # Verify unit exists
         unit_result = await session.execute(
             select(UnitDB).where(UnitDB.unit_id == unit_id)
@@ -140,29 +366,15 @@ async def get_latest_averages(
             "unit_id": unit_id,
             "unit_name": unit.name,
             "location": unit.location,
-            "alert_levels": {
-                "normal": unit.normal_level,
-                "warning": unit.warning_level,
-                "high": unit.high_level,
-                "critical": unit.critical_level
-            },
+            "alert_levels": _alert_levels(unit),
             "records_count": len(averages),
             "data": []
         }
         
         for avg in averages:
-            response_data["data"].append({
-                "date": avg.date.isoformat(),
-                "avg_height": avg.avg_height,
-                "min_height": avg.min_height,
-                "max_height": avg.max_height,
-                "avg_temperature": avg.avg_temperature,
-                "avg_battery": avg.avg_battery,
-                "avg_rssi": avg.avg_rssi,
-                "avg_snr": avg.avg_snr,
-                "measurement_count": avg.measurement_count
-            })
+            response_data["data"].append(_average_to_dict(avg))
         
+        set_cache_headers(response, etag, REVALIDATE)
         return response_data
         
     except HTTPException:
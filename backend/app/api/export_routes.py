@@ -0,0 +1,196 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.future import select
+from sqlalchemy import and_
+from app.db.sessions import AsyncSessionLocal
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.models.database.daily_averages import DailyAverageDB
+from datetime import date, datetime
+from typing import AsyncIterator, List, Optional
+import csv
+import io
+import json
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/export")
+router.tags = ["export"]
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 5000
+
+_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+MEASUREMENT_COLUMNS = [
+    SensorMeasurementDB.unit_id,
+    SensorMeasurementDB.recorded_at,
+    SensorMeasurementDB.height,
+    SensorMeasurementDB.temperature,
+    SensorMeasurementDB.battery,
+    SensorMeasurementDB.rssi,
+    SensorMeasurementDB.snr,
+]
+
+AVERAGE_COLUMNS = [
+    DailyAverageDB.unit_id,
+    DailyAverageDB.date,
+    DailyAverageDB.avg_height,
+    DailyAverageDB.min_height,
+    DailyAverageDB.max_height,
+    DailyAverageDB.p10_height,
+    DailyAverageDB.p50_height,
+    DailyAverageDB.p90_height,
+    DailyAverageDB.avg_temperature,
+    DailyAverageDB.avg_battery,
+    DailyAverageDB.avg_rssi,
+    DailyAverageDB.avg_snr,
+    DailyAverageDB.measurement_count,
+]
+
+
+def _parse_unit_ids(unit_ids: Optional[str]) -> List[str]:
+    if not unit_ids:
+        return []
+    return list(dict.fromkeys(u.strip() for u in unit_ids.split(",") if u.strip()))
+
+
+def _parse_datetime(value: str, name: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' value. Use ISO 8601, e.g. 2025-01-31T12:00:00")
+
+
+def _parse_date(value: str, name: str) -> date:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' value. Use YYYY-MM-DD")
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _encode_csv(rows, header: Optional[List[str]] = None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(
+        [_json_value(value) for value in row] for row in rows
+    )
+    return buffer.getvalue()
+
+
+def _encode_ndjson(rows, names: List[str]) -> str:
+    return "".join(
+        json.dumps(dict(zip(names, (_json_value(value) for value in row))), separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+
+async def _stream_export(query, names: List[str], export_format: str, compress: bool) -> AsyncIterator[bytes]:
+    """
+    Stream query results through a server-side cursor, encoding one batch at a time.
+    Memory use is bounded by EXPORT_BATCH_SIZE regardless of the size of the export.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+
+    def emit(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    # The request-scoped session is closed before a streaming body is sent, so the export owns its session
+    async with AsyncSessionLocal() as session:
+        try:
+            if export_format == "csv":
+                yield emit(_encode_csv([], header=names))
+
+            result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for rows in result.partitions():
+                if export_format == "csv":
+                    chunk = emit(_encode_csv(rows))
+                else:
+                    chunk = emit(_encode_ndjson(rows, names))
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            logger.error(f"Export failed mid-stream: {e}")
+            raise
+
+    if compressor:
+        yield compressor.flush()
+
+
+def _streaming_response(query, names: List[str], export_format: str, compress: bool, basename: str) -> StreamingResponse:
+    filename = f"{basename}.{export_format}" + (".gz" if compress else "")
+    media_type = "application/gzip" if compress else _MEDIA_TYPES[export_format]
+    return StreamingResponse(
+        _stream_export(query, names, export_format, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/measurements")
+async def export_measurements(
+    unit_ids: Optional[str] = Query(None, description="Comma-separated unit IDs (default: all units)"),
+    from_: Optional[str] = Query(None, alias="from", description="Start (inclusive), ISO 8601"),
+    to: Optional[str] = Query(None, description="End (exclusive), ISO 8601"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="'csv' or 'ndjson'"),
+    gzip: bool = Query(False, description="Gzip-compress the export"),
+):
+    """
+    Export raw sensor measurements as CSV or NDJSON.
+
+    Rows are streamed from a server-side cursor and encoded incrementally,
+    ordered by unit and time, so memory stays flat for exports of any size.
+    """
+    conditions = []
+    units = _parse_unit_ids(unit_ids)
+    if units:
+        conditions.append(SensorMeasurementDB.unit_id.in_(units))
+    if from_:
+        conditions.append(SensorMeasurementDB.recorded_at >= _parse_datetime(from_, "from"))
+    if to:
+        conditions.append(SensorMeasurementDB.recorded_at < _parse_datetime(to, "to"))
+
+    query = select(*MEASUREMENT_COLUMNS)
+    if conditions:
+        query = query.where(and_(*conditions))
+    query = query.order_by(SensorMeasurementDB.unit_id, SensorMeasurementDB.recorded_at, SensorMeasurementDB.id)
+
+    names = [column.key for column in MEASUREMENT_COLUMNS]
+    return _streaming_response(query, names, format, gzip, "measurements")
+
+
+@router.get("/averages")
+async def export_daily_averages(
+    unit_ids: Optional[str] = Query(None, description="Comma-separated unit IDs (default: all units)"),
+    start_date: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
+    end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD format"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="'csv' or 'ndjson'"),
+    gzip: bool = Query(False, description="Gzip-compress the export"),
+):
+    """
+    Export daily averages as CSV or NDJSON, streamed like the measurements export.
+    """
+    conditions = []
+    units = _parse_unit_ids(unit_ids)
+    if units:
+        conditions.append(DailyAverageDB.unit_id.in_(units))
+    if start_date:
+        conditions.append(DailyAverageDB.date >= _parse_date(start_date, "start_date"))
+    if end_date:
+        conditions.append(DailyAverageDB.date <= _parse_date(end_date, "end_date"))
+
+    query = select(*AVERAGE_COLUMNS)
+    if conditions:
+        query = query.where(and_(*conditions))
+    query = query.order_by(DailyAverageDB.unit_id, DailyAverageDB.date)
+
+    names = [column.key for column in AVERAGE_COLUMNS]
+    return _streaming_response(query, names, format, gzip, "daily_averages")
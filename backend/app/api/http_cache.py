@@ -0,0 +1,35 @@
+import hashlib
+from fastapi import Request, Response
+
+# Cache-Control policies used by the read endpoints
+REVALIDATE = "private, no-cache"
+HISTORICAL = "private, max-age=3600"
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong ETag from cheap version markers. The markers must be the
+    same in every worker (content digests, counters stored in the database),
+    or clients load-balanced across workers would rarely get a 304.
+    """
+    raw = ":".join(str(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """304 response carrying the validators the client should keep"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def set_cache_headers(response: Response, etag: str, cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
@@ -0,0 +1,176 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import and_, func, tuple_
+from app.db.sessions import get_session
+from app.db.time_buckets import time_bucket
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.services.mqtt_cache_manager import mqtt_cache_manager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import base64
+import re
+
+router = APIRouter(prefix="/api")
+router.tags = ["measurements"]
+
+# Paging / aggregation limits
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+MAX_BUCKETS = 10000
+
+_BUCKET_PATTERN = re.compile(r"^(\d+)([smhd])$")
+_BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_datetime(value: str, name: str) -> datetime:
+    """Parse an ISO 8601 time as aware UTC; naive values are in the server's timezone, as in day_bounds"""
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' value. Use ISO 8601, e.g. 2025-01-31T12:00:00")
+
+
+def _parse_bucket(bucket: str) -> int:
+    """Parse a bucket size such as 30s, 5m, 1h or 1d into seconds"""
+    match = _BUCKET_PATTERN.match(bucket)
+    if not match or int(match.group(1)) == 0:
+        raise HTTPException(status_code=400, detail="Invalid bucket. Use <number><s|m|h|d>, e.g. 5m")
+    return int(match.group(1)) * _BUCKET_UNITS[match.group(2)]
+
+
+def _encode_cursor(recorded_at: datetime, measurement_id: int) -> str:
+    raw = f"{recorded_at.isoformat()}|{measurement_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        recorded_at, measurement_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(recorded_at), int(measurement_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _isoformat(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+@router.get("/measurements/{unit_id}")
+async def get_unit_measurements(
+    unit_id: str,
+    from_: Optional[str] = Query(None, alias="from", description="Start (inclusive), ISO 8601. Default: 24 hours before 'to'"),
+    to: Optional[str] = Query(None, description="End (exclusive), ISO 8601. Default: now"),
+    bucket: Optional[str] = Query(None, description="Aggregate into time buckets, e.g. 30s, 5m, 1h, 1d"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Raw rows per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (raw rows only)"),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Get raw sensor measurements for a unit, or time-bucketed aggregates.
+
+    - With `bucket`, rows are grouped in the database into fixed time buckets
+      (avg/min/max height, averages of the other fields, count per bucket).
+    - Without `bucket`, raw rows are returned ordered by (recorded_at, id) and
+      paged with a keyset cursor: pass `next_cursor` back as `cursor`.
+    """
+    try:
+        await mqtt_cache_manager.ensure_unit_metadata_loaded()
+        if not mqtt_cache_manager.get_unit_metadata(unit_id):
+            raise HTTPException(status_code=404, detail=f"Unit {unit_id} not found")
+
+        end = _parse_datetime(to, "to") if to else datetime.now(timezone.utc)
+        start = _parse_datetime(from_, "from") if from_ else end - timedelta(hours=24)
+        if start >= end:
+            raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+        in_range = and_(
+            SensorMeasurementDB.unit_id == unit_id,
+            SensorMeasurementDB.recorded_at >= start,
+            SensorMeasurementDB.recorded_at < end
+        )
+
+        if bucket:
+            bucket_seconds = _parse_bucket(bucket)
+            if (end - start).total_seconds() / bucket_seconds > MAX_BUCKETS:
+                raise HTTPException(status_code=400, detail=f"Too many buckets; at most {MAX_BUCKETS} per request")
+
+            bucket_start = time_bucket(SensorMeasurementDB.recorded_at, bucket_seconds).label("bucket_start")
+            result = await session.execute(
+                select(
+                    bucket_start,
+                    func.avg(SensorMeasurementDB.height).label("avg_height"),
+                    func.min(SensorMeasurementDB.height).label("min_height"),
+                    func.max(SensorMeasurementDB.height).label("max_height"),
+                    func.avg(SensorMeasurementDB.temperature).label("avg_temperature"),
+                    func.avg(SensorMeasurementDB.battery).label("avg_battery"),
+                    func.avg(SensorMeasurementDB.rssi).label("avg_rssi"),
+                    func.avg(SensorMeasurementDB.snr).label("avg_snr"),
+                    func.count(SensorMeasurementDB.id).label("measurement_count")
+                )
+                .where(in_range)
+                .group_by(bucket_start)
+                .order_by(bucket_start)
+            )
+            data = [
+                {
+                    "time": _isoformat(row.bucket_start),
+                    "avg_height": row.avg_height,
+                    "min_height": row.min_height,
+                    "max_height": row.max_height,
+                    "avg_temperature": row.avg_temperature,
+                    "avg_battery": row.avg_battery,
+                    "avg_rssi": row.avg_rssi,
+                    "avg_snr": row.avg_snr,
+                    "measurement_count": row.measurement_count
+                }
+                for row in result.all()
+            ]
+            return {
+                "unit_id": unit_id,
+                "from": start.isoformat(),
+                "to": end.isoformat(),
+                "bucket": bucket,
+                "count": len(data),
+                "data": data
+            }
+
+        # Raw rows with keyset pagination on (recorded_at, id); never OFFSET
+        query = select(SensorMeasurementDB).where(in_range)
+        if cursor:
+            cursor_recorded_at, cursor_id = _decode_cursor(cursor)
+            query = query.where(
+                tuple_(SensorMeasurementDB.recorded_at, SensorMeasurementDB.id) > tuple_(cursor_recorded_at, cursor_id)
+            )
+        query = query.order_by(SensorMeasurementDB.recorded_at, SensorMeasurementDB.id).limit(limit + 1)
+
+        result = await session.execute(query)
+        rows = result.scalars().all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        return {
+            "unit_id": unit_id,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "bucket": None,
+            "count": len(rows),
+            "data": [
+                {
+                    "id": row.id,
+                    "recorded_at": row.recorded_at.isoformat(),
+                    "height": row.height,
+                    "temperature": row.temperature,
+                    "battery": row.battery,
+                    "rssi": row.rssi,
+                    "snr": row.snr
+                }
+                for row in rows
+            ],
+            "next_cursor": _encode_cursor(rows[-1].recorded_at, rows[-1].id) if has_more else None
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving measurements: {str(e)}")
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.core.metrics import REGISTRY
+
+router = APIRouter()
+router.tags = ["metrics"]
+
+# Prometheus text exposition format
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Ingest pipeline, cache, WebSocket and database pool metrics for Prometheus to scrape"""
+    return Response(REGISTRY.render(), media_type=METRICS_MEDIA_TYPE)
@@ -3,7 +3,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.services.websocket_service import websocket_service
 from app.services.mqtt_service import mqtt_service
-from app.services.mqtt_cache_manager import mqtt_cache_manager
+from app.services.stale_sensor_monitor import stale_sensor_monitor
+from app.services.averages_block_cache import averages_block_cache
+from app.services.cache_events import cache_events
+from app.services.shared_state import get_live_state, shared_state
+from app.core.config import settings
 from app.db.sessions import get_session
 from app.models.database.unit import UnitDB
 
@@ -16,6 +20,8 @@ async def get_cache_statistics():
         stats = mqtt_service.get_cache_statistics()
         return {
             "cache_stats": stats,
+            "averages_block_cache": averages_block_cache.get_stats(),
+            "cache_events": cache_events.get_stats(),
             "message": "Cache statistics retrieved successfully"
         }
     except Exception as e:
@@ -48,11 +54,28 @@ async def get_mqtt_status():
             "is_connected": mqtt_service.is_connected,
             "is_alive": is_alive,
             "websocket_connections": websocket_service.get_connection_stats(),
-            "cache_stats": mqtt_service.get_cache_statistics()
+            "cache_stats": mqtt_service.get_cache_statistics(),
+            "stale_monitor": stale_sensor_monitor.get_stats(),
+            "ingest_mode": settings.INGEST_MODE,
+            "shared_state": shared_state.get_status() if settings.INGEST_MODE == "process" else None
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting MQTT status: {str(e)}")
 
+@router.get("/fleet/status")
+async def get_fleet_status():
+    """
+    Get a live summary of the whole fleet: how many units are normal, warning,
+    high, critical or stale, plus the current state of each unit. Units that
+    have not reported since startup count as unknown.
+    Served entirely from memory (the shared state table with a separate
+    ingest process); no database access.
+    """
+    try:
+        return get_live_state().get_fleet_status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving fleet status: {str(e)}")
+
 @router.get("/latest-data/{unit_id}")
 async def get_latest_unit_data(unit_id: str, session: AsyncSession = Depends(get_session)):
     """
@@ -61,7 +84,8 @@ async def get_latest_unit_data(unit_id: str, session: AsyncSession = Depends(get
     """
     try:
         # Get cached sensor data
-        sensor_data = mqtt_cache_manager.get_latest_sensor_data(unit_id)
+        live_state = get_live_state()
+        sensor_data = live_state.get_latest_sensor_data(unit_id)
         
         if not sensor_data:
             raise HTTPException(
@@ -79,7 +103,7 @@ async def get_latest_unit_data(unit_id: str, session: AsyncSession = Depends(get
             raise HTTPException(status_code=404, detail=f"Unit {unit_id} not found in database")
         
         # Get cached normal value
-        normal_level = mqtt_cache_manager.get_cached_normal_value(unit_id)
+        normal_level = live_state.get_cached_normal_value(unit_id)
         
         return {
             "unit_id": unit_id,
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.sessions import get_session
 from app.models.unit import Unit
@@ -7,96 +7,104 @@ from app.models.database.user import User
 from sqlalchemy.future import select
 import logging
 from app.services.mqtt_cache_manager import mqtt_cache_manager
+from app.services.cache_events import cache_events
 from app.services.auth_service import get_current_user
+from app.api.http_cache import make_etag, etag_matches, not_modified, REVALIDATE
 
 router = APIRouter(prefix="/api")
 router.tags = ["units"]
 
-@router.get("/units")
-async def list_units(session: AsyncSession = Depends(get_session)):
-    try:
-        # Prefer cached metadata for name/location/levels/is_active
-        cached_meta = mqtt_cache_manager.get_all_unit_metadata()
+def _isoformat(value):
+    return value.isoformat() if value else None
 
-        # Fetch DB rows primarily for timestamps
-        result = await session.execute(
-            select(UnitDB).where(UnitDB.is_active == True)
-        )
-        units = result.scalars().all()
-
-        unit_list = []
-        for unit in units:
-            meta = cached_meta.get(unit.unit_id) if cached_meta else None
-            unit_list.append({
-                "unit_id": unit.unit_id,
-                "name": meta.get("name") if meta else unit.name,
-                "location": meta.get("location") if meta else unit.location,
+
+def _build_units_payload(snapshot):
+    """Build the /api/units body from the metadata snapshot (active units only)"""
+    return {
+        "units": [
+            {
+                "unit_id": unit_id,
+                "name": meta["name"],
+                "location": meta["location"],
                 "alertLevels": {
-                    "normal": meta.get("normal") if meta else unit.normal_level,
-                    "warning": meta.get("warning") if meta else unit.warning_level,
-                    "high": meta.get("high") if meta else unit.high_level,
-                    "critical": meta.get("critical") if meta else unit.critical_level
+                    "normal": meta["normal"],
+                    "warning": meta["warning"],
+                    "high": meta["high"],
+                    "critical": meta["critical"]
                 },
-                "is_active": meta.get("is_active") if meta else unit.is_active,
-                "created_at": unit.created_at.isoformat() if unit.created_at else None,
-                "updated_at": unit.updated_at.isoformat() if unit.updated_at else None
-            })
-        
-        return {"units": unit_list}
+                "is_active": meta["is_active"],
+                "created_at": _isoformat(meta["created_at"]),
+                "updated_at": _isoformat(meta["updated_at"])
+            }
+            for unit_id, meta in snapshot.items()
+            if meta["is_active"]
+        ]
+    }
+
+
+def _build_unit_levels_payload(snapshot):
+    """Build the /api/units/levels body from the metadata snapshot (active units only)"""
+    units_levels = [
+        {
+            "unit_id": unit_id,
+            "name": meta["name"],
+            "location": meta["location"],
+            "levels": {
+                "normal": meta["normal"],
+                "warning": meta["warning"],
+                "high": meta["high"],
+                "critical": meta["critical"]
+            }
+        }
+        for unit_id, meta in snapshot.items()
+        if meta["is_active"]
+    ]
+    return {
+        "total_units": len(units_levels),
+        "units": units_levels
+    }
+
+
+@router.get("/units")
+async def list_units(request: Request):
+    """
+    List all active units.
+    Served from the versioned unit metadata snapshot; the JSON body is only
+    re-serialized after a unit update or normal-value save bumps the version.
+    """
+    try:
+        await mqtt_cache_manager.ensure_unit_metadata_loaded()
+        etag = make_etag("units", mqtt_cache_manager.get_unit_metadata_fingerprint())
+        if etag_matches(request, etag):
+            return not_modified(etag, REVALIDATE)
+        body = mqtt_cache_manager.get_serialized_snapshot("units", _build_units_payload)
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"ETag": etag, "Cache-Control": REVALIDATE}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving units: {str(e)}")
     
 
 @router.get("/units/levels")
-async def get_all_unit_levels(session: AsyncSession = Depends(get_session)):
+async def get_all_unit_levels(request: Request):
     """
     Get alert levels for all active units.
     Returns unit_id, name, location and all alert levels (normal, warning, high, critical).
+    Served from the versioned unit metadata snapshot.
     """
     try:
-        # Try to get units metadata from cache first
-        cached_meta = mqtt_cache_manager.get_all_unit_metadata()
-        units_levels = []
-
-        if cached_meta:
-            # Use cached metadata but ensure we only include active units
-            for unit_id, meta in cached_meta.items():
-                if not meta.get("is_active", True):
-                    continue
-                units_levels.append({
-                    "unit_id": unit_id,
-                    "name": meta.get("name"),
-                    "location": meta.get("location"),
-                    "levels": {
-                        "normal": meta.get("normal"),
-                        "warning": meta.get("warning"),
-                        "high": meta.get("high"),
-                        "critical": meta.get("critical")
-                    }
-                })
-        else:
-            # Fallback to database
-            result = await session.execute(
-                select(UnitDB).where(UnitDB.is_active == True)
-            )
-            units = result.scalars().all()
-            for unit in units:
-                units_levels.append({
-                    "unit_id": unit.unit_id,
-                    "name": unit.name,
-                    "location": unit.location,
-                    "levels": {
-                        "normal": unit.normal_level,
-                        "warning": unit.warning_level,
-                        "high": unit.high_level,
-                        "critical": unit.critical_level
-                    }
-                })
-        
-        return {
-            "total_units": len(units_levels),
-            "units": units_levels
-        }
+        await mqtt_cache_manager.ensure_unit_metadata_loaded()
+        etag = make_etag("unit_levels", mqtt_cache_manager.get_unit_metadata_fingerprint())
+        if etag_matches(request, etag):
+            return not_modified(etag, REVALIDATE)
+        body = mqtt_cache_manager.get_serialized_snapshot("unit_levels", _build_unit_levels_payload)
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"ETag": etag, "Cache-Control": REVALIDATE}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving unit levels: {str(e)}")
 
@@ -170,12 +178,21 @@ async def update_unit_data(
         await session.commit()
 
         # Refresh metadata cache for this unit
+        normal_changed = hasattr(unit.alertLevels, 'normal') and unit.alertLevels.normal is not None
         try:
+            if normal_changed:
+                mqtt_cache_manager.set_cached_normal_value(unit_id, unit.alertLevels.normal)
             await mqtt_cache_manager.refresh_unit_metadata_from_db(unit_id)
         except Exception:
             logger = __import__('logging').getLogger(__name__)
             logger.debug(f"Failed to refresh unit metadata cache for {unit_id} after update")
 
+        # Other worker processes update just this unit
+        if normal_changed:
+            await cache_events.publish(session, "normal_value", unit_id=unit_id, normal_level=unit.alertLevels.normal)
+        else:
+            await cache_events.publish(session, "unit", unit_id=unit_id)
+
         return {"message": "Unit updated successfully"}
     except HTTPException:
         raise
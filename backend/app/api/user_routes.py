@@ -7,11 +7,15 @@ from pydantic import BaseModel, EmailStr, Field
 
 from app.db.sessions import get_session
 from app.models.database.user import User
+from app.services.cache_events import cache_events
 from app.services.auth_service import (
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
     create_access_token,
-    get_current_user
+    get_current_user,
+    get_user_by_username,
+    admin_required,
+    user_cache
 )
 
 router = APIRouter(prefix="/api/users", tags=["users"])
@@ -73,7 +77,7 @@ async def login(
     user = result.scalar_one_or_none()
     
     # Verify user exists and password is correct
-    if not user or not verify_password(user_data.password, user.password_hash):
+    if not user or not await verify_password_async(user_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -137,6 +141,46 @@ async def get_user_role(
     }
 
 
+@router.patch("/{username}", response_model=UserResponse)
+async def update_user(
+    username: str,
+    user_update: UserUpdate,
+    current_user: User = Depends(admin_required),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Update a user's email, role or active flag (admin only).
+    
+    Deactivation and role changes take effect on the user's next request.
+    """
+    user = await get_user_by_username(session, username)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    # An admin cannot lock themselves out
+    if user.username == current_user.username and (user_update.is_active is False or user_update.is_admin is False):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You cannot deactivate or demote your own account"
+        )
+    
+    for field, value in user_update.model_dump(exclude_unset=True).items():
+        if value is not None:
+            setattr(user, field, value)
+    
+    # The cached entry may be this very instance, so drop it even if the commit fails
+    try:
+        await session.commit()
+    finally:
+        user_cache.invalidate(username)
+    await cache_events.publish(session, "user", username=username)
+    
+    return user
+
+
 @router.post("/change-password", status_code=status.HTTP_200_OK)
 async def change_password(
     password_data: PasswordChange,
@@ -148,17 +192,29 @@ async def change_password(
     
     Requires authentication and correct old password.
     """
+    # current_user may come from the user cache; change the row loaded in this session
+    user = await get_user_by_username(session, current_user.username)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
     # Verify old password
-    if not verify_password(password_data.old_password, current_user.password_hash):
+    if not await verify_password_async(password_data.old_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect old password"
         )
     
     # Update password
-    current_user.password_hash = get_password_hash(password_data.new_password)
+    user.password_hash = await get_password_hash_async(password_data.new_password)
     
-    await session.commit()
+    try:
+        await session.commit()
+    finally:
+        user_cache.invalidate(user.username)
+    await cache_events.publish(session, "user", username=user.username)
     
     return {"message": "Password changed successfully"}
 
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -15,11 +15,69 @@ class Settings:
     MQTT_BROKER_PORT: int = int(os.getenv("MQTT_BROKER_PORT"))
     MQTT_CLIENT_ID: str = os.getenv("MQTT_CLIENT_ID")
     MQTT_TOPICS: List[str] = os.getenv("MQTT_TOPICS").split(",")
+    # Topic filters (wildcards allowed) carrying sensor readings, routed to the distance handler
+    MQTT_SENSOR_TOPICS: List[str] = os.getenv("MQTT_SENSOR_TOPICS", "lora/water_lavel").split(",")
+
+    # Multi-worker ingest: none (one worker), hash (crc32(unit_id) shards) or shared
+    # ($share subscriptions, readings forwarded to the worker owning the unit's hash shard)
+    INGEST_SHARDING: str = os.getenv("INGEST_SHARDING", "none")
+    INGEST_SHARE_GROUP: str = os.getenv("INGEST_SHARE_GROUP", "river-ingest")
+    INGEST_WORKER_COUNT: int = int(os.getenv("INGEST_WORKER_COUNT", "1"))
+    # Fixed shard of this worker in hash and shared modes; left unset, workers claim one through PostgreSQL
+    INGEST_WORKER_INDEX: Optional[int] = int(os.getenv("INGEST_WORKER_INDEX")) if os.getenv("INGEST_WORKER_INDEX") else None
+    # Workers forward processed readings to each other on <topic>/<worker id>
+    INGEST_FANOUT_TOPIC: str = os.getenv("INGEST_FANOUT_TOPIC", "river/fanout")
+
+    # inline: API workers ingest MQTT themselves; process: ingest runs alone (python -m app.ingest)
+    # and API workers read live unit state from the shared memory table it writes
+    INGEST_MODE: str = os.getenv("INGEST_MODE", "inline")
+    SHARED_STATE_NAME: str = os.getenv("SHARED_STATE_NAME", "river_state")
+    SHARED_STATE_CAPACITY: int = int(os.getenv("SHARED_STATE_CAPACITY", "4096"))
+    # Readers ignore the table when the ingest process has not sent a heartbeat for this long
+    SHARED_STATE_STALE_SECONDS: float = float(os.getenv("SHARED_STATE_STALE_SECONDS", "5"))
+
+    # Cache change events between processes: postgres (LISTEN/NOTIFY), local (in-process) or auto
+    CACHE_EVENTS_BACKEND: str = os.getenv("CACHE_EVENTS_BACKEND", "auto")
+    CACHE_EVENTS_CHANNEL: str = os.getenv("CACHE_EVENTS_CHANNEL", "river_cache")
+
+    # Stale sensor detection
+    SENSOR_REPORT_INTERVAL_SECONDS: float = float(os.getenv("SENSOR_REPORT_INTERVAL_SECONDS", "10"))
+    # Upper bound on the report interval learned per unit
+    SENSOR_MAX_REPORT_INTERVAL_SECONDS: float = float(os.getenv("SENSOR_MAX_REPORT_INTERVAL_SECONDS", "3600"))
+    STALE_AFTER_MISSED_REPORTS: int = int(os.getenv("STALE_AFTER_MISSED_REPORTS", "3"))
+    STALE_CHECK_TICK_SECONDS: float = float(os.getenv("STALE_CHECK_TICK_SECONDS", "1"))
     
+    # Partitioning of sensor_measurements (PostgreSQL): months to create ahead of time
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+    # Raw measurement retention: days of raw rows to keep once rolled up (0 keeps everything)
+    RAW_RETENTION_DAYS: int = int(os.getenv("RAW_RETENTION_DAYS", "0"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+
+    # Memory budget of the per-unit, per-month daily averages block cache
+    AVERAGES_CACHE_MAX_BYTES: int = int(os.getenv("AVERAGES_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
     # JWT Authentication Settings
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     ALGORITHM: str = os.getenv("ALGORITHM")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
     ALLOWED_ORIGINS: List[str] = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 
+    # Authenticated users are cached per process for this long (seconds)
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+
+    # bcrypt worker threads, and how many more password checks may wait for one
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+    # Log the stack of anything blocking the event loop longer than this (0 disables)
+    LOOP_BLOCK_THRESHOLD_MS: float = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+    # Longest run the admin sampling profiler accepts
+    PROFILER_MAX_SECONDS: float = float(os.getenv("PROFILER_MAX_SECONDS", "300"))
+
+    # MQTT traffic captures (started from the admin API) and their size limit
+    TRAFFIC_CAPTURE_DIR: str = os.getenv("TRAFFIC_CAPTURE_DIR", "captures")
+    TRAFFIC_CAPTURE_MAX_BYTES: int = int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(512 * 1024 * 1024)))
+
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges, histograms and per-second meters are registered once at
+import time and rendered by GET /metrics. Updates are cheap (a dict lookup
+under a lock), so they can sit on the ingest hot path.
+"""
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from 100 microseconds to 10 seconds
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Exposition lines for every label set, without the HELP and TYPE header"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        """Sum over all label values"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; either set directly or read from a callback at render time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, callback: Callable[[], float]):
+        self._callback = callback
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self._callback())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Structure: {label_values: [bucket counts..., sum, count]}
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self._buckets) + 2)
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[-1]) if state else 0
+
+    def get_sum(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-2] if state else 0.0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for i, bound in enumerate(self._buckets):
+                cumulative += state[i]
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {int(state[-1])}")
+        return lines
+
+
+class Meter(_Metric):
+    """
+    Events per second, as a one-minute exponentially weighted moving average
+    (exported as a gauge). Use a Counter alongside it for rate() in Prometheus.
+    """
+    kind = "gauge"
+    TICK_SECONDS = 5.0
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._alpha = 1 - math.exp(-self.TICK_SECONDS / 60.0)
+        # Structure: {label_values: [uncounted events, rate, last tick time]}
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def _tick(self, state: List[float], now: float):
+        ticks = int((now - state[2]) / self.TICK_SECONDS)
+        if ticks <= 0:
+            return
+        # Fold the pending events into the first elapsed tick; later ones were idle
+        state[1] += self._alpha * (state[0] / self.TICK_SECONDS - state[1])
+        state[1] *= (1 - self._alpha) ** (ticks - 1)
+        state[0] = 0
+        state[2] += ticks * self.TICK_SECONDS
+
+    def mark(self, count: int = 1, **labels):
+        key = self._key(labels)
+        now = time.monotonic()
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0, 0.0, now]
+            self._tick(state, now)
+            state[0] += count
+
+    def get_rate(self, **labels) -> float:
+        now = time.monotonic()
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return 0.0
+            self._tick(state, now)
+            return state[1]
+
+    def _samples(self) -> List[str]:
+        now = time.monotonic()
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                self._tick(state, now)
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(state[1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = (),
+          callback: Optional[Callable[[], float]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, labelnames, callback))
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+def meter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Meter:
+    return REGISTRY.register(Meter(name, help_text, labelnames))
+
+
+# Ingest pipeline
+MQTT_MESSAGES = counter("mqtt_messages_total", "MQTT messages received, by the topic filter of the route handling them", ["route"])
+MQTT_MESSAGE_RATE = meter("mqtt_messages_per_second", "MQTT messages per second by route (1 minute moving average)", ["route"])
+MQTT_MESSAGE_ERRORS = counter("mqtt_message_errors_total", "MQTT messages that failed to process", ["reason"])
+INGEST_NOT_OWNED = counter("ingest_not_owned_total", "Readings skipped because another worker's shard owns the unit")
+INGEST_FANOUT_MESSAGES = counter("ingest_fanout_messages_total", "Readings exchanged with other workers (processed: sent/received; raw, to the owning shard: forwarded_out/forwarded_in)", ["direction"])
+INGEST_STAGE_SECONDS = histogram("ingest_stage_seconds", "Time spent in each stage of handling a distance reading", ["stage"])
+
+# Caches
+CACHE_LOOKUPS = counter("cache_lookups_total", "In-process cache lookups", ["cache", "result"])
+
+# WebSockets
+WEBSOCKET_SEND_SECONDS = histogram("websocket_send_seconds", "Time to send one message to one WebSocket client")
+WEBSOCKET_SEND_ERRORS = counter("websocket_send_errors_total", "Failed WebSocket sends (client dropped)")
+
+# Event loop
+EVENT_LOOP_LAG_SECONDS = histogram("event_loop_lag_seconds", "How late the event loop heartbeat woke up")
+EVENT_LOOP_BLOCKS = counter("event_loop_blocks_total", "Times the event loop was blocked longer than the threshold")
+
+# Database
+DB_POOL_CHECKOUT_SECONDS = histogram("db_pool_checkout_seconds", "Time waiting to check a connection out of the pool")
+DB_POOL_CHECKED_OUT = gauge("db_pool_checked_out_connections", "Connections currently checked out of the pool")
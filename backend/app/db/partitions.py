@@ -0,0 +1,236 @@
+"""
+Monthly range partitioning of sensor_measurements on recorded_at (PostgreSQL).
+
+- convert_to_partitioned(): one-off migration of an existing heap table
+- ensure_partitions(): create the current and upcoming month partitions (run at
+  startup and daily by the scheduler)
+- detach_partition(): remove a whole month instantly instead of a large DELETE,
+  once its hourly and daily rollups account for every row
+
+Usage:
+    python -m app.db.partitions convert
+    python -m app.db.partitions ensure
+    python -m app.db.partitions detach 2024-01 [--drop]
+"""
+import asyncio
+import logging
+import re
+import sys
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from app.core.config import settings
+from app.db.sessions import AsyncSessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "sensor_measurements"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+# Range bound as printed by pg_get_expr(relpartbound): FOR VALUES FROM ('...') TO ('...')
+_RANGE_BOUND = re.compile(r"FROM \('([^']*)'\) TO \('([^']*)'\)")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(day: date) -> date:
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+async def is_partitioned(conn) -> bool:
+    result = await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table)"
+    ), {"table": PARENT_TABLE})
+    return bool(result.scalar())
+
+
+async def _create_month_partition(conn, month: date):
+    """
+    Create a month's partition. Postgres refuses to add a partition while the
+    DEFAULT partition holds rows in its range, so rows that landed there first
+    (the month was not created ahead of time) are moved into the new table,
+    which is then attached.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), next_month(month).isoformat()
+    if (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar():
+        return
+
+    in_month = f"recorded_at >= '{start}' AND recorded_at < '{end}'"
+    stranded = (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": DEFAULT_PARTITION})).scalar() \
+        and (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month})"))).scalar()
+    if not stranded:
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        return
+
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)"))
+    moved = (await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_month} RETURNING *), "
+        f"inserted AS (INSERT INTO {name} SELECT * FROM moved RETURNING 1) SELECT count(*) FROM inserted"
+    ))).scalar()
+    # A CHECK matching the bounds lets ATTACH skip scanning the new table
+    await conn.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK ({in_month})"))
+    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    await conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+    logger.warning(f"Moved {moved} rows out of {DEFAULT_PARTITION} into the new partition {name}")
+
+
+async def ensure_partitions(months_ahead: Optional[int] = None) -> List[str]:
+    """Create partitions for the current month and the next months_ahead months"""
+    if not _is_postgres():
+        return []
+    if months_ahead is None:
+        months_ahead = settings.PARTITION_MONTHS_AHEAD
+
+    created = []
+    async with engine.begin() as conn:
+        if not await is_partitioned(conn):
+            logger.info(f"{PARENT_TABLE} is not partitioned; run 'python -m app.db.partitions convert' to migrate")
+            return []
+        month = month_start(date.today())
+        for _ in range(months_ahead + 1):
+            await _create_month_partition(conn, month)
+            created.append(partition_name(month))
+            month = next_month(month)
+    logger.info(f"Partitions present: {', '.join(created)}")
+    return created
+
+
+async def get_month_partitions(conn) -> List[Tuple[str, datetime, datetime]]:
+    """(name, start, end) of every range partition of sensor_measurements, oldest first; DEFAULT is left out"""
+    result = await conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table"
+    ), {"table": PARENT_TABLE})
+    partitions = []
+    for name, bound in result.all():
+        match = _RANGE_BOUND.search(bound or "")
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def detach_partition_by_name(conn, name: str, drop: bool = False):
+    """Detach (and optionally drop) a partition; the caller checks the rollups and commits"""
+    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    if drop:
+        await conn.execute(text(f"DROP TABLE {name}"))
+    logger.info(f"{'Dropped' if drop else 'Detached'} partition {name}")
+
+
+async def detach_partition(month: date, drop: bool = False):
+    """
+    Detach (and optionally drop) the partition holding the given month.
+    Raises RuntimeError, leaving it attached, unless the hourly and daily
+    rollups account for every row in it (the retention check).
+    """
+    # Imported here: the retention service builds on this module
+    from app.services.retention_service import RetentionService
+
+    name = partition_name(month_start(month))
+    async with AsyncSessionLocal() as session:
+        if not await RetentionService(session).remove_partition(name, drop=drop):
+            raise RuntimeError(f"Rollups for {name} are not confirmed; run the daily and hourly averages first")
+
+
+async def convert_to_partitioned():
+    """
+    Migrate an existing (unpartitioned) sensor_measurements table to monthly
+    range partitions, in a single transaction. The primary key becomes
+    (id, recorded_at) because it must include the partition key; ids and their
+    sequence are preserved.
+    """
+    old_table = f"{PARENT_TABLE}_unpartitioned"
+    async with engine.begin() as conn:
+        if await is_partitioned(conn):
+            logger.info(f"{PARENT_TABLE} is already partitioned")
+            return
+
+        sequence = (await conn.execute(
+            text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": PARENT_TABLE}
+        )).scalar()
+
+        await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {old_table}"))
+        # Keep the id sequence alive when the old table is dropped
+        await conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+
+        await conn.execute(text(f"""
+            CREATE TABLE {PARENT_TABLE} (
+                id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                unit_id VARCHAR(50) NOT NULL REFERENCES units (unit_id),
+                height DOUBLE PRECISION NOT NULL,
+                temperature DOUBLE PRECISION,
+                battery DOUBLE PRECISION,
+                rssi DOUBLE PRECISION,
+                snr DOUBLE PRECISION,
+                recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                PRIMARY KEY (id, recorded_at)
+            ) PARTITION BY RANGE (recorded_at)
+        """))
+        # Catches rows outside the pre-created months so inserts never fail
+        await conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+
+        first = (await conn.execute(text(f"SELECT min(recorded_at) FROM {old_table}"))).scalar()
+        month = month_start(first.date() if first else date.today())
+        last = month_start(date.today())
+        for _ in range(settings.PARTITION_MONTHS_AHEAD):
+            last = next_month(last)
+        while month <= last:
+            await _create_month_partition(conn, month)
+            month = next_month(month)
+
+        await conn.execute(text(
+            f"INSERT INTO {PARENT_TABLE} (id, unit_id, height, temperature, battery, rssi, snr, recorded_at) "
+            f"SELECT id, unit_id, height, temperature, battery, rssi, snr, COALESCE(recorded_at, now()) FROM {old_table}"
+        ))
+        await conn.execute(text(f"DROP TABLE {old_table}"))
+        await conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT_TABLE}.id"))
+
+        # Partitioned indexes (created on every partition automatically)
+        await conn.execute(text(f"CREATE INDEX ix_{PARENT_TABLE}_unit_id_recorded_at ON {PARENT_TABLE} (unit_id, recorded_at)"))
+        await conn.execute(text(f"CREATE INDEX ix_{PARENT_TABLE}_recorded_at ON {PARENT_TABLE} (recorded_at)"))
+        await conn.execute(text(f"CREATE INDEX ix_{PARENT_TABLE}_unit_id ON {PARENT_TABLE} (unit_id)"))
+        await conn.execute(text(f"CREATE INDEX ix_{PARENT_TABLE}_id ON {PARENT_TABLE} (id)"))
+
+    logger.info(f"Converted {PARENT_TABLE} to monthly range partitions")
+
+
+async def _main(argv: List[str]):
+    if not _is_postgres():
+        print("Partitioning requires PostgreSQL")
+        return
+    try:
+        command = argv[0] if argv else "ensure"
+        if command == "convert":
+            await convert_to_partitioned()
+            await ensure_partitions()
+        elif command == "ensure":
+            await ensure_partitions()
+        elif command == "detach" and len(argv) >= 2:
+            try:
+                await detach_partition(datetime.strptime(argv[1], "%Y-%m").date(), drop="--drop" in argv)
+            except (RuntimeError, ValueError) as e:
+                print(e)
+        else:
+            print(__doc__)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1:]))
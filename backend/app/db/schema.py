@@ -0,0 +1,97 @@
+import logging
+from sqlalchemy import Index, inspect, text
+from app.db.sessions import engine
+from app.db.partitions import PARENT_TABLE, is_partitioned
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.models.database.hourly_averages import HourlyAverageDB
+from app.models.database.daily_averages import DailyAverageDB
+from app.models.database.period_averages import PeriodAverageDB
+from app.models.database.cache_versions import CacheVersionDB
+
+logger = logging.getLogger(__name__)
+
+
+def _model_index(table, name: str) -> Index:
+    return next(index for index in table.indexes if index.name == name)
+
+
+# Tables added after the original schema; existing databases get them at startup
+ADDED_TABLES = [
+    HourlyAverageDB.__table__,
+    PeriodAverageDB.__table__,
+    CacheVersionDB.__table__,
+]
+
+# Columns added to existing tables after they were first created
+ADDED_COLUMNS = [
+    table.c[name]
+    for table in (DailyAverageDB.__table__, PeriodAverageDB.__table__)
+    for name in ("p10_height", "p50_height", "p90_height", "height_sketch")
+]
+
+# Indexes added after the tables were first created; existing databases get them at startup
+ADDED_INDEXES = [
+    _model_index(SensorMeasurementDB.__table__, "ix_sensor_measurements_unit_id_recorded_at"),
+    _model_index(DailyAverageDB.__table__, "uq_daily_averages_unit_id_date"),
+]
+
+
+async def _drop_duplicate_rows(conn, index: Index):
+    """Keep only the newest row per key of a unique index that does not exist yet"""
+    table = index.table.name
+    columns = ", ".join(column.name for column in index.columns)
+    result = await conn.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY {columns})"
+    ))
+    if result.rowcount:
+        logger.warning(f"Removed {result.rowcount} duplicate {table} rows before creating {index.name}")
+
+
+async def ensure_indexes():
+    """Create any missing indexes declared on the models (CONCURRENTLY on Postgres, so ingest is not blocked)"""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Postgres rejects CONCURRENTLY on a partitioned table; convert_to_partitioned() creates its indexes
+        partitioned = engine.dialect.name == "postgresql" and await is_partitioned(conn)
+        existing = await conn.run_sync(lambda sync_conn: {
+            table: {index["name"] for index in inspect(sync_conn).get_indexes(table)}
+            for table in {index.table.name for index in ADDED_INDEXES}
+        })
+        for index in ADDED_INDEXES:
+            if partitioned and index.table.name == PARENT_TABLE:
+                logger.info(f"Index {index.name} is managed by the partitioned {PARENT_TABLE} table")
+                continue
+            if index.unique and index.name not in existing[index.table.name]:
+                await _drop_duplicate_rows(conn, index)
+            if engine.dialect.name == "postgresql":
+                columns = ", ".join(column.name for column in index.columns)
+                unique = "UNIQUE " if index.unique else ""
+                await conn.execute(text(
+                    f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {index.table.name} ({columns})"
+                ))
+            else:
+                await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+            logger.info(f"Index {index.name} is present")
+
+
+async def ensure_tables():
+    """Create any missing tables added since the original schema"""
+    async with engine.begin() as conn:
+        for table in ADDED_TABLES:
+            await conn.run_sync(lambda sync_conn: table.create(sync_conn, checkfirst=True))
+            logger.info(f"Table {table.name} is present")
+
+
+async def ensure_columns():
+    """Add any missing columns declared on the models (nullable, so existing rows stay valid)"""
+    async with engine.begin() as conn:
+        existing = await conn.run_sync(lambda sync_conn: {
+            table: {column["name"] for column in inspect(sync_conn).get_columns(table)}
+            for table in {column.table.name for column in ADDED_COLUMNS}
+        })
+        for column in ADDED_COLUMNS:
+            if column.name in existing[column.table.name]:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            await conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column_type}"))
+            logger.info(f"Added column {column.table.name}.{column.name}")
@@ -1,13 +1,29 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+import time
 from dotenv import load_dotenv
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_CHECKED_OUT
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """Default async pool, recording how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
+engine = create_async_engine(DATABASE_URL, echo=False, poolclass=TimedAsyncAdaptedQueuePool)
+DB_POOL_CHECKED_OUT.set_function(lambda: engine.sync_engine.pool.checkedout())
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
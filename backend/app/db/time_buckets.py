@@ -0,0 +1,46 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Tuple
+from sqlalchemy import Integer, cast, func, literal_column
+from app.db.sessions import engine
+
+
+def time_bucket(column, seconds: int, offset: int = 0):
+    """
+    Start of the fixed-size time bucket containing a timestamp column, computed in the database.
+    Buckets start offset seconds after multiples of their size since the epoch.
+    """
+    # Inline the (validated) bucket size so a GROUP BY on this expression matches the selected one exactly
+    seconds = literal_column(str(int(seconds)))
+    offset = literal_column(str(int(offset)))
+    if engine.dialect.name == "sqlite":
+        return func.datetime(
+            ((cast(func.strftime("%s", column), Integer) - offset) // seconds) * seconds + offset,
+            "unixepoch"
+        )
+    return func.to_timestamp(
+        func.floor((func.extract("epoch", column) - offset) / seconds) * seconds + offset
+    )
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """
+    [start, end) of a calendar day in the server's timezone, as aware UTC datetimes.
+    Daily averages, hourly rollups and retention all window days with this, so
+    their measurement counts cover the same rows.
+    """
+    start = datetime.combine(day, time.min).astimezone(timezone.utc)
+    end = datetime.combine(day + timedelta(days=1), time.min).astimezone(timezone.utc)
+    return start, end
+
+
+def local_date(value: datetime) -> date:
+    """Calendar day (server timezone) of an aware timestamp"""
+    return value.astimezone().date()
+
+
+def hour_offset() -> int:
+    """
+    Seconds from UTC hour boundaries to local ones (1800 at UTC+05:30).
+    Hourly buckets start there so that whole hours tile a local day.
+    """
+    return int(datetime.now().astimezone().utcoffset().total_seconds()) % 3600
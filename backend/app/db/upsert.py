@@ -0,0 +1,24 @@
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def upsert(session: AsyncSession, model, rows, conflict_columns, update_columns):
+    """INSERT ... ON CONFLICT DO UPDATE for the session's backend (PostgreSQL or SQLite)"""
+    insert = postgresql_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(model).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=conflict_columns,
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
+
+
+def increment(session: AsyncSession, model, key_column: str, key, counter_column: str):
+    """Add 1 to a counter row, creating it at 1; RETURNING the new value"""
+    insert = postgresql_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    counter = model.__table__.c[counter_column]
+    statement = insert(model).values({key_column: key, counter_column: 1})
+    return statement.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={counter_column: counter + 1}
+    ).returning(counter)
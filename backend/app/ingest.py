@@ -0,0 +1,96 @@
+"""
+Dedicated MQTT ingest process, for INGEST_MODE=process.
+
+Runs the ingest pipeline (parse, classify, persist, stale detection) on its
+own event loop and publishes every unit's latest reading, status and normal
+value into the shared memory table the API workers read. Readings and
+alerts for WebSocket clients go to the API workers over the fan-out topic.
+
+Run from backend/ next to the API (one ingest process per host):
+
+    INGEST_MODE=process python -m app.ingest
+    INGEST_MODE=process uvicorn app.main:app --workers 4
+"""
+import asyncio
+import logging
+import signal
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.db.sessions import engine
+from app.services.cache_events import cache_events
+from app.services.ingest_sharding import ingest_sharding
+from app.services.mqtt_cache_manager import mqtt_cache_manager
+from app.services.mqtt_service import mqtt_service
+from app.services.profiling_service import loop_block_monitor
+from app.services.shared_state import shared_state
+from app.services.stale_sensor_monitor import stale_sensor_monitor
+
+logger = logging.getLogger("app.ingest")
+
+# Seconds between shared state heartbeats
+HEARTBEAT_INTERVAL = 1.0
+
+
+class FanoutBroadcaster:
+    """Stands in for the WebSocket service: this process has no clients, the API workers do"""
+
+    async def broadcast_distance_data(self, data: Dict[str, Any]):
+        # Already on the fan-out topic together with the reading
+        pass
+
+    async def broadcast_alert_data(self, data: Dict[str, Any]):
+        mqtt_service.publish_fanout({"alert": data})
+
+
+async def run():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    loop_block_monitor.start()
+    shared_state.open_writer()
+    mqtt_cache_manager.attach_shared_state(shared_state)
+    # Alert levels and normal values edited through the API reach this process as cache events
+    try:
+        await cache_events.start()
+    except Exception as e:
+        logger.error(f"✗ Failed to start cache events: {e}")
+    if not await mqtt_cache_manager.load_all_unit_metadata_from_db():
+        logger.error("✗ Failed to load unit metadata snapshot")
+
+    await ingest_sharding.start()
+    broadcaster = FanoutBroadcaster()
+    mqtt_service.enable_ingest()
+    mqtt_service.set_websocket_service(broadcaster)
+    # Connect in the background: retries back off for minutes and must not hold up shutdown
+    connect_task = asyncio.create_task(mqtt_service.connect())
+    stale_sensor_monitor.set_websocket_service(broadcaster)
+    stale_sensor_monitor.start()
+    logger.info(f"✓ Ingest process running, publishing to shared state {shared_state.name}")
+
+    try:
+        while not stop.is_set():
+            shared_state.heartbeat()
+            try:
+                await asyncio.wait_for(stop.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        logger.info("Ingest process shutting down...")
+        connect_task.cancel()
+        await stale_sensor_monitor.stop()
+        await mqtt_service.disconnect()
+        await ingest_sharding.stop()
+        await cache_events.stop()
+        shared_state.close()
+        await loop_block_monitor.stop()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if settings.INGEST_MODE != "process":
+        logger.warning("INGEST_MODE is not 'process': the API workers will ingest MQTT traffic as well")
+    asyncio.run(run())
@@ -12,16 +12,30 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.services.mqtt_service import mqtt_service
+from app.services.mqtt_cache_manager import mqtt_cache_manager
 from app.services.websocket_service import websocket_service
+from app.services.stale_sensor_monitor import stale_sensor_monitor
+from app.services.auth_service import password_hasher
+from app.services.profiling_service import sampling_profiler, loop_block_monitor
+from app.services.traffic_recorder import traffic_recorder
+from app.services.ingest_sharding import ingest_sharding
+from app.services.cache_events import cache_events
+from app.services.daily_averages_service import load_daily_average_versions
 from app.api.routes import router
 from app.api.unit_routes import router as unit_router
 from app.api.average_routes import router as average_router
 from app.api.auth_routes import router as auth_router
 from app.api.user_routes import router as user_router
+from app.api.measurement_routes import router as measurement_router
+from app.api.export_routes import router as export_router
+from app.api.metrics_routes import router as metrics_router
+from app.api.admin_routes import router as admin_router
 from app.db.sessions import engine
+from app.db.schema import ensure_indexes, ensure_tables, ensure_columns
+from app.db.partitions import ensure_partitions
 
 from .models.database.user import User
-from app.startup.calculate_averages import calculate_missing_averages_on_startup
+from app.startup.calculate_averages import calculate_missing_averages_on_startup, calculate_closed_hourly_averages
 from app.tasks.daily_midnight_task import daily_scheduler
 
 # Add these imports for debug endpoint
@@ -39,6 +53,9 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Smart River Water Level Monitoring System...")
 
+    # Watch for callbacks that block the event loop, including during startup work
+    loop_block_monitor.start()
+
     # Test database connection at startup
     try:
         async with engine.begin() as conn:
@@ -47,6 +64,52 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"✗ Database connection failed: {e}")
 
+    # Create tables and indexes that existing databases may be missing
+    try:
+        await ensure_tables()
+        await ensure_columns()
+        logger.info("✓ Database tables verified")
+    except Exception as e:
+        logger.error(f"✗ Failed to verify database tables: {e}")
+
+    try:
+        await ensure_indexes()
+        logger.info("✓ Database indexes verified")
+    except Exception as e:
+        logger.error(f"✗ Failed to verify database indexes: {e}")
+
+    # Create upcoming sensor_measurements partitions (no-op if the table is not partitioned)
+    try:
+        await ensure_partitions()
+    except Exception as e:
+        logger.error(f"✗ Failed to create measurement partitions: {e}")
+
+    # Follow cache changes made by the other worker processes
+    try:
+        await cache_events.start()
+        logger.info("✓ Cache events started")
+    except Exception as e:
+        logger.error(f"✗ Failed to start cache events: {e}")
+
+    # Daily average change counters, shared by every worker through the database (ETags)
+    try:
+        await load_daily_average_versions()
+        logger.info("✓ Daily average versions loaded")
+    except Exception as e:
+        logger.error(f"✗ Failed to load daily average versions: {e}")
+
+    # Load the unit metadata snapshot served by /api/units
+    if await mqtt_cache_manager.load_all_unit_metadata_from_db():
+        logger.info("✓ Unit metadata snapshot loaded")
+    else:
+        logger.error("✗ Failed to load unit metadata snapshot")
+
+    # Claim this worker's ingest shard before subscribing
+    try:
+        await ingest_sharding.start()
+    except Exception as e:
+        logger.error(f"✗ Failed to claim an ingest shard: {e}")
+
     try:
         # Connect the services to avoid circular import
         mqtt_service.set_websocket_service(websocket_service)
@@ -56,29 +119,63 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"✗ Failed to start MQTT service: {e}")
 
-    # Start daily scheduler
-    try:
-        daily_scheduler.start()
-        logger.info("✓ Daily scheduler started")
-    except Exception as e:
-        logger.error(f"✗ Failed to start daily scheduler: {e}")
+    # Start stale sensor detection (the ingest process does it with INGEST_MODE=process)
+    if settings.INGEST_MODE != "process":
+        try:
+            stale_sensor_monitor.set_websocket_service(websocket_service)
+            stale_sensor_monitor.start()
+            logger.info("✓ Stale sensor monitor started")
+        except Exception as e:
+            logger.error(f"✗ Failed to start stale sensor monitor: {e}")
 
-    # Calculate missing daily averages on startup
+    # One worker runs the scheduler and the rollup catch-up; the others would only duplicate it
     try:
-        logger.info("Calculating missing daily averages...")
-        await calculate_missing_averages_on_startup()
-        logger.info("✓ Daily averages calculation completed")
+        scheduler_owner = await daily_scheduler.claim()
     except Exception as e:
-        logger.error(f"✗ Error calculating daily averages: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        scheduler_owner = False
+        logger.error(f"✗ Failed to claim the daily scheduler: {e}")
+
+    if scheduler_owner:
+        # Start daily scheduler
+        try:
+            daily_scheduler.start()
+            logger.info("✓ Daily scheduler started")
+        except Exception as e:
+            logger.error(f"✗ Failed to start daily scheduler: {e}")
+
+        # Calculate missing daily averages on startup
+        try:
+            logger.info("Calculating missing daily averages...")
+            await calculate_missing_averages_on_startup()
+            logger.info("✓ Daily averages calculation completed")
+        except Exception as e:
+            logger.error(f"✗ Error calculating daily averages: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+
+        # Catch up on hourly averages for hours that closed while the app was down
+        try:
+            await calculate_closed_hourly_averages()
+            logger.info("✓ Hourly averages caught up")
+        except Exception as e:
+            logger.error(f"✗ Error calculating hourly averages: {e}")
+    else:
+        logger.info("Daily scheduler runs in another worker; skipping scheduled jobs here")
 
     yield
 
     # Shutdown
     logger.info(" Shutting down...")
     daily_scheduler.stop()
+    await daily_scheduler.release()
+    await stale_sensor_monitor.stop()
     await mqtt_service.disconnect()
+    await ingest_sharding.stop()
+    await cache_events.stop()
+    traffic_recorder.stop()
+    password_hasher.shutdown()
+    await sampling_profiler.stop()
+    await loop_block_monitor.stop()
     logger.info("✓ Shutdown completed")
 
 # Create FastAPI application
@@ -118,12 +215,27 @@ app.include_router(unit_router)
 app.include_router(average_router)
 app.include_router(auth_router)
 app.include_router(user_router)
+app.include_router(measurement_router)
+app.include_router(export_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 
 @app.websocket("/ws/distance")
 async def websocket_distance(websocket: WebSocket):
     logger.info("WebSocket connection for distance data")
     """WebSocket for distance data only"""
     await websocket_service.connect(websocket, "distance")
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        websocket_service.disconnect(websocket)
+
+@app.websocket("/ws/alerts")
+async def websocket_alerts(websocket: WebSocket):
+    """WebSocket for alert events only"""
+    logger.info("WebSocket connection for alerts")
+    await websocket_service.connect(websocket, "alerts")
     try:
         while True:
             await websocket.receive_text()
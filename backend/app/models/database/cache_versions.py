@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, BigInteger
+from app.db.sessions import Base
+
+class CacheVersionDB(Base):
+    """Change counters shared by every process (e.g. "daily_average:<unit_id>"), used as ETag markers"""
+    __tablename__ = "cache_versions"
+
+    key = Column(String(100), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CacheVersion(key={self.key}, version={self.version})>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from app.db.sessions import Base
 
@@ -19,6 +19,12 @@ class DailyAverageDB(Base):
     # Min/Max values for height
     min_height = Column(Float)
     max_height = Column(Float)
+
+    # Height percentiles and the mergeable sketch they were read from (see QuantileSketch)
+    p10_height = Column(Float)
+    p50_height = Column(Float)
+    p90_height = Column(Float)
+    height_sketch = Column(LargeBinary)
     
     # Metadata
     measurement_count = Column(Integer)
@@ -26,5 +32,11 @@ class DailyAverageDB(Base):
     # Relationships
     unit = relationship("UnitDB", backref="daily_averages")
 
+    __table_args__ = (
+        # One row per unit and day; also the conflict target for the upsert.
+        # A unique index rather than a constraint, so ensure_indexes() can add it to existing databases
+        Index("uq_daily_averages_unit_id_date", "unit_id", "date", unique=True),
+    )
+
     def __repr__(self):
         return f"<DailyAverage(unit_id={self.unit_id}, date={self.date}, avg_height={self.avg_height})>"
\ No newline at end of file
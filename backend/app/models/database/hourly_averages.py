@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.db.sessions import Base
+
+class HourlyAverageDB(Base):
+    __tablename__ = "hourly_averages"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    unit_id = Column(String(50), ForeignKey("units.unit_id"), nullable=False, index=True)
+    hour_start = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    # Average values
+    avg_height = Column(Float)
+    avg_temperature = Column(Float)
+    avg_battery = Column(Float)
+    avg_rssi = Column(Float)
+    avg_snr = Column(Float)
+
+    # Min/Max values for height
+    min_height = Column(Float)
+    max_height = Column(Float)
+
+    # Metadata
+    measurement_count = Column(Integer)
+
+    # Relationships
+    unit = relationship("UnitDB", backref="hourly_averages")
+
+    __table_args__ = (
+        # One row per unit and hour; also the conflict target for the upsert
+        UniqueConstraint("unit_id", "hour_start", name="uq_hourly_averages_unit_id_hour_start"),
+    )
+
+    def __repr__(self):
+        return f"<HourlyAverage(unit_id={self.unit_id}, hour_start={self.hour_start}, avg_height={self.avg_height})>"
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, LargeBinary, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.db.sessions import Base
+
+class PeriodAverageDB(Base):
+    """Weekly, monthly and yearly rollups derived from daily_averages"""
+    __tablename__ = "period_averages"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    unit_id = Column(String(50), ForeignKey("units.unit_id"), nullable=False, index=True)
+    period = Column(String(10), nullable=False)  # week, month or year
+    period_start = Column(Date, nullable=False)
+
+    # Average values (weighted by each day's measurement_count)
+    avg_height = Column(Float)
+    avg_temperature = Column(Float)
+    avg_battery = Column(Float)
+    avg_rssi = Column(Float)
+    avg_snr = Column(Float)
+
+    # Min/Max values for height
+    min_height = Column(Float)
+    max_height = Column(Float)
+
+    # Height percentiles from the merged daily sketches
+    p10_height = Column(Float)
+    p50_height = Column(Float)
+    p90_height = Column(Float)
+    height_sketch = Column(LargeBinary)
+
+    # Metadata
+    measurement_count = Column(Integer)
+    day_count = Column(Integer)
+
+    # Relationships
+    unit = relationship("UnitDB", backref="period_averages")
+
+    __table_args__ = (
+        UniqueConstraint("unit_id", "period", "period_start", name="uq_period_averages_unit_id_period_start"),
+    )
+
+    def __repr__(self):
+        return f"<PeriodAverage(unit_id={self.unit_id}, period={self.period}, period_start={self.period_start}, avg_height={self.avg_height})>"
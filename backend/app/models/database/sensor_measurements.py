@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, func
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from app.db.sessions import Base
 
@@ -15,4 +15,9 @@ class SensorMeasurementDB(Base):
     recorded_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     # Relationship
-    unit = relationship("UnitDB", backref="measurements")
\ No newline at end of file
+    unit = relationship("UnitDB", backref="measurements")
+
+    __table_args__ = (
+        # Range scans per unit (history API, daily aggregation) use this instead of the single-column indexes
+        Index("ix_sensor_measurements_unit_id_recorded_at", "unit_id", "recorded_at"),
+    )
\ No newline at end of file
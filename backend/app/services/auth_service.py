@@ -1,8 +1,12 @@
 from jose import JWTError, jwt
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
 import logging
 import hashlib
+import time
 import bcrypt
 
 from fastapi import Depends, HTTPException, status
@@ -11,6 +15,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.sessions import get_session
 from app.models.database.user import User
 from app.core.config import settings
+from app.services.cache_events import cache_events
 from sqlalchemy.future import select
 
 logger = logging.getLogger(__name__)
@@ -24,6 +29,65 @@ ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
 
+class UserCache:
+    """
+    TTL-bounded cache of authenticated users, keyed by username.
+
+    Lets get_current_user skip the users query on most requests. Entries are
+    detached User rows: treat them as read-only and load the row in the
+    request session before changing it. Call invalidate() after any change to
+    a user's password, role or active flag, and publish a "user" cache event
+    so the other worker processes drop theirs; the TTL is the backstop.
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self._ttl_seconds = ttl_seconds
+        self._max_size = max_size
+        # Structure: {username: (user, expires_at)}, least recently used first
+        self._entries: "OrderedDict[str, Tuple[User, float]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, username: str) -> Optional[User]:
+        entry = self._entries.get(username)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[username]
+            self._misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self._hits += 1
+        return entry[0]
+
+    def put(self, user: User):
+        self._entries[user.username] = (user, time.monotonic() + self._ttl_seconds)
+        self._entries.move_to_end(user.username)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "ttl_seconds": self._ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses
+        }
+
+# Create singleton instance
+user_cache = UserCache(ttl_seconds=settings.USER_CACHE_TTL_SECONDS, max_size=settings.USER_CACHE_MAX_SIZE)
+
+# Drop users changed by other worker processes
+cache_events.subscribe("user", lambda event: user_cache.invalidate(event["username"]))
+cache_events.on_resync(lambda event: user_cache.clear())
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a password against a hashed password.
@@ -47,6 +111,99 @@ def get_password_hash(password: str) -> str:
     return hashed.decode('utf-8')
 
 
+class PasswordHasher:
+    """
+    Runs bcrypt on a small bounded thread pool instead of the event loop.
+
+    A bcrypt call takes a few hundred milliseconds; bcrypt releases the GIL
+    while hashing, so worker threads keep MQTT ingest and WebSocket traffic
+    flowing. At most max_workers calls run at once and at most max_queue more
+    may wait; beyond that callers get 503 instead of piling up.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self._max_workers = max_workers
+        self._max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        # Recent samples (seconds) for percentile reporting
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    def _timed(self, submitted_at: float, fn: Callable, *args):
+        started_at = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._wait_times.append(started_at - submitted_at)
+            self._run_times.append(time.perf_counter() - started_at)
+
+    async def _run(self, fn: Callable, *args):
+        if self._pending >= self._max_workers + self._max_queue:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password operations, please retry",
+                headers={"Retry-After": "1"}
+            )
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, time.perf_counter(), fn, *args)
+        finally:
+            self._pending -= 1
+            self._completed += 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    @staticmethod
+    def _percentiles(samples) -> Dict:
+        if not samples:
+            return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+        ordered = sorted(samples)
+        return {
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 1),
+            "max_ms": round(ordered[-1] * 1000, 1)
+        }
+
+    def get_stats(self) -> Dict:
+        return {
+            "max_workers": self._max_workers,
+            "max_queue": self._max_queue,
+            "in_flight": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "queue_wait": self._percentiles(list(self._wait_times)),
+            "hash_time": self._percentiles(list(self._run_times))
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Create singleton instance
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password hashing pool (use this in request handlers)"""
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the password hashing pool (use this in request handlers)"""
+    return await password_hasher.hash(password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -68,12 +225,19 @@ async def authenticate_user(db: AsyncSession, username: str, password: str) -> O
     user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
     return user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_session)
+) -> User:
+    """
+    Resolve the bearer token to an active user. Served from user_cache when
+    possible; otherwise the user is loaded with the request's own session.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -87,12 +251,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     except JWTError:
         raise credentials_exception
 
-    # Fetch from DB
-    async for db in get_session():
+    user = user_cache.get(username)
+    if user is None:
         user = await get_user_by_username(db, username)
         if user is None:
             raise credentials_exception
-        return user
+        user_cache.put(user)
+
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is inactive"
+        )
+    return user
 
 
 async def admin_required(current_user: User = Depends(get_current_user)) -> User:
@@ -0,0 +1,179 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select
+from typing import Dict, List, Optional, Tuple
+import logging
+import math
+import threading
+
+from app.core.config import settings
+from app.models.database.daily_averages import DailyAverageDB
+from app.services.period_averages_service import period_end
+
+logger = logging.getLogger(__name__)
+
+FLOAT_FIELDS = (
+    "avg_height", "min_height", "max_height", "p10_height", "p50_height", "p90_height",
+    "avg_temperature", "avg_battery", "avg_rssi", "avg_snr"
+)
+
+
+class MonthBlock:
+    """One unit's daily averages for one month, held as typed arrays (about 100 bytes per day)"""
+    __slots__ = ("ordinals", "values", "counts")
+
+    def __init__(self, averages: List[DailyAverageDB]):
+        self.ordinals = array("l", (avg.date.toordinal() for avg in averages))
+        # NaN stands in for NULL so every field fits a float array
+        self.values = {
+            field: array("d", (math.nan if getattr(avg, field) is None else getattr(avg, field) for avg in averages))
+            for field in FLOAT_FIELDS
+        }
+        self.counts = array("l", (avg.measurement_count or 0 for avg in averages))
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.ordinals) * self.ordinals.itemsize * (2 + len(self.values))) + 64
+
+
+def _month_key(day: date) -> Tuple[int, int]:
+    return day.year, day.month
+
+
+def _months(start: date, end: date) -> List[date]:
+    months, month = [], start.replace(day=1)
+    while month <= end:
+        months.append(month)
+        month = period_end(month, "month")
+    return months
+
+
+def _float(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+class AveragesBlockCache:
+    """
+    Memory-bounded LRU cache of per-unit, per-month blocks of daily averages.
+
+    Past daily rows only change when a daily average is (re)written, and every
+    such write invalidates exactly the block holding that date. A range request
+    is assembled from cached blocks plus at most one query covering the months
+    that are not cached. A block read from the database is only stored if no
+    invalidation for that unit happened while it was being read, so a
+    concurrent write can never leave a stale block behind.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Structure: {(unit_id, (year, month)): MonthBlock}, least recently used first
+        self._blocks: "OrderedDict[Tuple[str, Tuple[int, int]], MonthBlock]" = OrderedDict()
+        self._bytes = 0
+        # Structure: {unit_id: invalidation counter}
+        self._generations: Dict[str, int] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _get(self, key) -> Optional[MonthBlock]:
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                self._misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self._hits += 1
+            return block
+
+    def _put(self, key, block: MonthBlock, generation: int):
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            previous = self._blocks.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._blocks[key] = block
+            self._bytes += block.nbytes
+            while self._bytes > self._max_bytes and self._blocks:
+                _, evicted = self._blocks.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._evictions += 1
+
+    def invalidate(self, unit_id: str, day: date):
+        """Drop the block holding a unit's daily average for day (call after writing it)"""
+        with self._lock:
+            self._generations[unit_id] = self._generations.get(unit_id, 0) + 1
+            block = self._blocks.pop((unit_id, _month_key(day)), None)
+            if block is not None:
+                self._bytes -= block.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._bytes = 0
+
+    async def get_daily_series(self, session: AsyncSession, unit_id: str, start: date, end: date) -> Tuple[List[int], Dict[str, list]]:
+        """
+        Daily averages of a unit for [start, end] as (date ordinals, columns).
+        Columns match the columnar API format: date, the averaged fields and measurement_count.
+        """
+        months = _months(start, end)
+        blocks = {month: self._get((unit_id, _month_key(month))) for month in months}
+        missing = [month for month, block in blocks.items() if block is None]
+
+        if missing:
+            generation = self._generations.get(unit_id, 0)
+            result = await session.execute(
+                select(DailyAverageDB).where(
+                    and_(
+                        DailyAverageDB.unit_id == unit_id,
+                        DailyAverageDB.date >= missing[0],
+                        DailyAverageDB.date < period_end(missing[-1], "month")
+                    )
+                ).order_by(DailyAverageDB.date)
+            )
+            by_month: Dict[date, List[DailyAverageDB]] = {month: [] for month in missing}
+            for avg in result.scalars().all():
+                month = avg.date.replace(day=1)
+                if month in by_month:
+                    by_month[month].append(avg)
+            for month, averages in by_month.items():
+                block = MonthBlock(averages)
+                blocks[month] = block
+                self._put((unit_id, _month_key(month)), block, generation)
+
+        first, last = start.toordinal(), end.toordinal()
+        ordinals: List[int] = []
+        columns: Dict[str, list] = {"date": [], **{field: [] for field in FLOAT_FIELDS}, "measurement_count": []}
+        for month in months:
+            block = blocks[month]
+            lo = bisect_left(block.ordinals, first)
+            hi = bisect_right(block.ordinals, last)
+            if lo >= hi:
+                continue
+            ordinals.extend(block.ordinals[lo:hi])
+            for field in FLOAT_FIELDS:
+                columns[field].extend(_float(value) for value in block.values[field][lo:hi])
+            columns["measurement_count"].extend(block.counts[lo:hi])
+        columns["date"] = [date.fromordinal(ordinal).isoformat() for ordinal in ordinals]
+        return ordinals, columns
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "blocks": len(self._blocks),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0
+            }
+
+# Create singleton instance
+averages_block_cache = AveragesBlockCache(max_bytes=settings.AVERAGES_CACHE_MAX_BYTES)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import asyncpg
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.sessions import engine
+
+logger = logging.getLogger(__name__)
+
+# Handlers receive the event fields; they may be plain functions or coroutines
+Handler = Callable[[Dict[str, Any]], Optional[Awaitable[None]]]
+
+# Seconds to wait before reopening a lost LISTEN connection (doubles up to the maximum)
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+
+
+class LocalBroker:
+    """In-process stand-in for the database: delivers every event to every attached bus"""
+
+    def __init__(self):
+        self._subscribers: List[Callable[[str], None]] = []
+
+    def attach(self, deliver: Callable[[str], None]):
+        self._subscribers.append(deliver)
+
+    def detach(self, deliver: Callable[[str], None]):
+        if deliver in self._subscribers:
+            self._subscribers.remove(deliver)
+
+    async def send(self, session: Optional[AsyncSession], payload: str, commit: bool = True):
+        for deliver in list(self._subscribers):
+            deliver(payload)
+
+
+class PostgresNotifier:
+    """
+    LISTEN on a dedicated asyncpg connection opened outside the engine's pool
+    and held for the life of the process; NOTIFY through the caller's session,
+    so the event is only delivered if (and when) its transaction commits.
+    """
+
+    def __init__(self, channel: str):
+        self._channel = channel
+        self._connection = None
+        self._deliver: Optional[Callable[[str], None]] = None
+        self._on_lost: Optional[Callable[[], None]] = None
+
+    async def listen(self, deliver: Callable[[str], None], on_lost: Callable[[], None]):
+        self._deliver, self._on_lost = deliver, on_lost
+        # Same server and credentials as the engine, but not a pool slot
+        _, connect_args = engine.dialect.create_connect_args(engine.url)
+        connection = await asyncpg.connect(**connect_args)
+        try:
+            await connection.add_listener(self._channel, self._on_notification)
+            connection.add_termination_listener(self._on_terminated)
+        except BaseException:
+            # Also on cancellation (stop() during a reconnect), so the connection is not left open
+            connection.terminate()
+            raise
+        self._connection = connection
+
+    def _on_notification(self, connection, pid, channel, payload):
+        self._deliver(payload)
+
+    def _on_terminated(self, connection):
+        # close() clears _connection first, so only an unexpected loss gets here
+        if connection is self._connection:
+            self._connection = None
+            self._on_lost()
+
+    async def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+
+    async def send(self, session: Optional[AsyncSession], payload: str, commit: bool = True):
+        statement = text("SELECT pg_notify(:channel, :payload)")
+        params = {"channel": self._channel, "payload": payload}
+        if session is not None:
+            await session.execute(statement, params)
+            if commit:
+                await session.commit()
+        else:
+            async with engine.connect() as connection:
+                await connection.execute(statement, params)
+                await connection.commit()
+
+
+class CacheEventBus:
+    """
+    Tell the other processes which cache entries a change made stale.
+
+    Each process caches unit metadata, normal values, users and daily
+    average blocks. After changing one of them, the writer publishes a small
+    event ({"kind": "unit", "unit_id": "001"}); every other process runs the
+    handlers the owning module subscribed for that kind, which update or
+    drop just that entry. The publishing process has already updated its own
+    cache and ignores its own events.
+
+    If the LISTEN connection is lost, events may have been missed: the
+    resync callbacks run once it is back.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self.origin = f"{socket.gethostname()}-{os.getpid()}-{id(self):x}"
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._resync: List[Handler] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._running = False
+        self._published = 0
+        self._received = 0
+
+    def subscribe(self, kind: str, handler: Handler):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def on_resync(self, handler: Handler):
+        """Called (with an empty dict) after events may have been lost"""
+        self._resync.append(handler)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        if isinstance(self._backend, LocalBroker):
+            self._backend.attach(self._deliver)
+        else:
+            await self._backend.listen(self._deliver, self._connection_lost)
+        logger.info(f"Cache events started ({type(self._backend).__name__})")
+
+    async def stop(self):
+        self._running = False
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if isinstance(self._backend, LocalBroker):
+            self._backend.detach(self._deliver)
+        else:
+            await self._backend.close()
+
+    async def publish(self, session: Optional[AsyncSession], kind: str, commit: bool = True, **fields):
+        """
+        Announce a change through the session that made it. With commit=False
+        the event joins the session's open transaction and goes out when the
+        caller commits. Never raises: a lost event must not fail the request.
+        """
+        payload = json.dumps({"kind": kind, "origin": self.origin, **fields}, default=str)
+        try:
+            await self._backend.send(session, payload, commit)
+            self._published += 1
+        except Exception as e:
+            logger.error(f"Failed to publish cache event {kind}: {e}")
+
+    def _deliver(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.error(f"Ignoring malformed cache event: {payload}")
+            return
+        if event.get("origin") == self.origin:
+            return
+        self._received += 1
+        self._run_handlers(self._handlers.get(event.get("kind"), ()), event)
+
+    def _run_handlers(self, handlers, event: Dict[str, Any]):
+        for handler in handlers:
+            try:
+                result = handler(event)
+                if asyncio.iscoroutine(result):
+                    self._loop.create_task(self._await_handler(result, event))
+            except Exception as e:
+                logger.error(f"Cache event handler failed for {event.get('kind')}: {e}")
+
+    @staticmethod
+    async def _await_handler(result: Awaitable[None], event: Dict[str, Any]):
+        try:
+            await result
+        except Exception as e:
+            logger.error(f"Cache event handler failed for {event.get('kind')}: {e}")
+
+    def _connection_lost(self):
+        if self._running and self._reconnect_task is None:
+            logger.warning("Cache event connection lost; reconnecting")
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = RECONNECT_DELAY
+        try:
+            while self._running:
+                await asyncio.sleep(delay)
+                if not self._running:
+                    return
+                try:
+                    await self._backend.listen(self._deliver, self._connection_lost)
+                except Exception as e:
+                    logger.error(f"Cache event reconnect failed: {e}")
+                    delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                    continue
+                if not self._running:
+                    # stop() ran while the connection was opening
+                    await self._backend.close()
+                    return
+                logger.info("Cache events reconnected; resynchronizing caches")
+                self._run_handlers(self._resync, {})
+                return
+        finally:
+            if self._reconnect_task is asyncio.current_task():
+                self._reconnect_task = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": type(self._backend).__name__,
+            "running": self._running,
+            "published": self._published,
+            "received": self._received,
+            "kinds": sorted(self._handlers)
+        }
+
+
+def _create_backend():
+    backend = settings.CACHE_EVENTS_BACKEND
+    if backend == "auto":
+        backend = "postgres" if engine.dialect.name == "postgresql" else "local"
+    if backend == "postgres":
+        return PostgresNotifier(settings.CACHE_EVENTS_CHANNEL)
+    if backend == "local":
+        return LocalBroker()
+    raise ValueError(f"CACHE_EVENTS_BACKEND must be auto, postgres or local, got {backend!r}")
+
+# Create singleton instance
+cache_events = CacheEventBus(_create_backend())
@@ -1,15 +1,82 @@
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, and_, select
-from typing import List, Optional
+from typing import Dict, List, Optional
 import logging
+import threading
 
 from app.models.database.sensor_measurements import SensorMeasurementDB
 from app.models.database.daily_averages import DailyAverageDB
 from app.models.database.unit import UnitDB
+from app.models.database.cache_versions import CacheVersionDB
+from app.db.sessions import get_session
+from app.db.upsert import increment, upsert
+from app.db.time_buckets import day_bounds
+from app.services.period_averages_service import PeriodAveragesService
+from app.services.averages_block_cache import averages_block_cache
+from app.services.cache_events import cache_events
+from app.services.quantile_sketch import QuantileSketch
 
 logger = logging.getLogger(__name__)
 
+class DailyAverageVersions:
+    """
+    Per-unit counters bumped whenever a daily average row is written.
+    Used as a cheap change marker (e.g. for ETags) without querying the table.
+
+    The counters live in cache_versions and are bumped in the transaction
+    that writes the row, so every worker agrees on them: each loads them at
+    startup and takes new values from the daily_average cache events.
+    """
+
+    KEY_PREFIX = "daily_average:"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+
+    async def load(self, session: AsyncSession):
+        """Take over every stored counter"""
+        result = await session.execute(
+            select(CacheVersionDB.key, CacheVersionDB.version)
+            .where(CacheVersionDB.key.startswith(self.KEY_PREFIX))
+        )
+        for key, version in result.all():
+            self.set(key[len(self.KEY_PREFIX):], version)
+
+    async def bump(self, session: AsyncSession, unit_id: str) -> int:
+        """Bump the stored counter in the session's transaction; set() the result once committed"""
+        result = await session.execute(
+            increment(session, CacheVersionDB, "key", f"{self.KEY_PREFIX}{unit_id}", "version")
+        )
+        return result.scalar_one()
+
+    def set(self, unit_id: str, version: int):
+        with self._lock:
+            if version > self._versions.get(unit_id, 0):
+                self._versions[unit_id] = version
+
+    def get(self, unit_id: str) -> int:
+        return self._versions.get(unit_id, 0)
+
+daily_average_versions = DailyAverageVersions()
+
+
+async def load_daily_average_versions():
+    async for session in get_session():
+        await daily_average_versions.load(session)
+
+
+def _on_daily_average_changed(event: Dict):
+    """Another process rewrote a daily average: drop that month block and move the ETag on"""
+    averages_block_cache.invalidate(event["unit_id"], date.fromisoformat(event["date"]))
+    if event.get("version") is not None:
+        daily_average_versions.set(event["unit_id"], event["version"])
+
+cache_events.subscribe("daily_average", _on_daily_average_changed)
+cache_events.on_resync(lambda event: averages_block_cache.clear())
+cache_events.on_resync(lambda event: load_daily_average_versions())
+
 class DailyAveragesService:
     
     def __init__(self, db: AsyncSession):
@@ -71,9 +138,9 @@ class DailyAveragesService:
     async def calculate_daily_averages_for_date(self, unit_id: str, target_date: date, store_zero_if_missing: bool = True) -> Optional[DailyAverageDB]:
         """Calculate daily averages for a specific unit and date"""
         try:
-            # Query measurements for the specific date
-            start_datetime = datetime.combine(target_date, datetime.min.time())
-            end_datetime = datetime.combine(target_date + timedelta(days=1), datetime.min.time())
+            # Query measurements for the specific date. The half-open range on the raw
+            # recorded_at column lets PostgreSQL prune to a single monthly partition.
+            start_datetime, end_datetime = day_bounds(target_date)
             
             logger.info(f"Calculating averages for unit {unit_id} on {target_date} (from {start_datetime} to {end_datetime})")
             
@@ -101,6 +168,21 @@ class DailyAveragesService:
             
             # Check if there are measurements for this date
             if not measurements or measurements.measurement_count == 0:
+                # Raw rows may have been pruned by the retention policy; never overwrite their rollup with zeros
+                existing_result = await self.db.execute(
+                    select(DailyAverageDB)
+                    .filter(
+                        and_(
+                            DailyAverageDB.unit_id == unit_id,
+                            DailyAverageDB.date == target_date,
+                            DailyAverageDB.measurement_count > 0
+                        )
+                    )
+                )
+                existing_record = existing_result.scalar_one_or_none()
+                if existing_record:
+                    logger.info(f"No raw measurements left for unit {unit_id} on {target_date}, keeping existing averages")
+                    return existing_record
                 if store_zero_if_missing:
                     logger.info(f"No measurements found for unit {unit_id} on {target_date}, storing zero averages")
                     # Store zero averages for missing data
@@ -112,6 +194,10 @@ class DailyAveragesService:
                         'avg_snr': 0.0,
                         'min_height': 0.0,
                         'max_height': 0.0,
+                        'p10_height': 0.0,
+                        'p50_height': 0.0,
+                        'p90_height': 0.0,
+                        'height_sketch': None,
                         'measurement_count': 0
                     }
                 else:
@@ -119,6 +205,23 @@ class DailyAveragesService:
                     return None
             else:
                 logger.info(f"Found {measurements.measurement_count} measurements for unit {unit_id} on {target_date}")
+                
+                # Feed the day's heights into a quantile sketch (one narrow column scan, no SQL sorting)
+                sketch = QuantileSketch()
+                heights = await self.db.stream_scalars(
+                    select(SensorMeasurementDB.height)
+                    .filter(
+                        and_(
+                            SensorMeasurementDB.unit_id == unit_id,
+                            SensorMeasurementDB.recorded_at >= start_datetime,
+                            SensorMeasurementDB.recorded_at < end_datetime
+                        )
+                    )
+                    .execution_options(yield_per=5000)
+                )
+                async for partition in heights.partitions():
+                    sketch.update(partition)
+                
                 measurements_data = {
                     'avg_height': float(measurements.avg_height) if measurements.avg_height else 0.0,
                     'avg_temperature': float(measurements.avg_temperature) if measurements.avg_temperature else 0.0,
@@ -127,11 +230,26 @@ class DailyAveragesService:
                     'avg_snr': float(measurements.avg_snr) if measurements.avg_snr else 0.0,
                     'min_height': float(measurements.min_height) if measurements.min_height else 0.0,
                     'max_height': float(measurements.max_height) if measurements.max_height else 0.0,
+                    'p10_height': sketch.quantile(0.1),
+                    'p50_height': sketch.quantile(0.5),
+                    'p90_height': sketch.quantile(0.9),
+                    'height_sketch': sketch.to_bytes(),
                     'measurement_count': int(measurements.measurement_count)
                 }
             
-            # Check if record already exists
-            existing_result = await self.db.execute(
+            # Insert or update the day's row in one statement, so concurrent calculations cannot duplicate it
+            await self.db.execute(upsert(
+                self.db, DailyAverageDB, [{"unit_id": unit_id, "date": target_date, **measurements_data}],
+                ["unit_id", "date"], list(measurements_data)
+            ))
+            # The cache event is sent on commit
+            version = await daily_average_versions.bump(self.db, unit_id)
+            await cache_events.publish(
+                self.db, "daily_average", commit=False, unit_id=unit_id, date=target_date, version=version
+            )
+            await self.db.commit()
+
+            result = await self.db.execute(
                 select(DailyAverageDB)
                 .filter(
                     and_(
@@ -139,51 +257,16 @@ class DailyAveragesService:
                         DailyAverageDB.date == target_date
                     )
                 )
+                # The upsert bypassed the ORM; do not return a stale copy from the session
+                .execution_options(populate_existing=True)
             )
-            existing_record = existing_result.scalar_one_or_none()
-            
-            if existing_record:
-                # Update existing record
-                existing_record.avg_height = measurements_data['avg_height']
-                existing_record.avg_temperature = measurements_data['avg_temperature']
-                existing_record.avg_battery = measurements_data['avg_battery']
-                existing_record.avg_rssi = measurements_data['avg_rssi']
-                existing_record.avg_snr = measurements_data['avg_snr']
-                existing_record.min_height = measurements_data['min_height']
-                existing_record.max_height = measurements_data['max_height']
-                existing_record.measurement_count = measurements_data['measurement_count']
-                
-                # Make sure to flush and commit the transaction
-                await self.db.flush()
-                await self.db.commit()
-                logger.info(f"Updated daily averages for unit {unit_id} on {target_date} - avg_height: {existing_record.avg_height}, count: {existing_record.measurement_count}")
-                return existing_record
-            else:
-                # Create new record
-                daily_average = DailyAverageDB(
-                    unit_id=unit_id,
-                    date=target_date,
-                    avg_height=measurements_data['avg_height'],
-                    avg_temperature=measurements_data['avg_temperature'],
-                    avg_battery=measurements_data['avg_battery'],
-                    avg_rssi=measurements_data['avg_rssi'],
-                    avg_snr=measurements_data['avg_snr'],
-                    min_height=measurements_data['min_height'],
-                    max_height=measurements_data['max_height'],
-                    measurement_count=measurements_data['measurement_count']
-                )
-                
-                self.db.add(daily_average)
-                
-                # Flush to get the ID and then commit
-                await self.db.flush()
-                await self.db.commit()
-                
-                # Refresh to get the saved data
-                await self.db.refresh(daily_average)
-                
-                logger.info(f" Created daily averages for unit {unit_id} on {target_date} - avg_height: {daily_average.avg_height}, count: {daily_average.measurement_count}, ID: {daily_average.id}")
-                return daily_average
+            daily_average = result.scalar_one()
+            await PeriodAveragesService(self.db).refresh_periods_for_date(unit_id, target_date)
+            averages_block_cache.invalidate(unit_id, target_date)
+            daily_average_versions.set(unit_id, version)
+
+            logger.info(f"Saved daily averages for unit {unit_id} on {target_date} - avg_height: {daily_average.avg_height}, count: {daily_average.measurement_count}, ID: {daily_average.id}")
+            return daily_average
                 
         except Exception as e:
             logger.error(f" Error calculating daily averages for unit {unit_id} on {target_date}: {str(e)}")
@@ -196,8 +279,8 @@ class DailyAveragesService:
         """Calculate current day averages for new units (less than 1 day old)"""
         try:
             today = date.today()
-            start_datetime = datetime.combine(today, datetime.min.time())
-            end_datetime = datetime.now()  # Up to current time
+            start_datetime, _ = day_bounds(today)
+            end_datetime = datetime.now(timezone.utc)  # Up to current time
             
             logger.info(f"Calculating current day averages for new unit {unit_id} from {start_datetime} to {end_datetime}")
             
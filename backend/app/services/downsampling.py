@@ -0,0 +1,65 @@
+from typing import Dict, List, Sequence
+import numpy as np
+
+
+def lttb_indices(x: Sequence[float], y: Sequence[float], max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of at most max_points points that preserve the visual
+    shape of the (x, y) series. The first and last points are always kept; from
+    every bucket in between, the point forming the largest triangle with the
+    previously selected point and the average of the next bucket is chosen.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    # Missing values would poison the area computation
+    y = np.nan_to_num(y)
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # Bucket edges over the interior points 1 .. n-2
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs(
+            (x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return selected
+
+
+def downsample_columns(columns: Dict[str, List], x: Sequence[float], y_key: str, max_points: int) -> Dict[str, List]:
+    """
+    Downsample every column of a columnar series using LTTB on (x, columns[y_key]).
+    Columns must all have the same length as x; values are returned as plain lists.
+    """
+    if max_points is None or len(x) <= max_points:
+        return columns
+    indices = lttb_indices(x, columns[y_key], max_points).tolist()
+    return {key: [values[i] for i in indices] for key, values in columns.items()}
+
+
+def columns_to_rows(columns: Dict[str, List]) -> List[Dict]:
+    """Turn a columnar series back into one dict per point"""
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, select
+from typing import Dict, List, Optional
+import logging
+
+from app.db.time_buckets import hour_offset, time_bucket
+from app.db.upsert import upsert
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.models.database.hourly_averages import HourlyAverageDB
+
+logger = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+
+# Hours aggregated per grouped query when catching up on a backlog
+CATCH_UP_CHUNK_HOURS = 24
+
+# Rows per upsert statement (keeps the bind parameter count well below driver limits)
+UPSERT_BATCH_SIZE = 1000
+
+AVERAGE_FIELDS = [
+    "avg_height", "avg_temperature", "avg_battery", "avg_rssi", "avg_snr",
+    "min_height", "max_height", "measurement_count"
+]
+
+
+def hour_floor(value: datetime) -> datetime:
+    """Start of the hour containing an aware timestamp (hours start at hour_offset(), like the buckets)"""
+    offset = hour_offset()
+    return datetime.fromtimestamp((value.timestamp() - offset) // 3600 * 3600 + offset, timezone.utc)
+
+
+def as_utc(value) -> Optional[datetime]:
+    """Normalize a timestamp from either backend (SQLite returns naive values or strings) to aware UTC"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class HourlyAveragesService:
+    """
+    Materialize hourly_averages from raw measurements.
+
+    Each run aggregates all units at once with a single GROUP BY (unit_id, hour)
+    over the closed hours since the last materialized hour, and upserts the
+    result, so re-running an hour is harmless.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_last_materialized_hour(self) -> Optional[datetime]:
+        result = await self.db.execute(select(func.max(HourlyAverageDB.hour_start)))
+        return as_utc(result.scalar())
+
+    async def get_first_measurement_time(self) -> Optional[datetime]:
+        result = await self.db.execute(select(func.min(SensorMeasurementDB.recorded_at)))
+        return as_utc(result.scalar())
+
+    async def materialize_hours(self, start: datetime, end: datetime) -> int:
+        """Aggregate every unit's measurements in [start, end) into hourly rows; returns rows written"""
+        # Aligned with local hours, so the hours of a day (see day_bounds) hold exactly its measurements
+        hour_start = time_bucket(SensorMeasurementDB.recorded_at, 3600, hour_offset()).label("hour_start")
+        result = await self.db.execute(
+            select(
+                SensorMeasurementDB.unit_id,
+                hour_start,
+                func.avg(SensorMeasurementDB.height).label('avg_height'),
+                func.avg(SensorMeasurementDB.temperature).label('avg_temperature'),
+                func.avg(SensorMeasurementDB.battery).label('avg_battery'),
+                func.avg(SensorMeasurementDB.rssi).label('avg_rssi'),
+                func.avg(SensorMeasurementDB.snr).label('avg_snr'),
+                func.min(SensorMeasurementDB.height).label('min_height'),
+                func.max(SensorMeasurementDB.height).label('max_height'),
+                func.count(SensorMeasurementDB.id).label('measurement_count')
+            )
+            .filter(
+                and_(
+                    SensorMeasurementDB.recorded_at >= start,
+                    SensorMeasurementDB.recorded_at < end
+                )
+            )
+            .group_by(SensorMeasurementDB.unit_id, hour_start)
+        )
+
+        rows: List[Dict] = []
+        for row in result.all():
+            values = {field: getattr(row, field) for field in AVERAGE_FIELDS}
+            for field in AVERAGE_FIELDS[:-1]:
+                if values[field] is not None:
+                    values[field] = float(values[field])
+            values["unit_id"] = row.unit_id
+            values["hour_start"] = as_utc(row.hour_start)
+            rows.append(values)
+
+        for offset in range(0, len(rows), UPSERT_BATCH_SIZE):
+            await self.db.execute(upsert(
+                self.db, HourlyAverageDB, rows[offset:offset + UPSERT_BATCH_SIZE],
+                ["unit_id", "hour_start"], AVERAGE_FIELDS
+            ))
+        await self.db.commit()
+        return len(rows)
+
+    async def calculate_closed_hours(self, now: Optional[datetime] = None) -> int:
+        """
+        Materialize every closed hour not yet in hourly_averages.
+        The last materialized hour is recomputed too, to pick up rows committed just after it closed.
+        """
+        try:
+            end = hour_floor(as_utc(now) if now else datetime.now(timezone.utc))
+            start = await self.get_last_materialized_hour()
+            if start is None:
+                first = await self.get_first_measurement_time()
+                if first is None:
+                    return 0
+                start = hour_floor(first)
+
+            written = 0
+            while start < end:
+                chunk_end = min(start + CATCH_UP_CHUNK_HOURS * HOUR, end)
+                written += await self.materialize_hours(start, chunk_end)
+                start = chunk_end
+
+            logger.info(f"Materialized {written} hourly average rows up to {end.isoformat()}")
+            return written
+        except Exception as e:
+            logger.error(f"Error materializing hourly averages: {str(e)}")
+            await self.db.rollback()
+            return 0
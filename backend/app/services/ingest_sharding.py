@@ -0,0 +1,143 @@
+import logging
+import os
+import socket
+import zlib
+from typing import Dict, Optional
+from sqlalchemy import text
+from app.core.config import settings
+from app.db.sessions import engine
+
+logger = logging.getLogger(__name__)
+
+SHARDING_MODES = ("none", "shared", "hash")
+
+# Advisory lock keys 0x52495645_0000 + index ("RIVE"), one per hash shard
+_SHARD_LOCK_BASE = 0x52495645 << 16
+
+
+class IngestSharding:
+    """
+    Decides which readings this worker processes when several workers ingest.
+
+    - none:   every message on the configured topics is processed (single worker)
+    - hash:   every worker receives every message and keeps only units with
+              crc32(unit_id) % worker_count == worker_index, so a unit's cached
+              state (normal value, save interval, status) lives in one worker
+    - shared: topics are subscribed as MQTT 5 shared subscriptions
+              ($share/<group>/<topic>), so the broker hands each message to one
+              worker. Units are owned as in hash mode; a worker given a reading
+              for another shard forwards it to the owner's shard topic
+              (<fanout topic>/shard/<index>), so a unit's state still lives in
+              one worker while each message crosses the network at most twice
+
+    In the scaled-out modes processed readings are forwarded to the other
+    workers over the fan-out topic so their WebSocket clients see every unit.
+    The worker index comes from INGEST_WORKER_INDEX, or on PostgreSQL is
+    claimed with an advisory lock held for the life of the worker.
+    """
+
+    def __init__(self, mode: str, share_group: str, worker_count: int,
+                 worker_index: Optional[int], fanout_topic: str):
+        if mode not in SHARDING_MODES:
+            raise ValueError(f"INGEST_SHARDING must be one of {', '.join(SHARDING_MODES)}, got {mode!r}")
+        self.mode = mode
+        self.share_group = share_group
+        self.worker_count = max(worker_count, 1)
+        self.worker_index = worker_index
+        self.fanout_topic = fanout_topic.rstrip("/")
+        # Unique per process: MQTT client id suffix and origin of fan-out messages
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._owned: Dict[str, bool] = {}
+        self._lock_connection = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none"
+
+    @property
+    def sharded(self) -> bool:
+        """Units are owned by one worker each (hash and shared modes)"""
+        return self.mode in ("hash", "shared")
+
+    async def start(self):
+        """Claim a shard index if none was configured"""
+        if not self.sharded or self.worker_index is not None:
+            return
+        if engine.dialect.name != "postgresql":
+            logger.error(f"INGEST_SHARDING={self.mode} needs INGEST_WORKER_INDEX unless the database is PostgreSQL; "
+                         "this worker will not process readings")
+            return
+        connection = await engine.connect()
+        try:
+            # Autocommit so the worker's lock connection does not sit idle in a transaction
+            await connection.execution_options(isolation_level="AUTOCOMMIT")
+            for index in range(self.worker_count):
+                result = await connection.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": _SHARD_LOCK_BASE + index}
+                )
+                if result.scalar():
+                    self.worker_index = index
+                    self._lock_connection = connection
+                    logger.info(f"Claimed ingest shard {index + 1}/{self.worker_count}")
+                    return
+        except Exception:
+            await connection.close()
+            raise
+        await connection.close()
+        logger.warning(f"All {self.worker_count} ingest shards are taken; this worker will not process readings")
+
+    async def stop(self):
+        """Release the claimed shard so a restarted worker can take it"""
+        if self._lock_connection is not None:
+            connection, self._lock_connection = self._lock_connection, None
+            try:
+                # The connection goes back to the pool; a session lock would outlive close()
+                await connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": _SHARD_LOCK_BASE + self.worker_index}
+                )
+            finally:
+                await connection.close()
+            self.worker_index = None
+            self._owned.clear()
+
+    def subscription_topic(self, topic: str) -> str:
+        if self.mode == "shared":
+            return f"$share/{self.share_group}/{topic}"
+        return topic
+
+    def shard_of(self, unit_id: str) -> int:
+        return zlib.crc32(unit_id.encode("utf-8")) % self.worker_count
+
+    def shard_topic(self, index: int) -> str:
+        """Where shared-mode workers send readings for the worker holding shard index"""
+        return f"{self.fanout_topic}/shard/{index}"
+
+    def owns(self, unit_id: str) -> bool:
+        if not self.sharded:
+            return True
+        owned = self._owned.get(unit_id)
+        if owned is None:
+            owned = self._owned[unit_id] = (
+                self.worker_index is not None and self.shard_of(unit_id) == self.worker_index
+            )
+        return owned
+
+    def get_status(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "worker_id": self.worker_id,
+            "worker_index": self.worker_index,
+            "worker_count": self.worker_count if self.sharded else None,
+            "share_group": self.share_group if self.mode == "shared" else None,
+            "fanout_topic": self.fanout_topic if self.enabled else None,
+            "units_owned": sum(self._owned.values()) if self.sharded else None
+        }
+
+# Create singleton instance
+ingest_sharding = IngestSharding(
+    mode=settings.INGEST_SHARDING,
+    share_group=settings.INGEST_SHARE_GROUP,
+    worker_count=settings.INGEST_WORKER_COUNT,
+    worker_index=settings.INGEST_WORKER_INDEX,
+    fanout_topic=settings.INGEST_FANOUT_TOPIC
+)
@@ -1,12 +1,21 @@
+import hashlib
+import json
 import logging
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.future import select
+from app.core.metrics import CACHE_LOOKUPS
+from app.services.cache_events import cache_events
 from app.db.sessions import get_session
 from app.models.database.unit import UnitDB
 
 logger = logging.getLogger(__name__)
 
+# Live statuses tracked for the fleet overview, in severity order.
+# Units in the metadata snapshot that have not reported since startup are "unknown".
+FLEET_STATUSES = ("normal", "warning", "high", "critical", "stale", "unknown")
+
 class MQTTCacheManager:
     """
     Cache manager to optimize database calls for normal values
@@ -31,12 +40,41 @@ class MQTTCacheManager:
         #                       "rssi": int, "snr": float, "last_updated": datetime}}
         self._latest_sensor_data_cache: Dict[str, Dict] = {}
         
-        # Cache for unit metadata (alert levels, name, location, is_active)
-        # Structure: {unit_id: {"name": str, "location": str, "normal": float, "warning": float, "high": float, "critical": float, "is_active": bool, "last_refreshed": datetime}}
-        self._unit_meta_cache: Dict[str, Dict] = {}
+        # Immutable, versioned snapshot of all unit rows (alert levels, name, location, is_active, timestamps).
+        # Updates build a new mapping (copy-on-write) and bump the version, so readers never see a partial update.
+        # Structure: {unit_id: {"name": str, "location": str, "normal": float, "warning": float, "high": float, "critical": float,
+        #                       "is_active": bool, "created_at": datetime, "updated_at": datetime, "last_refreshed": datetime}}
+        self._unit_meta_cache: Mapping[str, Mapping] = MappingProxyType({})
+        self._unit_meta_version = 0
+        self._unit_meta_loaded = False
+
+        # Response bodies serialized from the snapshot, rebuilt only when the version changes
+        # Structure: {key: (version, bytes)}
+        self._serialized_snapshots: Dict[str, Tuple[int, bytes]] = {}
+        # Digest of the snapshot contents, as (version, digest)
+        self._unit_meta_fingerprint: Tuple[int, str] = (-1, "")
+
+        # Live per-unit status, updated on every reading and on alert level changes
+        # Structure: {unit_id: {"status": str, "distance": float, "normal_level": float, "last_updated": datetime}}
+        # (last_updated is None for units that have not reported yet)
+        self._unit_status_cache: Dict[str, Dict] = {}
+
+        # Number of units currently in each status, kept in step with _unit_status_cache
+        # Structure: {status: int}
+        self._fleet_status_counts: Dict[str, int] = {status: 0 for status in FLEET_STATUSES}
+        
+        # Lookup counters for the normal value cache
+        self._normal_hits = 0
+        self._normal_misses = 0
         
         # Number of readings to collect for normal value calculation
         self.NORMAL_CALCULATION_READINGS = 12
+
+        # Shared memory table mirroring the live state (set in the ingest process)
+        self._shared_state = None
+
+        # Stale sensor monitor, told when units are cleared (set by the monitor to avoid a circular import)
+        self._stale_monitor = None
         
     def has_normal_value_cached(self, unit_id: str) -> bool:
         """Check if unit has normal value in server-side cache"""
@@ -58,6 +96,7 @@ class MQTTCacheManager:
             "last_updated": datetime.now()
         }
         logger.info(f"Cached normal value for unit {unit_id}: {normal_level}")
+        self._publish_state(unit_id)
     
     def mark_unit_no_normal(self, unit_id: str):
         """Mark unit as having no normal value to avoid repeated DB checks"""
@@ -66,6 +105,7 @@ class MQTTCacheManager:
             "has_normal": False,
             "last_updated": datetime.now()
         }
+        self._publish_state(unit_id)
     
     async def check_database_for_normal_value(self, unit_id: str) -> Optional[float]:
         """Check database for existing normal value"""
@@ -119,6 +159,7 @@ class MQTTCacheManager:
                 
                 # Cache the saved value
                 self.set_cached_normal_value(unit_id, normal_level)
+                await cache_events.publish(session, "normal_value", unit_id=unit_id, normal_level=normal_level)
                 # Refresh unit metadata cache for this unit
                 try:
                     # Reload full unit row and cache metadata
@@ -146,9 +187,13 @@ class MQTTCacheManager:
         
         # Step 1: Check server-side cache
         if self.has_normal_value_cached(unit_id):
+            self._normal_hits += 1
+            CACHE_LOOKUPS.inc(cache="normal_value", result="hit")
             cached_value = self.get_cached_normal_value(unit_id)
             logger.debug(f"Using cached normal value for unit {unit_id}: {cached_value}")
             return cached_value
+        self._normal_misses += 1
+        CACHE_LOOKUPS.inc(cache="normal_value", result="miss")
         
         # Step 2: Cache says false or doesn't exist, check database
         logger.info(f"No cached normal value for unit {unit_id}, checking database...")
@@ -234,16 +279,164 @@ class MQTTCacheManager:
             "last_updated": datetime.now()
         }
         logger.debug(f"Updated latest sensor data cache for unit {unit_id}")
+        self._publish_state(unit_id)
     
     def get_latest_sensor_data(self, unit_id: str) -> Optional[Dict]:
         """Get the latest cached sensor data for a unit"""
         return self._latest_sensor_data_cache.get(unit_id)
 
-    def set_unit_metadata_from_row(self, unit_row: UnitDB):
-        """Cache metadata for a UnitDB row"""
-        if not unit_row:
+    @staticmethod
+    def classify_status(height: float, normal_value: float, meta: Optional[Dict]) -> str:
+        """
+        Classify a reading against the unit's alert levels.
+        Height is in cm; thresholds are stored in meters in cache/database.
+        """
+        try:
+            if meta:
+                warning_m = meta.get("warning")
+                high_m = meta.get("high")
+                critical_m = meta.get("critical")
+            else:
+                # Metadata missing; will fall back to safe defaults below
+                warning_m = high_m = critical_m = None
+
+            # Convert meters to centimeters for comparison. If a threshold is missing, set to a very large value so it won't trigger.
+            warning_cm = (float(warning_m) * 100) if (warning_m is not None) else float('inf')
+            high_cm = (float(high_m) * 100) if (high_m is not None) else float('inf')
+            critical_cm = (float(critical_m) * 100) if (critical_m is not None) else float('inf')
+
+        except Exception:
+            # On any error, default thresholds to infinity (no alerts)
+            warning_cm = high_cm = critical_cm = float('inf')
+
+        current_water_level_Difference = abs(height - normal_value)
+
+        if current_water_level_Difference < warning_cm:
+            return "normal"
+        elif current_water_level_Difference < high_cm:
+            return "warning"
+        elif current_water_level_Difference < critical_cm:
+            return "high"
+        return "critical"
+
+    def update_unit_status(self, unit_id: str, status: str, distance: Optional[float] = None,
+                           normal_level: Optional[float] = None) -> Optional[str]:
+        """
+        Record the live status of a unit and adjust the fleet counters.
+        Returns the previous status (None if the unit was not tracked yet).
+        """
+        entry = self._unit_status_cache.get(unit_id)
+        previous_status = entry["status"] if entry else None
+
+        if previous_status != status:
+            if previous_status is not None:
+                self._fleet_status_counts[previous_status] -= 1
+            self._fleet_status_counts[status] += 1
+
+        if entry is None:
+            entry = self._unit_status_cache[unit_id] = {}
+        entry["status"] = status
+        if distance is not None:
+            entry["distance"] = distance
+        if normal_level is not None:
+            entry["normal_level"] = normal_level
+        entry["last_updated"] = datetime.now()
+        self._publish_state(unit_id)
+        return previous_status
+
+    def mark_unit_stale(self, unit_id: str) -> bool:
+        """Mark a tracked unit as stale; returns True if its status changed"""
+        entry = self._unit_status_cache.get(unit_id)
+        if not entry or entry["status"] == "stale":
+            return False
+        self._fleet_status_counts[entry["status"]] -= 1
+        self._fleet_status_counts["stale"] += 1
+        entry["status"] = "stale"
+        self._publish_state(unit_id)
+        return True
+
+    def _reclassify_unit_status(self, unit_id: str):
+        """Re-evaluate a unit's live status after its alert levels or normal value changed"""
+        entry = self._unit_status_cache.get(unit_id)
+        if not entry or entry["status"] in ("stale", "unknown") or entry.get("distance") is None:
+            return
+        normal_level = self.get_cached_normal_value(unit_id)
+        if normal_level is None:
+            normal_level = entry.get("normal_level")
+        if normal_level is None:
             return
-        self._unit_meta_cache[unit_row.unit_id] = {
+        entry["normal_level"] = normal_level
+        status = self.classify_status(entry["distance"], normal_level, self._unit_meta_cache.get(unit_id))
+        if status != entry["status"]:
+            self._fleet_status_counts[entry["status"]] -= 1
+            self._fleet_status_counts[status] += 1
+            entry["status"] = status
+            logger.info(f"Unit {unit_id} status changed to {status} after alert level or normal value update")
+        self._publish_state(unit_id)
+
+    def _track_unknown_unit(self, unit_id: str):
+        """Count a unit from the metadata snapshot that has not reported yet"""
+        if unit_id not in self._unit_status_cache:
+            self._unit_status_cache[unit_id] = {"status": "unknown", "last_updated": None}
+            self._fleet_status_counts["unknown"] += 1
+            self._publish_state(unit_id)
+
+    def _track_unknown_units(self):
+        """Bring the fleet counters in line with the metadata snapshot"""
+        for unit_id in self._unit_meta_cache:
+            self._track_unknown_unit(unit_id)
+        removed = [
+            unit_id for unit_id, entry in self._unit_status_cache.items()
+            if entry["status"] == "unknown" and unit_id not in self._unit_meta_cache
+        ]
+        for unit_id in removed:
+            self._remove_unit_status(unit_id)
+
+    def _remove_unit_status(self, unit_id: str):
+        """Stop tracking the live status of a unit"""
+        entry = self._unit_status_cache.pop(unit_id, None)
+        if entry:
+            self._fleet_status_counts[entry["status"]] -= 1
+        self._publish_state(unit_id)
+
+    def attach_stale_monitor(self, monitor):
+        """Stop watching units for missed reports when they are cleared"""
+        self._stale_monitor = monitor
+
+    def attach_shared_state(self, table):
+        """Mirror every change to the live state into a SharedStateTable for other processes"""
+        self._shared_state = table
+        for unit_id in set(self._latest_sensor_data_cache) | set(self._unit_status_cache):
+            self._publish_state(unit_id)
+
+    def _publish_state(self, unit_id: str):
+        if self._shared_state is not None:
+            self._shared_state.write(
+                unit_id,
+                self._latest_sensor_data_cache.get(unit_id),
+                self._unit_status_cache.get(unit_id),
+                self.get_cached_normal_value(unit_id)
+            )
+
+    def get_fleet_status(self) -> Dict:
+        """Get the live status summary for the whole fleet (served from memory only)"""
+        return {
+            "total_units": len(self._unit_status_cache),
+            "counts": dict(self._fleet_status_counts),
+            "units": {
+                unit_id: {
+                    "status": entry["status"],
+                    "distance": entry.get("distance"),
+                    "normal_level": entry.get("normal_level"),
+                    "last_updated": entry["last_updated"].isoformat() if entry["last_updated"] else None
+                }
+                for unit_id, entry in self._unit_status_cache.items()
+            }
+        }
+
+    @staticmethod
+    def _metadata_from_row(unit_row: UnitDB) -> Mapping:
+        return MappingProxyType({
             "name": unit_row.name,
             "location": unit_row.location,
             "normal": unit_row.normal_level,
@@ -251,11 +444,48 @@ class MQTTCacheManager:
             "high": unit_row.high_level,
             "critical": unit_row.critical_level,
             "is_active": unit_row.is_active,
+            "created_at": unit_row.created_at,
+            "updated_at": unit_row.updated_at,
             "last_refreshed": datetime.now()
-        }
-        logger.debug(f"Cached unit metadata for {unit_row.unit_id}")
+        })
+
+    def set_unit_metadata_from_row(self, unit_row: UnitDB):
+        """Cache metadata for a UnitDB row (copy-on-write, bumps the snapshot version)"""
+        if not unit_row:
+            return
+        snapshot = dict(self._unit_meta_cache)
+        snapshot[unit_row.unit_id] = self._metadata_from_row(unit_row)
+        self._unit_meta_cache = MappingProxyType(snapshot)
+        self._unit_meta_version += 1
+        logger.debug(f"Cached unit metadata for {unit_row.unit_id} (snapshot version {self._unit_meta_version})")
+        self._track_unknown_unit(unit_row.unit_id)
+        self._reclassify_unit_status(unit_row.unit_id)
+
+    async def load_all_unit_metadata_from_db(self) -> bool:
+        """Replace the metadata snapshot with every unit row from the database"""
+        try:
+            async for session in get_session():
+                result = await session.execute(select(UnitDB))
+                units = result.scalars().all()
+                self._unit_meta_cache = MappingProxyType({
+                    unit_row.unit_id: self._metadata_from_row(unit_row) for unit_row in units
+                })
+                self._unit_meta_version += 1
+                self._unit_meta_loaded = True
+                self._track_unknown_units()
+                logger.info(f"Loaded metadata snapshot for {len(units)} units (version {self._unit_meta_version})")
+                return True
+        except Exception as e:
+            logger.error(f"Error loading unit metadata snapshot from DB: {e}")
+            return False
 
-    async def refresh_unit_metadata_from_db(self, unit_id: str) -> Optional[Dict]:
+    async def ensure_unit_metadata_loaded(self):
+        """Load the metadata snapshot on first use"""
+        if not self._unit_meta_loaded:
+            if not await self.load_all_unit_metadata_from_db():
+                raise RuntimeError("Unit metadata snapshot is not available")
+
+    async def refresh_unit_metadata_from_db(self, unit_id: str) -> Optional[Mapping]:
         """Refresh metadata for a unit from the database and return it"""
         try:
             async for session in get_session():
@@ -271,13 +501,47 @@ class MQTTCacheManager:
             logger.error(f"Error refreshing unit metadata from DB for {unit_id}: {e}")
             return None
 
-    def get_unit_metadata(self, unit_id: str) -> Optional[Dict]:
+    def get_unit_metadata(self, unit_id: str) -> Optional[Mapping]:
         """Get cached unit metadata; returns None if not cached"""
-        return self._unit_meta_cache.get(unit_id)
+        meta = self._unit_meta_cache.get(unit_id)
+        CACHE_LOOKUPS.inc(cache="unit_metadata", result="miss" if meta is None else "hit")
+        return meta
+
+    def get_all_unit_metadata(self) -> Mapping[str, Mapping]:
+        """Return the current (immutable) metadata snapshot"""
+        return self._unit_meta_cache
 
-    def get_all_unit_metadata(self) -> Dict[str, Dict]:
-        """Return a copy of all cached unit metadata"""
-        return self._unit_meta_cache.copy()
+    def get_unit_metadata_version(self) -> int:
+        """Version of the metadata snapshot; bumped on every update"""
+        return self._unit_meta_version
+
+    def get_unit_metadata_fingerprint(self) -> str:
+        """
+        Digest of the snapshot contents. Unlike the version, which counts
+        updates in this process, it is the same in every worker holding the
+        same unit rows, so it can go into ETags.
+        """
+        version, digest = self._unit_meta_fingerprint
+        if version != self._unit_meta_version:
+            rows = [
+                [unit_id] + [str(value) for key, value in sorted(meta.items()) if key != "last_refreshed"]
+                for unit_id, meta in sorted(self._unit_meta_cache.items())
+            ]
+            digest = hashlib.sha1(json.dumps(rows).encode("utf-8")).hexdigest()
+            self._unit_meta_fingerprint = (self._unit_meta_version, digest)
+        return digest
+
+    def get_serialized_snapshot(self, key: str, build_payload: Callable[[Mapping[str, Mapping]], Dict]) -> bytes:
+        """
+        Get a JSON response body built from the metadata snapshot.
+        The body is cached per key and only rebuilt after the snapshot version changes.
+        """
+        cached = self._serialized_snapshots.get(key)
+        if cached and cached[0] == self._unit_meta_version:
+            return cached[1]
+        body = json.dumps(build_payload(self._unit_meta_cache), separators=(",", ":")).encode("utf-8")
+        self._serialized_snapshots[key] = (self._unit_meta_version, body)
+        return body
     
     def get_all_latest_sensor_data(self) -> Dict[str, Dict]:
         """Get all cached latest sensor data for all units"""
@@ -295,10 +559,23 @@ class MQTTCacheManager:
             if unit_id in self._latest_sensor_data_cache:
                 del self._latest_sensor_data_cache[unit_id]
                 logger.info(f"Cleared latest sensor data cache for unit {unit_id}")
+            self._remove_unit_status(unit_id)
+            # A unit still in the snapshot stays in the fleet, as not reported yet
+            if unit_id in self._unit_meta_cache:
+                self._track_unknown_unit(unit_id)
+            if self._stale_monitor is not None:
+                self._stale_monitor.forget_unit(unit_id)
         else:
             self._normal_values_cache.clear()
             self._first_readings_cache.clear()
             self._latest_sensor_data_cache.clear()
+            self._unit_status_cache.clear()
+            self._fleet_status_counts = {status: 0 for status in FLEET_STATUSES}
+            if self._shared_state is not None:
+                self._shared_state.clear()
+            if self._stale_monitor is not None:
+                self._stale_monitor.forget_all()
+            self._track_unknown_units()
             logger.info("Cleared all cache")
     
     def get_cache_stats(self) -> Dict:
@@ -307,6 +584,7 @@ class MQTTCacheManager:
         units_with_normal = len([u for u in self._normal_values_cache.values() if u.get("has_normal", False)])
         units_collecting_readings = len(self._first_readings_cache)
         units_with_sensor_data = len(self._latest_sensor_data_cache)
+        lookups = self._normal_hits + self._normal_misses
         
         return {
             "total_cached_units": total_units,
@@ -315,7 +593,9 @@ class MQTTCacheManager:
             "units_collecting_first_readings": units_collecting_readings,
             "units_with_latest_sensor_data": units_with_sensor_data,
             "normal_calculation_readings_required": self.NORMAL_CALCULATION_READINGS,
-            "cache_hit_ratio": units_with_normal / total_units if total_units > 0 else 0,
+            "normal_value_coverage": units_with_normal / total_units if total_units > 0 else 0,
+            "normal_value_lookups": {"hits": self._normal_hits, "misses": self._normal_misses},
+            "cache_hit_ratio": self._normal_hits / lookups if lookups > 0 else 0,
             "first_readings_details": {
                 unit_id: {
                     "collected_readings": data["count"],
@@ -325,5 +605,23 @@ class MQTTCacheManager:
             }
         }
 
+    async def apply_normal_value_change(self, unit_id: str, normal_level: Optional[float]):
+        """Another process set a unit's normal value: take it over and refresh that unit's row"""
+        self._first_readings_cache.pop(unit_id, None)
+        if normal_level is None:
+            self.mark_unit_no_normal(unit_id)
+        else:
+            self.set_cached_normal_value(unit_id, normal_level)
+            self._reclassify_unit_status(unit_id)
+        await self.refresh_unit_metadata_from_db(unit_id)
+
 # Create singleton instance
 mqtt_cache_manager = MQTTCacheManager()
+
+# Follow unit changes made by other processes, one unit at a time
+cache_events.subscribe("unit", lambda event: mqtt_cache_manager.refresh_unit_metadata_from_db(event["unit_id"]))
+cache_events.subscribe(
+    "normal_value",
+    lambda event: mqtt_cache_manager.apply_normal_value_change(event["unit_id"], event.get("normal_level"))
+)
+cache_events.on_resync(lambda event: mqtt_cache_manager.load_all_unit_metadata_from_db())
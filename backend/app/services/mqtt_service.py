@@ -3,16 +3,36 @@ import asyncio
 import json
 import logging
 from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Union
 from app.core.config import settings
+from app.core.metrics import (
+    INGEST_FANOUT_MESSAGES, INGEST_NOT_OWNED, INGEST_STAGE_SECONDS, MQTT_MESSAGE_ERRORS, MQTT_MESSAGE_RATE, MQTT_MESSAGES
+)
 from app.db.sessions import get_session
 from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.services.ingest_sharding import ingest_sharding
 from app.services.mqtt_cache_manager import mqtt_cache_manager
+from app.services.sensor_protocol import MissingUnitIdError, extract_reading_fields
+from app.services.stale_sensor_monitor import stale_sensor_monitor
+from app.services.topic_router import MessageContext, TopicRouter
+from app.services.traffic_recorder import traffic_recorder
 
 logger = logging.getLogger(__name__)
 
+# Metric label for messages on topics no route handles
+UNROUTED = "unrouted"
+
 class MQTTService:
     def __init__(self):
-        self.client = MQTTClient(settings.MQTT_CLIENT_ID)
+        # Handle sensor readings here; with INGEST_MODE=process only the ingest process does
+        self._ingest_readings = settings.INGEST_MODE != "process"
+        # Exchange processed readings and alerts with other processes over the fan-out topic
+        self._fanout = ingest_sharding.enabled or settings.INGEST_MODE == "process"
+        client_id = settings.MQTT_CLIENT_ID
+        if self._fanout:
+            # Workers must not share an MQTT client id or the broker drops the older session
+            client_id = f"{client_id}-{ingest_sharding.worker_id}"
+        self.client = MQTTClient(client_id)
         self.is_connected = False
         self._websocket_service = None
         self._reconnect_attempts = 0
@@ -20,11 +40,34 @@ class MQTTService:
         self._reconnect_delay = 5  # seconds
         self._last_save_times = {}  # Track last save time per unit
         self._save_interval = 30  # Save interval in seconds (2 minutes)
+        self._clock: Optional[Callable[[], datetime]] = None  # Time source override used by replays
+
+        # Topic filter -> decoder and handler pipeline; register more routes before connecting
+        self.router = TopicRouter()
+        for topic in settings.MQTT_SENSOR_TOPICS:
+            # Gateways forward JSON messages, JSON arrays of them, or the sensors' binary frames
+            self.router.add(topic, self._route_reading, decoder="sensor")
 
     def set_websocket_service(self, ws_service):
         """Set websocket service to avoid circular import"""
         self._websocket_service = ws_service
 
+    def enable_ingest(self):
+        """Subscribe to the sensor topics even with INGEST_MODE=process (used by the ingest process)"""
+        self._ingest_readings = True
+
+    def set_clock(self, clock: Optional[Callable[[], datetime]]):
+        """
+        Take arrival times from clock instead of the wall clock (None restores it).
+        Replays use this so timestamps, save intervals, stale deadlines and
+        stored recorded_at follow the captured traffic.
+        """
+        self._clock = clock
+        stale_sensor_monitor.set_clock(clock)
+
+    def _now(self) -> datetime:
+        return self._clock() if self._clock is not None else datetime.now()
+
     async def connect(self):
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
@@ -52,36 +95,107 @@ class MQTTService:
         self._reconnect_attempts = 0
         logger.info("MQTT connected successfully")
         
-        for topic in settings.MQTT_TOPICS:
+        if self._ingest_readings:
+            self.router.compile()
+            for topic in settings.MQTT_TOPICS:
+                topic = ingest_sharding.subscription_topic(topic)
+                client.subscribe(topic)
+                logger.info(f"Subscribed to: {topic}")
+
+        if self._fanout:
+            # Readings and alerts from the other processes, for this process's WebSocket clients
+            client.subscribe(f"{ingest_sharding.fanout_topic}/+")
+            logger.info(f"Subscribed to fan-out: {ingest_sharding.fanout_topic}/+")
+
+        if self._ingest_readings and ingest_sharding.mode == "shared" and ingest_sharding.worker_index is not None:
+            # Readings for our units that the broker handed to other workers
+            topic = ingest_sharding.shard_topic(ingest_sharding.worker_index)
             client.subscribe(topic)
-            logger.info(f"Subscribed to: {topic}")
+            logger.info(f"Subscribed to shard: {topic}")
 
     def _on_message(self, client, topic, payload, qos, properties):
-        try:
-            message = payload.decode('utf-8')
-            
-            if topic == "lora/water_lavel":
-                # Create task without waiting to avoid blocking
-                asyncio.create_task(self._handle_distance(message))
-                
-        except Exception as e:
-            logger.error(f"Error processing message: {e}")
+        if self._fanout and topic.startswith(ingest_sharding.fanout_topic + "/"):
+            if ingest_sharding.worker_index is not None and topic == ingest_sharding.shard_topic(ingest_sharding.worker_index):
+                INGEST_FANOUT_MESSAGES.inc(direction="forwarded_in")
+                asyncio.create_task(self._handle_forwarded(payload))
+                return
+            # Our own publications come back too; the topic ends with the origin worker id
+            if topic[len(ingest_sharding.fanout_topic) + 1:] != ingest_sharding.worker_id:
+                INGEST_FANOUT_MESSAGES.inc(direction="received")
+                asyncio.create_task(self._handle_fanout(payload))
+            return
+        if traffic_recorder.is_recording:
+            traffic_recorder.record(topic, payload)
+        received_at = self._now()
+        routes = self.router.resolve(topic)
+        if not routes:
+            # One fixed label: topics carry unit ids and gateway names, so they are unbounded
+            MQTT_MESSAGES.inc(route=UNROUTED)
+            MQTT_MESSAGE_RATE.mark(route=UNROUTED)
+            MQTT_MESSAGE_ERRORS.inc(reason="unrouted")
+            return
+        for route, params in routes:
+            MQTT_MESSAGES.inc(route=route.topic_filter)
+            MQTT_MESSAGE_RATE.mark(route=route.topic_filter)
+            try:
+                with INGEST_STAGE_SECONDS.time(stage="decode"):
+                    messages = route.decoder(payload)
+            except json.JSONDecodeError as e:
+                MQTT_MESSAGE_ERRORS.inc(reason="invalid_json")
+                logger.error(f"Invalid JSON format on {topic}: {payload[:200]!r} - {e}")
+                continue
+            except Exception as e:
+                MQTT_MESSAGE_ERRORS.inc(reason="decode")
+                logger.error(f"Error decoding message on {topic}: {e}")
+                continue
+            context = MessageContext(topic, params, received_at)
+            for message in messages:
+                try:
+                    for step in route.steps:
+                        message = step(message, context)
+                        if message is None:
+                            break
+                    else:
+                        # Create task without waiting to avoid blocking
+                        asyncio.create_task(route.handler(message, context))
+                except Exception as e:
+                    MQTT_MESSAGE_ERRORS.inc(reason="error")
+                    logger.error(f"Error processing message on {topic}: {e}")
+
+    def _route_reading(self, message: Dict, context: MessageContext):
+        return self._handle_distance(message, context.received_at)
 
-    async def _handle_distance(self, message: str):
+    async def _handle_distance(self, message: Union[str, Dict], received_at: Optional[datetime] = None):
+        """Handle one reading, given as the JSON message or as already decoded fields"""
+        received_at = received_at or self._now()
+        stage = INGEST_STAGE_SECONDS.time
         try:
-            # Parse JSON message
-            data = json.loads(message)
-            
-            unit_id = data.get("i") 
-            height = float(data.get("d", 0))
-            temperature = float(data.get("t", 0))
-            battery = float(data.get("b", 0))
-            rssi = float(data.get("rssi", 0))
-            snr = float(data.get("snr", 0))
-            time = datetime.now().isoformat()
+            with stage(stage="parse"):
+                # Parse JSON message
+                data = json.loads(message) if isinstance(message, str) else message
+                unit_id, height, temperature, battery, rssi, snr = extract_reading_fields(data)
+                time = received_at.isoformat()
+
+            # Another worker owns this unit. In hash mode it received the reading too;
+            # in shared mode the broker gave it to us alone, so pass it on
+            if not ingest_sharding.owns(unit_id):
+                if ingest_sharding.mode == "shared":
+                    self.forward_reading(unit_id, data, received_at)
+                else:
+                    INGEST_NOT_OWNED.inc()
+                return
+
+            # Save to database only if enough time has passed (non-blocking). Decided before the
+            # first await, so the saved readings follow arrival order however tasks interleave.
+            if self._should_save_measurement(unit_id, received_at):
+                # recorded_at is left to the database unless a replay supplies the time
+                recorded_at = received_at if self._clock is not None else None
+                asyncio.create_task(self._save_measurement(unit_id, height, temperature, battery, rssi, snr, recorded_at))
+                self._last_save_times[unit_id] = received_at
 
             # Get normal value using optimized cache logic
-            normal_value = await mqtt_cache_manager.get_or_calculate_normal_value(unit_id, height)
+            with stage(stage="normal_lookup"):
+                normal_value = await mqtt_cache_manager.get_or_calculate_normal_value(unit_id, height)
 
             # Update latest sensor data cache
             mqtt_cache_manager.update_latest_sensor_data(
@@ -94,40 +208,25 @@ class MQTTService:
             )
 
             # Determine alert status by comparing height (cm) against thresholds
-            # Thresholds are stored in meters in cache/database; convert to cm for comparison
-            try:
+            with stage(stage="metadata_lookup"):
                 meta = mqtt_cache_manager.get_unit_metadata(unit_id)
                 if not meta:
                     meta = await mqtt_cache_manager.refresh_unit_metadata_from_db(unit_id)
+            with stage(stage="classify"):
+                status = mqtt_cache_manager.classify_status(height, normal_value, meta)
 
-                if meta:
-                    warning_m = meta.get("warning")
-                    high_m = meta.get("high")
-                    critical_m = meta.get("critical")
-                else:
-                    # Metadata missing; will fall back to safe defaults below
-                    warning_m = high_m = critical_m = None
-
-                # Convert meters to centimeters for comparison. If a threshold is missing, set to a very large value so it won't trigger.
-                warning_cm = (float(warning_m) * 100) if (warning_m is not None) else float('inf')
-                high_cm = (float(high_m) * 100) if (high_m is not None) else float('inf')
-                critical_cm = (float(critical_m) * 100) if (critical_m is not None) else float('inf')
-
-            except Exception:
-                # On any error, default thresholds to infinity (no alerts)
-                warning_cm = high_cm = critical_cm = float('inf')
-
-            current_water_level_Difference = abs(height - normal_value)
-
-            # Determine status: height is in cm
-            if current_water_level_Difference < warning_cm:
-                status = "normal"
-            elif current_water_level_Difference < high_cm:
-                status = "warning"
-            elif current_water_level_Difference < critical_cm:
-                status = "high"
-            else:
-                status = "critical"
+                # Keep live fleet counters in step with this reading
+                previous_status = mqtt_cache_manager.update_unit_status(unit_id, status, distance=height, normal_level=normal_value)
+
+            # Re-arm the unit's report deadline
+            stale_sensor_monitor.record_reading(unit_id, received_at.timestamp())
+            if previous_status == "stale" and self._websocket_service:
+                await self._websocket_service.broadcast_alert_data({
+                    "type": "unit_recovered",
+                    "unit_id": unit_id,
+                    "status": status,
+                    "time": time
+                })
 
             # Calculate water level relative to normal
             # You can modify this calculation based on your requirements
@@ -145,52 +244,153 @@ class MQTTService:
                 "time": time
             }
 
-            # Save to database only if enough time has passed (non-blocking)
-            if self._should_save_measurement(unit_id):
-                asyncio.create_task(self._save_measurement(unit_id, height, temperature, battery, rssi, snr))
-                self._last_save_times[unit_id] = datetime.now()
-            
             # Broadcast via WebSocket if service is available (always broadcast for real-time updates)
             if self._websocket_service:
-                await self._websocket_service.broadcast_distance_data(result)
+                with stage(stage="broadcast"):
+                    await self._websocket_service.broadcast_distance_data(result)
             else:
                 logger.warning("WebSocket service not available for broadcasting")
+
+            if self._fanout:
+                self.publish_fanout({
+                    "reading": {
+                        "unit_id": unit_id,
+                        "distance": height,
+                        "temperature": temperature,
+                        "battery": battery,
+                        "rssi": rssi,
+                        "snr": snr,
+                        "status": status,
+                        "normal_level": normal_value
+                    },
+                    "result": result
+                })
                 
         except json.JSONDecodeError as e:
+            MQTT_MESSAGE_ERRORS.inc(reason="invalid_json")
             logger.error(f"Invalid JSON format: {message} - {e}")
                 
+        except MissingUnitIdError as e:
+            # Rejected before the ownership check, which hashes the unit id
+            MQTT_MESSAGE_ERRORS.inc(reason="decode")
+            logger.error(f"Dropping reading: {e}: {message}")
+
         except ValueError as e:
+            MQTT_MESSAGE_ERRORS.inc(reason="invalid_values")
             logger.error(f"Invalid numeric values in JSON: {message} - {e}")
         except Exception as e:
+            MQTT_MESSAGE_ERRORS.inc(reason="error")
             logger.error(f"Error handling distance message: {e}")
 
-    def _should_save_measurement(self, unit_id: str) -> bool:
+    def publish_fanout(self, message: Dict):
+        """Forward a processed reading ({"reading", "result"}) or an alert ({"alert"}) to the other processes"""
+        try:
+            self.client.publish(f"{ingest_sharding.fanout_topic}/{ingest_sharding.worker_id}", json.dumps(message), qos=0)
+            INGEST_FANOUT_MESSAGES.inc(direction="sent")
+        except Exception as e:
+            logger.error(f"Failed to publish fan-out message: {e}")
+
+    def forward_reading(self, unit_id: str, message: Dict, received_at: datetime):
+        """Send a decoded reading to the worker owning the unit's shard (shared mode)"""
+        try:
+            self.client.publish(
+                ingest_sharding.shard_topic(ingest_sharding.shard_of(unit_id)),
+                json.dumps({"message": message, "received_at": received_at.isoformat()}),
+                qos=1
+            )
+            INGEST_FANOUT_MESSAGES.inc(direction="forwarded_out")
+        except Exception as e:
+            logger.error(f"Failed to forward reading for unit {unit_id}: {e}")
+
+    async def _handle_forwarded(self, payload: bytes):
+        """Handle a reading another worker received for one of our units, as if it had arrived here"""
+        try:
+            forwarded = json.loads(payload)
+            message, received_at = forwarded["message"], datetime.fromisoformat(forwarded["received_at"])
+        except (ValueError, KeyError, TypeError) as e:
+            MQTT_MESSAGE_ERRORS.inc(reason="invalid_json")
+            logger.error(f"Invalid forwarded reading: {payload[:200]!r} - {e}")
+            return
+        await self._handle_distance(message, received_at)
+
+    async def _handle_fanout(self, payload: bytes):
+        """
+        Apply a reading another process handled and broadcast it to this
+        process's WebSocket clients. Ingesting workers also update their live
+        caches and stale monitor; API workers behind a separate ingest process
+        read that state from the shared table instead. Nothing is saved; the
+        owning process did that.
+        """
+        try:
+            message = json.loads(payload)
+            alert = message.get("alert")
+            if alert is not None:
+                if self._websocket_service:
+                    await self._websocket_service.broadcast_alert_data(alert)
+                return
+            if not self._ingest_readings:
+                if self._websocket_service:
+                    await self._websocket_service.broadcast_distance_data(message["result"])
+                return
+
+            reading = message["reading"]
+            unit_id = reading["unit_id"]
+            mqtt_cache_manager.update_latest_sensor_data(
+                unit_id=unit_id,
+                distance=reading["distance"],
+                temperature=reading["temperature"],
+                battery=reading["battery"],
+                rssi=reading["rssi"],
+                snr=reading["snr"]
+            )
+            previous_status = mqtt_cache_manager.update_unit_status(
+                unit_id, reading["status"], distance=reading["distance"], normal_level=reading["normal_level"]
+            )
+            stale_sensor_monitor.record_reading(unit_id)
+            if self._websocket_service:
+                if previous_status == "stale":
+                    await self._websocket_service.broadcast_alert_data({
+                        "type": "unit_recovered",
+                        "unit_id": unit_id,
+                        "status": reading["status"],
+                        "time": message["result"]["time"]
+                    })
+                await self._websocket_service.broadcast_distance_data(message["result"])
+        except Exception as e:
+            MQTT_MESSAGE_ERRORS.inc(reason="fanout")
+            logger.error(f"Error handling fan-out message: {e}")
+
+    def _should_save_measurement(self, unit_id: str, now: Optional[datetime] = None) -> bool:
         """Check if enough time has passed since last save for this unit"""
         last_save = self._last_save_times.get(unit_id)
         if last_save is None:
             # First time saving for this unit
             return True
         
-        time_since_last_save = (datetime.now() - last_save).total_seconds()
+        time_since_last_save = ((now or self._now()) - last_save).total_seconds()
         return time_since_last_save >= self._save_interval
 
     async def _save_measurement(self, unit_id: str, height: float, temperature: float, 
-                              battery: float, rssi: float, snr: float):
+                              battery: float, rssi: float, snr: float, recorded_at: Optional[datetime] = None):
         """Save sensor measurement to database"""
         try:
-            async for session in get_session():
-                measurement = SensorMeasurementDB(
-                    unit_id=unit_id,
-                    height=height,
-                    temperature=temperature,
-                    battery=battery,
-                    rssi=rssi,
-                    snr=snr
-                )
-                session.add(measurement)
-                await session.commit()
-                break  # Exit the async generator after successful commit
+            with INGEST_STAGE_SECONDS.time(stage="persist"):
+                async for session in get_session():
+                    measurement = SensorMeasurementDB(
+                        unit_id=unit_id,
+                        height=height,
+                        temperature=temperature,
+                        battery=battery,
+                        rssi=rssi,
+                        snr=snr
+                    )
+                    if recorded_at is not None:
+                        measurement.recorded_at = recorded_at
+                    session.add(measurement)
+                    await session.commit()
+                    break  # Exit the async generator after successful commit
         except Exception as e:
+            MQTT_MESSAGE_ERRORS.inc(reason="persist")
             logger.error(f"Failed to save measurement: {e}")
 
     def _on_disconnect(self, client, packet, exc=None):
@@ -0,0 +1,173 @@
+from datetime import date, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select
+from typing import Dict, List, Optional, Sequence
+import logging
+
+from app.db.upsert import upsert
+from app.models.database.daily_averages import DailyAverageDB
+from app.models.database.period_averages import PeriodAverageDB
+from app.services.quantile_sketch import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+# Rollup levels, finest first, with their nominal length in days
+PERIOD_DAYS = {"week": 7, "month": 30.44, "year": 365.25}
+
+AVERAGED_FIELDS = ["avg_height", "avg_temperature", "avg_battery", "avg_rssi", "avg_snr"]
+
+PERIOD_FIELDS = AVERAGED_FIELDS + [
+    "min_height", "max_height", "p10_height", "p50_height", "p90_height", "height_sketch",
+    "measurement_count", "day_count"
+]
+
+
+def period_start(day: date, period: str) -> date:
+    """First day of the week (Monday), month or year containing day"""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def period_end(start: date, period: str) -> date:
+    """First day of the following period"""
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return date(start.year + 1, 1, 1)
+
+
+def choose_period(range_days: int, max_points: Optional[int]) -> Optional[str]:
+    """Coarsest rollup whose periods are still no longer than one requested point, or None for daily data"""
+    if not max_points:
+        return None
+    chosen = None
+    for period, days in PERIOD_DAYS.items():
+        if days <= range_days / max_points:
+            chosen = period
+    return chosen
+
+
+def aggregate_days(days: Sequence[DailyAverageDB]) -> Dict:
+    """
+    Combine daily rows into one period row. Averages are weighted by each
+    day's measurement_count; days without measurements (stored as zeros) are
+    left out of the averages and of min/max. Percentiles come from merging the
+    daily height sketches; days computed before sketches existed are skipped.
+    """
+    measured = [day for day in days if day.measurement_count]
+    total = sum(day.measurement_count for day in measured)
+    values = {"measurement_count": total, "day_count": len(days)}
+    for field in AVERAGED_FIELDS:
+        values[field] = (
+            sum((getattr(day, field) or 0.0) * day.measurement_count for day in measured) / total
+            if total else 0.0
+        )
+    values["min_height"] = min((day.min_height for day in measured), default=0.0)
+    values["max_height"] = max((day.max_height for day in measured), default=0.0)
+
+    sketch = QuantileSketch()
+    for day in measured:
+        if day.height_sketch:
+            sketch.merge(QuantileSketch.from_bytes(day.height_sketch))
+    values["p10_height"] = sketch.quantile(0.1)
+    values["p50_height"] = sketch.quantile(0.5)
+    values["p90_height"] = sketch.quantile(0.9)
+    values["height_sketch"] = sketch.to_bytes() if sketch.count else None
+    return values
+
+
+class PeriodAveragesService:
+    """
+    Maintain period_averages (week / month / year) from daily_averages.
+
+    Rollups are derived from the daily rows, never from raw measurements, so a
+    refresh only reads at most a year of daily rows for one unit.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _get_daily_rows(self, unit_id: str, start: date, end: date) -> List[DailyAverageDB]:
+        result = await self.db.execute(
+            select(DailyAverageDB)
+            .filter(
+                and_(
+                    DailyAverageDB.unit_id == unit_id,
+                    DailyAverageDB.date >= start,
+                    DailyAverageDB.date < end
+                )
+            )
+            .order_by(DailyAverageDB.date)
+        )
+        return result.scalars().all()
+
+    async def _write_periods(self, unit_id: str, rows: List[Dict]):
+        if rows:
+            for row in rows:
+                row["unit_id"] = unit_id
+            await self.db.execute(upsert(
+                self.db, PeriodAverageDB, rows, ["unit_id", "period", "period_start"], PERIOD_FIELDS
+            ))
+        await self.db.commit()
+
+    async def refresh_periods_for_date(self, unit_id: str, target_date: date) -> bool:
+        """Recompute the week, month and year containing target_date after its daily row changed"""
+        try:
+            bounds = {}
+            for period in PERIOD_DAYS:
+                start = period_start(target_date, period)
+                bounds[period] = (start, period_end(start, period))
+
+            # One read covers all three periods (a week may straddle the year boundary)
+            days = await self._get_daily_rows(
+                unit_id,
+                min(start for start, _ in bounds.values()),
+                max(end for _, end in bounds.values())
+            )
+
+            rows = []
+            for period, (start, end) in bounds.items():
+                in_period = [day for day in days if start <= day.date < end]
+                if in_period:
+                    rows.append({"period": period, "period_start": start, **aggregate_days(in_period)})
+            await self._write_periods(unit_id, rows)
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing period averages for unit {unit_id} around {target_date}: {str(e)}")
+            await self.db.rollback()
+            return False
+
+    async def rebuild_unit(self, unit_id: str) -> int:
+        """Recompute every period of a unit from all of its daily rows; returns rows written"""
+        try:
+            days = await self._get_daily_rows(unit_id, date.min, date.max)
+            grouped: Dict[tuple, List[DailyAverageDB]] = {}
+            for day in days:
+                for period in PERIOD_DAYS:
+                    grouped.setdefault((period, period_start(day.date, period)), []).append(day)
+
+            rows = [
+                {"period": period, "period_start": start, **aggregate_days(in_period)}
+                for (period, start), in_period in grouped.items()
+            ]
+            # Chunked to keep the bind parameter count bounded
+            for offset in range(0, len(rows), 1000):
+                await self._write_periods(unit_id, rows[offset:offset + 1000])
+            logger.info(f"Rebuilt {len(rows)} period averages for unit {unit_id}")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error rebuilding period averages for unit {unit_id}: {str(e)}")
+            await self.db.rollback()
+            return 0
+
+    async def rebuild_missing_units(self, unit_ids: Sequence[str]) -> Dict[str, int]:
+        """Rebuild units that have daily rows but no period rows yet (first start after upgrading)"""
+        result = await self.db.execute(
+            select(PeriodAverageDB.unit_id).where(PeriodAverageDB.unit_id.in_(list(unit_ids))).distinct()
+        )
+        present = set(result.scalars().all())
+        return {unit_id: await self.rebuild_unit(unit_id) for unit_id in unit_ids if unit_id not in present}
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import EVENT_LOOP_BLOCKS, EVENT_LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Collapsed stack files use ';' between frames and a space before the count
+    filename = os.path.basename(code.co_filename).replace(";", ":")
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name.replace(";", ":").replace(" ", "_"))
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the running process.
+
+    A background thread snapshots the stack of every other thread at a fixed
+    interval (sys._current_frames) and counts identical stacks. Nothing is
+    traced, so the cost is one stack walk per thread per sample whether the
+    profiler is attached to an idle or a busy process. The result is in the
+    collapsed format read by flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, max_seconds: float):
+        self._max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._interval = 0.0
+        self._started_at: Optional[float] = None
+        self._stopped_at: Optional[float] = None
+        self._deadline: Optional[float] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float = 0.01):
+        """Sample for the given number of seconds; raises RuntimeError if a run is in progress"""
+        if seconds <= 0 or seconds > self._max_seconds:
+            raise ValueError(f"seconds must be between 0 and {self._max_seconds}")
+        if interval < 0.001:
+            raise ValueError("interval must be at least 1 ms")
+        with self._lock:
+            if self.is_running:
+                raise RuntimeError("Profiler is already running")
+            self._stacks = Counter()
+            self._samples = 0
+            self._interval = interval
+            self._started_at = time.time()
+            self._stopped_at = None
+            self._deadline = time.monotonic() + seconds
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started for {seconds}s at {interval * 1000:.0f} ms intervals")
+
+    async def stop(self):
+        """Stop the current run early; the samples collected so far are kept"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None:
+            # The sampler may be mid-sample; wait for it off the event loop
+            await asyncio.to_thread(thread.join)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.is_set() and time.monotonic() < self._deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    self._stacks[_collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+                self._samples += 1
+            del frames
+            self._stop_event.wait(self._interval)
+        self._stopped_at = time.time()
+        logger.info(f"Sampling profiler finished with {self._samples} samples")
+
+    def get_collapsed(self) -> str:
+        """Samples so far as collapsed stacks: 'frame;frame;frame count' per line"""
+        with self._lock:
+            items = sorted(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {
+                "running": self.is_running,
+                "started_at": self._started_at,
+                "stopped_at": self._stopped_at,
+                "interval_ms": round(self._interval * 1000, 3),
+                "samples": self._samples,
+                "distinct_stacks": len(self._stacks),
+                "max_seconds": self._max_seconds
+            }
+
+
+class LoopBlockMonitor:
+    """
+    Detect callbacks that block the asyncio event loop.
+
+    A heartbeat coroutine wakes up every check interval and records how late it
+    was. A watchdog thread checks that the heartbeat keeps moving; once the loop
+    has been stuck longer than the threshold it captures the loop thread's
+    stack, which shows the code that is blocking it while it is still running.
+    Unlike asyncio debug mode this adds no per-callback overhead.
+    """
+
+    def __init__(self, threshold: float, check_interval: float = 0.05, history: int = 50):
+        self._threshold = threshold
+        self._check_interval = min(check_interval, threshold / 2) if threshold > 0 else check_interval
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        # Structure: deque of {"detected_at": float, "blocked_ms": float, "stack": str}
+        self._blocks: Deque[Dict] = deque(maxlen=history)
+        self._max_lag = 0.0
+
+    def start(self):
+        """Start monitoring the running event loop (call from within the loop)"""
+        if self._threshold <= 0 or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-block-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop block monitor started (threshold {self._threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self._check_interval
+            await asyncio.sleep(self._check_interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            self._max_lag = max(self._max_lag, lag)
+            if lag > self._threshold and self._blocks and self._reported_beat == self._last_beat:
+                # The watchdog caught this stall; record how long it lasted in the end
+                self._blocks[-1]["blocked_ms"] = round(lag * 1000, 1)
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+            self._last_beat = now
+
+    def _watch(self):
+        while not self._stop_event.wait(self._check_interval):
+            beat = self._last_beat
+            # The heartbeat itself sleeps for one check interval between beats
+            stalled = time.monotonic() - beat - self._check_interval
+            if stalled <= self._threshold or self._reported_beat == beat:
+                continue
+            # Report each stall once, with the stack that is holding the loop
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            del frame
+            EVENT_LOOP_BLOCKS.inc()
+            self._blocks.append({
+                "detected_at": time.time(),
+                "blocked_ms": round(stalled * 1000, 1),
+                "stack": stack
+            })
+            logger.warning(f"Event loop blocked for over {stalled * 1000:.0f} ms, currently in:\n{stack}")
+
+    def get_recent_blocks(self) -> List[Dict]:
+        return list(self._blocks)
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self._threshold > 0,
+            "running": self._task is not None,
+            "threshold_ms": round(self._threshold * 1000, 1),
+            "blocks_detected": int(EVENT_LOOP_BLOCKS.get()),
+            "max_lag_ms": round(self._max_lag * 1000, 1)
+        }
+
+# Create singleton instances
+sampling_profiler = SamplingProfiler(max_seconds=settings.PROFILER_MAX_SECONDS)
+loop_block_monitor = LoopBlockMonitor(threshold=settings.LOOP_BLOCK_THRESHOLD_MS / 1000.0)
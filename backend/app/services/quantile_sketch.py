@@ -0,0 +1,145 @@
+from typing import Dict, Iterable, Optional
+import math
+import struct
+
+# Format version of the serialized sketch
+_VERSION = 1
+
+# Values closer to zero than this share a single bucket
+_MIN_INDEXABLE = 1e-6
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int):
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch (DDSketch).
+
+    Values are counted in logarithmic buckets whose width is chosen so that any
+    reported quantile is within relative_accuracy of the true value. Two
+    sketches with the same accuracy merge exactly by adding bucket counts, so
+    daily sketches combine into weekly, monthly or yearly ones without going
+    back to raw data. A day of readings serializes to a few hundred bytes.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # Structure: {bucket_key: count}, separate stores for positive and negative values
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+
+    def _key(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        # Midpoint (in relative terms) of the bucket (gamma^(key-1), gamma^key]
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        if value > _MIN_INDEXABLE:
+            key = self._key(value)
+            self._positive[key] = self._positive.get(key, 0) + count
+        elif value < -_MIN_INDEXABLE:
+            key = self._key(-value)
+            self._negative[key] = self._negative.get(key, 0) + count
+        else:
+            self._zero_count += count
+        self.count += count
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            if value is not None:
+                self.add(value)
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other._positive.items():
+            self._positive[key] = self._positive.get(key, 0) + count
+        for key, count in other._negative.items():
+            self._negative[key] = self._negative.get(key, 0) + count
+        self._zero_count += other._zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0..1), or None for an empty sketch"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+
+        seen = 0
+        # Negative values in ascending order: largest magnitude first
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self._zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self._positive)) if self._positive else 0.0
+
+    def to_bytes(self) -> bytes:
+        """Compact encoding: header, then delta-encoded bucket keys and counts as varints"""
+        out = bytearray(struct.pack("<Bf", _VERSION, self.relative_accuracy))
+        _write_varint(out, self._zero_count)
+        for store in (self._positive, self._negative):
+            _write_varint(out, len(store))
+            previous = 0
+            for key in sorted(store):
+                _write_varint(out, _zigzag(key - previous))
+                _write_varint(out, store[key])
+                previous = key
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "QuantileSketch":
+        version, relative_accuracy = struct.unpack_from("<Bf", data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported sketch version {version}")
+        # float32 round trip; keep the nominal accuracy so sketches stay mergeable
+        sketch = cls(round(relative_accuracy, 6))
+        pos = struct.calcsize("<Bf")
+        sketch._zero_count, pos = _read_varint(data, pos)
+        sketch.count = sketch._zero_count
+        for store in (sketch._positive, sketch._negative):
+            size, pos = _read_varint(data, pos)
+            key = 0
+            for _ in range(size):
+                delta, pos = _read_varint(data, pos)
+                count, pos = _read_varint(data, pos)
+                key += _unzigzag(delta)
+                store[key] = count
+                sketch.count += count
+        return sketch
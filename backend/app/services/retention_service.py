@@ -0,0 +1,186 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, select, delete
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from app.core.config import settings
+from app.db.partitions import PARENT_TABLE, detach_partition_by_name, get_month_partitions, is_partitioned
+from app.db.time_buckets import day_bounds, local_date
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.models.database.hourly_averages import HourlyAverageDB
+from app.models.database.daily_averages import DailyAverageDB
+from app.services.hourly_averages_service import as_utc
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """
+    Prune raw sensor measurements older than the retention period.
+
+    A unit's raw rows for a day are only deleted once both rollups account for
+    every one of them: the daily_averages row and the sum of that day's
+    hourly_averages rows must have the same measurement_count as the raw rows.
+    Days that are not confirmed yet are left for a later run. When
+    sensor_measurements is partitioned, whole months past the cutoff whose days
+    are all confirmed are dropped as partitions first; a month with an
+    unconfirmed day waits to be dropped whole. Rows outside the month
+    partitions (the DEFAULT partition) and unpartitioned tables are deleted in
+    bounded batches, each in its own short transaction, so ingest never waits
+    behind one huge DELETE.
+    """
+
+    def __init__(self, db: AsyncSession, retention_days: Optional[int] = None, batch_size: Optional[int] = None):
+        self.db = db
+        self.retention_days = settings.RAW_RETENTION_DAYS if retention_days is None else retention_days
+        self.batch_size = settings.RETENTION_BATCH_SIZE if batch_size is None else batch_size
+
+    async def get_oldest_measurement_date(self) -> Optional[date]:
+        result = await self.db.execute(select(func.min(SensorMeasurementDB.recorded_at)))
+        oldest = as_utc(result.scalar())
+        return None if oldest is None else local_date(oldest)
+
+    async def get_confirmed_units(self, day: date) -> Tuple[List[str], List[str]]:
+        """Split the units with raw rows on a day into (confirmed, unconfirmed) by comparing counts"""
+        start, end = day_bounds(day)
+
+        raw_result = await self.db.execute(
+            select(SensorMeasurementDB.unit_id, func.count(SensorMeasurementDB.id))
+            .filter(and_(SensorMeasurementDB.recorded_at >= start, SensorMeasurementDB.recorded_at < end))
+            .group_by(SensorMeasurementDB.unit_id)
+        )
+        raw_counts = dict(raw_result.all())
+        if not raw_counts:
+            return [], []
+
+        hourly_result = await self.db.execute(
+            select(HourlyAverageDB.unit_id, func.sum(HourlyAverageDB.measurement_count))
+            .filter(and_(HourlyAverageDB.hour_start >= start, HourlyAverageDB.hour_start < end))
+            .group_by(HourlyAverageDB.unit_id)
+        )
+        hourly_counts = dict(hourly_result.all())
+
+        daily_result = await self.db.execute(
+            select(DailyAverageDB.unit_id, DailyAverageDB.measurement_count)
+            .filter(DailyAverageDB.date == day)
+        )
+        daily_counts = dict(daily_result.all())
+
+        confirmed, unconfirmed = [], []
+        for unit_id, raw_count in raw_counts.items():
+            if daily_counts.get(unit_id) == raw_count and hourly_counts.get(unit_id) == raw_count:
+                confirmed.append(unit_id)
+            else:
+                unconfirmed.append(unit_id)
+        return confirmed, unconfirmed
+
+    async def get_unconfirmed_unit_days(self, start: datetime, end: datetime) -> List[Tuple[str, date]]:
+        """(unit_id, day) for every day overlapping [start, end) whose rollups do not account for all its raw rows"""
+        unconfirmed = []
+        day = local_date(start)
+        while day_bounds(day)[0] < end:
+            _, units = await self.get_confirmed_units(day)
+            unconfirmed.extend((unit_id, day) for unit_id in units)
+            day += timedelta(days=1)
+        return unconfirmed
+
+    async def remove_partition(self, name: str, drop: bool = True) -> bool:
+        """
+        Detach (and drop) a month partition of sensor_measurements once the
+        rollups of every day it holds are confirmed; returns False, changing
+        nothing, otherwise. A day cut by the partition bounds (the database
+        session's timezone is not the server's) is deleted whole first, so no
+        partial day is left behind to fail a later check.
+        """
+        bounds = {partition: (start, end) for partition, start, end in await get_month_partitions(self.db)}
+        if name not in bounds:
+            raise ValueError(f"{name} is not a partition of {PARENT_TABLE}")
+        start, end = bounds[name]
+
+        unconfirmed = await self.get_unconfirmed_unit_days(start, end)
+        if unconfirmed:
+            logger.warning(f"Keeping partition {name}: rollups not confirmed for {len(unconfirmed)} unit-days "
+                           f"(first: unit {unconfirmed[0][0]} on {unconfirmed[0][1]})")
+            return False
+
+        for day in sorted({local_date(start), local_date(end - timedelta(microseconds=1))}):
+            day_start, day_end = day_bounds(day)
+            if day_start < start or day_end > end:
+                confirmed, _ = await self.get_confirmed_units(day)
+                for unit_id in confirmed:
+                    await self.delete_unit_day(unit_id, day)
+
+        await detach_partition_by_name(self.db, name, drop=drop)
+        await self.db.commit()
+        return True
+
+    async def prune_partitions(self, cutoff: date) -> int:
+        """Drop month partitions ending by cutoff, oldest first, up to the first one not confirmed"""
+        cutoff_start, _ = day_bounds(cutoff)
+        dropped = 0
+        for name, _, end in await get_month_partitions(self.db):
+            if end > cutoff_start or not await self.remove_partition(name, drop=True):
+                break
+            dropped += 1
+        return dropped
+
+    async def delete_unit_day(self, unit_id: str, day: date) -> int:
+        """Delete one unit's raw rows for a day, batch_size rows per transaction"""
+        start, end = day_bounds(day)
+        in_range = and_(
+            SensorMeasurementDB.unit_id == unit_id,
+            SensorMeasurementDB.recorded_at >= start,
+            SensorMeasurementDB.recorded_at < end
+        )
+
+        deleted = 0
+        while True:
+            batch = select(SensorMeasurementDB.id).filter(in_range).limit(self.batch_size)
+            # Repeat the range on the outer DELETE so PostgreSQL prunes to the day's partition
+            result = await self.db.execute(
+                delete(SensorMeasurementDB)
+                .where(and_(in_range, SensorMeasurementDB.id.in_(batch.scalar_subquery())))
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            deleted += result.rowcount
+            if result.rowcount < self.batch_size:
+                return deleted
+
+    async def prune_raw_measurements(self, today: Optional[date] = None) -> Dict:
+        """Delete confirmed raw rows older than retention_days; does nothing when retention is disabled"""
+        stats = {"dropped_partitions": 0, "deleted_rows": 0, "pruned_unit_days": 0, "unconfirmed_unit_days": 0}
+        if self.retention_days <= 0:
+            return stats
+
+        try:
+            cutoff = (today or date.today()) - timedelta(days=self.retention_days)
+            # Month partitions are only ever dropped whole; rows outside them go by DELETE
+            partitions = []
+            if self.db.bind.dialect.name == "postgresql" and await is_partitioned(self.db):
+                stats["dropped_partitions"] = await self.prune_partitions(cutoff)
+                partitions = await get_month_partitions(self.db)
+            day = await self.get_oldest_measurement_date()
+            while day is not None and day < cutoff:
+                day_start, day_end = day_bounds(day)
+                if any(start < day_end and day_start < end for _, start, end in partitions):
+                    day += timedelta(days=1)
+                    continue
+                confirmed, unconfirmed = await self.get_confirmed_units(day)
+                for unit_id in confirmed:
+                    stats["deleted_rows"] += await self.delete_unit_day(unit_id, day)
+                    stats["pruned_unit_days"] += 1
+                for unit_id in unconfirmed:
+                    logger.warning(f"Keeping raw measurements for unit {unit_id} on {day}: rollups not confirmed")
+                stats["unconfirmed_unit_days"] += len(unconfirmed)
+                day += timedelta(days=1)
+
+            logger.info(f"Retention: dropped {stats['dropped_partitions']} partitions and "
+                        f"deleted {stats['deleted_rows']} raw measurements older than {cutoff} "
+                        f"({stats['pruned_unit_days']} unit-days, {stats['unconfirmed_unit_days']} left unconfirmed)")
+            return stats
+        except Exception as e:
+            logger.error(f"Error pruning raw measurements: {str(e)}")
+            await self.db.rollback()
+            return stats
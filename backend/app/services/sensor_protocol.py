@@ -0,0 +1,74 @@
+import struct
+from typing import Dict, Tuple
+
+# 9-byte binary reading sent by the sensor units (see firmware/README_BinaryProtocol.md):
+# device id (uint16), distance * 100 (uint16), temperature * 100 (int16), battery % (uint8), CRC-16 (uint16)
+BINARY_READING = struct.Struct("<HHhB")
+BINARY_READING_SIZE = BINARY_READING.size + 2
+
+
+def crc16_ccitt(data: bytes, crc: int = 0xFFFF) -> int:
+    """CRC-16 CCITT (polynomial 0x1021, initial value 0xFFFF), as computed by the firmware"""
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return crc
+
+
+def is_binary_reading(payload: bytes) -> bool:
+    """A 9-byte payload whose CRC matches; the first byte alone cannot tell (unit 123 starts with '{')"""
+    if len(payload) != BINARY_READING_SIZE:
+        return False
+    (crc,) = struct.unpack_from("<H", payload, BINARY_READING.size)
+    return crc16_ccitt(payload[:BINARY_READING.size]) == crc
+
+
+def decode_binary_reading(payload: bytes) -> Dict:
+    """
+    Decode a binary reading into the same fields as the JSON message
+    ({"i": "001", "d": 54.32, "t": 26.78, "b": 75}). Raises ValueError if the
+    size or CRC is wrong.
+    """
+    if len(payload) != BINARY_READING_SIZE:
+        raise ValueError(f"Binary reading must be {BINARY_READING_SIZE} bytes, got {len(payload)}")
+    body = payload[:BINARY_READING.size]
+    (crc,) = struct.unpack_from("<H", payload, BINARY_READING.size)
+    if crc16_ccitt(body) != crc:
+        raise ValueError("Binary reading failed CRC check")
+    device_id, distance, temperature, battery = BINARY_READING.unpack(body)
+    return {"i": f"{device_id:03d}", "d": distance / 100, "t": temperature / 100, "b": battery}
+
+
+def encode_binary_reading(unit_id: str, distance: float, temperature: float, battery: float) -> bytes:
+    """Pack a reading the way the sensor firmware does (negative distances clamp to 0)"""
+    body = BINARY_READING.pack(
+        int(unit_id),
+        min(max(int(round(distance * 100)), 0), 0xFFFF),
+        min(max(int(round(temperature * 100)), -0x8000), 0x7FFF),
+        min(max(int(battery), 0), 0xFF)
+    )
+    return body + struct.pack("<H", crc16_ccitt(body))
+
+
+class MissingUnitIdError(ValueError):
+    """A reading without the unit id ("i") field"""
+
+
+def extract_reading_fields(data: Dict) -> Tuple[str, float, float, float, float, float]:
+    """
+    (unit_id, height, temperature, battery, rssi, snr) from a decoded message.
+    Raises MissingUnitIdError without a unit id and ValueError on bad numbers.
+    """
+    unit_id = data.get("i")
+    if unit_id is None or unit_id == "":
+        raise MissingUnitIdError("Reading has no unit id")
+    return (
+        str(unit_id),
+        float(data.get("d", 0)),
+        float(data.get("t", 0)),
+        float(data.get("b", 0)),
+        float(data.get("rssi", 0)),
+        float(data.get("snr", 0))
+    )
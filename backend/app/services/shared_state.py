@@ -0,0 +1,354 @@
+import logging
+import math
+import os
+import struct
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.services.mqtt_cache_manager import mqtt_cache_manager
+
+logger = logging.getLogger(__name__)
+
+# Segment layout: a 64-byte header, then fixed-size unit records.
+# Slots are handed out in arrival order and never move, so readers index
+# the unit ids once and only look at slots added since.
+STATE_MAGIC = b"RVRSTATE"
+STATE_VERSION = 1
+_HEADER = struct.Struct("<8sIIIIId")     # magic, version, capacity, record size, slots used, writer pid, heartbeat
+_HEADER_SIZE = 64
+_SEQ = struct.Struct("<I")                # seqlock counter: odd while the record is being written
+_BODY = struct.Struct("<16s8dBB2x")       # unit id, distance, temperature, battery, rssi, snr, normal level,
+                                          # reading time, status time, status code, has reading
+_RECORD_SIZE = _SEQ.size + _BODY.size     # 88 bytes
+_SLOTS_USED_OFFSET = 20
+_HEARTBEAT_OFFSET = 28
+
+# Status codes; 0 means the unit is not tracked (never classified or removed)
+STATUS_CODES = ("", "normal", "warning", "high", "critical", "stale", "unknown")
+_STATUS_CODE = {status: code for code, status in enumerate(STATUS_CODES)}
+
+_NAN = float("nan")
+
+
+def _float(value) -> float:
+    return _NAN if value is None else float(value)
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    return _NAN if value is None else value.timestamp()
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    """
+    Keep the resource tracker from unlinking the segment when this process
+    exits: readers come and go, and the ingest process reattaches on restart.
+    """
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+
+class SharedStateTable:
+    """
+    Latest per-unit state in a shared memory segment, written by the ingest
+    process and read by the API workers without locks or copies of the data.
+
+    Each record carries a seqlock counter. The single writer makes it odd,
+    writes the record and makes it even again; a reader copies the record
+    and retries if the counter was odd or changed meanwhile. Readers never
+    block the writer and never see a half-written record.
+
+    The writer stamps a heartbeat into the header every second. Readers treat
+    the table as empty once the heartbeat is older than stale_after seconds,
+    so a dead ingest process's last state is not served as live.
+    """
+
+    def __init__(self, name: str, capacity: int, stale_after: float = 5.0):
+        self.name = name
+        self.capacity = capacity
+        self.stale_after = stale_after
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._writer = False
+        # Structure: {unit_id: slot}
+        self._slots: Dict[str, int] = {}
+        self._indexed = 0
+        self._full_logged = False
+        self._stale_logged = False
+
+    # Writer side (ingest process)
+
+    def open_writer(self):
+        """Create the segment, or take over the one a previous ingest process left"""
+        size = _HEADER_SIZE + self.capacity * _RECORD_SIZE
+        try:
+            shm = shared_memory.SharedMemory(self.name)
+            magic, version, capacity, record_size, _, pid, _ = _HEADER.unpack_from(shm.buf, 0)
+            if (magic, version, capacity, record_size) != (STATE_MAGIC, STATE_VERSION, self.capacity, _RECORD_SIZE):
+                logger.warning(f"Replacing shared state segment {self.name} with a different layout")
+                # Readers still mapping the old segment see the version change and reattach
+                struct.pack_into("<I", shm.buf, 8, 0)
+                shm.close()
+                # Still tracked here: unlink() unregisters it from the resource tracker
+                shm.unlink()
+                shm = None
+            else:
+                _untrack(shm)
+                if pid and pid != os.getpid() and self._process_alive(pid):
+                    shm.close()
+                    raise RuntimeError(f"Shared state {self.name} is already written by process {pid}")
+        except FileNotFoundError:
+            shm = None
+
+        if shm is None:
+            shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+            _untrack(shm)
+            shm.buf[:size] = bytes(size)
+            _HEADER.pack_into(shm.buf, 0, STATE_MAGIC, STATE_VERSION, self.capacity, _RECORD_SIZE, 0, 0, 0.0)
+
+        self._shm = shm
+        self._writer = True
+        self._slots.clear()
+        self._indexed = 0
+        self._refresh_index()
+        # A writer killed mid-write leaves an odd counter behind; close it
+        for slot in self._slots.values():
+            offset = self._offset(slot)
+            (seq,) = _SEQ.unpack_from(shm.buf, offset)
+            if seq & 1:
+                _SEQ.pack_into(shm.buf, offset, seq + 1)
+        struct.pack_into("<I", shm.buf, 24, os.getpid())
+        self.heartbeat()
+        logger.info(f"Writing shared state {self.name}: {len(self._slots)}/{self.capacity} units")
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def heartbeat(self):
+        """Tell readers the writer is alive"""
+        if self._shm is not None:
+            struct.pack_into("<d", self._shm.buf, _HEARTBEAT_OFFSET, time.time())
+
+    def write(self, unit_id: str, sensor_data: Optional[Dict], status_entry: Optional[Dict],
+              normal_level: Optional[float]):
+        """Publish the current state of one unit (from the cache manager's caches)"""
+        if not self._writer:
+            return
+        slot = self._slots.get(unit_id)
+        if slot is None:
+            slot = self._allocate(unit_id)
+            if slot is None:
+                return
+        if normal_level is None and status_entry:
+            normal_level = status_entry.get("normal_level")
+        sensor_data = sensor_data or {}
+        self._write_record(slot, (
+            unit_id.encode("utf-8"),
+            _float(sensor_data.get("distance")),
+            _float(sensor_data.get("temperature")),
+            _float(sensor_data.get("battery")),
+            _float(sensor_data.get("rssi")),
+            _float(sensor_data.get("snr")),
+            _float(normal_level),
+            _timestamp(sensor_data.get("last_updated")),
+            _timestamp(status_entry.get("last_updated")) if status_entry else _NAN,
+            _STATUS_CODE.get(status_entry["status"], 0) if status_entry else 0,
+            1 if sensor_data else 0
+        ))
+
+    def clear(self):
+        """Mark every unit as untracked (the caches were cleared)"""
+        for unit_id in list(self._slots):
+            self.write(unit_id, None, None, None)
+
+    def _allocate(self, unit_id: str) -> Optional[int]:
+        slot = len(self._slots)
+        if slot >= self.capacity:
+            if not self._full_logged:
+                logger.error(f"Shared state {self.name} is full ({self.capacity} units); raise SHARED_STATE_CAPACITY")
+                self._full_logged = True
+            return None
+        if len(unit_id.encode("utf-8")) > 16:
+            logger.error(f"Unit id {unit_id!r} is longer than 16 bytes and cannot be shared")
+            return None
+        # Write the record before publishing the slot, so readers only index complete slots
+        self._write_record(slot, (unit_id.encode("utf-8"),) + (_NAN,) * 8 + (0, 0))
+        self._slots[unit_id] = slot
+        self._indexed = slot + 1
+        struct.pack_into("<I", self._shm.buf, _SLOTS_USED_OFFSET, slot + 1)
+        return slot
+
+    def _write_record(self, slot: int, values: Tuple):
+        buf = self._shm.buf
+        offset = self._offset(slot)
+        (seq,) = _SEQ.unpack_from(buf, offset)
+        _SEQ.pack_into(buf, offset, seq + 1)
+        _BODY.pack_into(buf, offset + _SEQ.size, *values)
+        _SEQ.pack_into(buf, offset, seq + 2)
+
+    # Reader side (API workers)
+
+    def _attach(self) -> bool:
+        if self._shm is not None:
+            return True
+        try:
+            shm = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError:
+            return False
+        _untrack(shm)
+        magic, version, capacity, record_size, _, _, _ = _HEADER.unpack_from(shm.buf, 0)
+        if (magic, version, record_size) != (STATE_MAGIC, STATE_VERSION, _RECORD_SIZE):
+            shm.close()
+            return False
+        self._shm = shm
+        self.capacity = capacity
+        self._slots.clear()
+        self._indexed = 0
+        return True
+
+    def _refresh_index(self) -> bool:
+        """Attach if needed and index slots added since the last call"""
+        if not self._attach():
+            return False
+        buf = self._shm.buf
+        if not self._writer and struct.unpack_from("<I", buf, 8)[0] != STATE_VERSION:
+            # The ingest process replaced the segment
+            self._shm.close()
+            self._shm = None
+            if not self._attach():
+                return False
+            buf = self._shm.buf
+        (used,) = struct.unpack_from("<I", buf, _SLOTS_USED_OFFSET)
+        for slot in range(self._indexed, min(used, self.capacity)):
+            raw = bytes(buf[self._offset(slot) + _SEQ.size:self._offset(slot) + _SEQ.size + 16])
+            self._slots[raw.rstrip(b"\0").decode("utf-8")] = slot
+        self._indexed = max(self._indexed, min(used, self.capacity))
+        return True
+
+    def _read_record(self, slot: int) -> Optional[Tuple]:
+        buf = self._shm.buf
+        offset = self._offset(slot)
+        for attempt in range(1000):
+            (before,) = _SEQ.unpack_from(buf, offset)
+            if not before & 1:
+                values = _BODY.unpack_from(buf, offset + _SEQ.size)
+                (after,) = _SEQ.unpack_from(buf, offset)
+                if before == after:
+                    return values
+            if attempt % 10 == 9:
+                time.sleep(0)
+        logger.warning(f"Gave up reading shared state slot {slot} (writer stuck mid-write)")
+        return None
+
+    def _writer_alive(self) -> bool:
+        """The ingest process is attached and sent a heartbeat within stale_after seconds"""
+        if self._writer:
+            return True
+        _, _, _, _, _, pid, heartbeat = _HEADER.unpack_from(self._shm.buf, 0)
+        alive = bool(pid) and time.time() - heartbeat <= self.stale_after
+        if alive:
+            self._stale_logged = False
+        elif not self._stale_logged:
+            logger.warning(f"Shared state {self.name} has no live writer; serving no live unit state")
+            self._stale_logged = True
+        return alive
+
+    def _read_unit(self, unit_id: str) -> Optional[Tuple]:
+        if not self._refresh_index() or not self._writer_alive():
+            return None
+        slot = self._slots.get(unit_id)
+        return None if slot is None else self._read_record(slot)
+
+    @staticmethod
+    def _offset(slot: int) -> int:
+        return _HEADER_SIZE + slot * _RECORD_SIZE
+
+    def get_latest_sensor_data(self, unit_id: str) -> Optional[Dict]:
+        """Same shape as MQTTCacheManager.get_latest_sensor_data"""
+        record = self._read_unit(unit_id)
+        if record is None or not record[10]:
+            return None
+        return {
+            "distance": record[1],
+            "temperature": record[2],
+            "battery": record[3],
+            "rssi": record[4],
+            "snr": record[5],
+            "last_updated": datetime.fromtimestamp(record[7])
+        }
+
+    def get_cached_normal_value(self, unit_id: str) -> Optional[float]:
+        record = self._read_unit(unit_id)
+        return None if record is None else _optional(record[6])
+
+    def get_fleet_status(self) -> Dict:
+        """Same shape as MQTTCacheManager.get_fleet_status"""
+        counts = {status: 0 for status in STATUS_CODES[1:]}
+        units = {}
+        if self._refresh_index() and self._writer_alive():
+            for unit_id, slot in self._slots.items():
+                record = self._read_record(slot)
+                if record is None or not record[9]:
+                    continue
+                status = STATUS_CODES[record[9]]
+                counts[status] += 1
+                units[unit_id] = {
+                    "status": status,
+                    "distance": _optional(record[1]),
+                    "normal_level": _optional(record[6]),
+                    "last_updated": None if math.isnan(record[8]) else datetime.fromtimestamp(record[8]).isoformat()
+                }
+        return {"total_units": len(units), "counts": counts, "units": units}
+
+    def get_status(self) -> Dict:
+        attached = self._refresh_index()
+        status = {"name": self.name, "attached": attached, "role": "writer" if self._writer else "reader"}
+        if attached:
+            _, _, capacity, _, used, pid, heartbeat = _HEADER.unpack_from(self._shm.buf, 0)
+            status.update({
+                "capacity": capacity,
+                "units": used,
+                "writer_pid": pid or None,
+                "heartbeat_age_seconds": round(time.time() - heartbeat, 3) if heartbeat else None,
+                "writer_alive": self._writer_alive()
+            })
+        return status
+
+    def close(self):
+        """Detach; the segment stays for the next ingest process and the readers"""
+        if self._shm is not None:
+            if self._writer:
+                struct.pack_into("<I", self._shm.buf, 24, 0)
+            self._shm.close()
+            self._shm = None
+        self._writer = False
+        self._slots.clear()
+        self._indexed = 0
+
+
+# Create singleton instance
+shared_state = SharedStateTable(
+    name=settings.SHARED_STATE_NAME,
+    capacity=settings.SHARED_STATE_CAPACITY,
+    stale_after=settings.SHARED_STATE_STALE_SECONDS
+)
+
+
+def get_live_state():
+    """
+    Where the API reads live unit state: the shared table when a separate
+    ingest process owns ingest, otherwise this process's cache manager.
+    """
+    if settings.INGEST_MODE == "process":
+        return shared_state
+    return mqtt_cache_manager
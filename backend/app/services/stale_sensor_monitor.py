@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.mqtt_cache_manager import mqtt_cache_manager
+
+logger = logging.getLogger(__name__)
+
+# Which wheel holds a unit's deadline
+FINE, OVERFLOW = 0, 1
+
+class StaleSensorMonitor:
+    """
+    Detect units that stop reporting using a hierarchical timer wheel.
+
+    Every reading re-arms the unit's deadline in O(1): the unit is moved to the
+    wheel slot for (deadline / tick) and nothing else is touched. The ticker only
+    inspects the slot whose time has come, so the cost does not grow with the
+    size of the fleet. Deadlines beyond the current revolution wait in a coarse
+    overflow wheel, one slot per revolution, and move down to the fine wheel
+    when their revolution starts; a unit reporting every hour is looked at once
+    or twice per deadline, not once per revolution.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, wheel_size: int = 512, overflow_size: int = 64):
+        self._tick_seconds = tick_seconds
+        self._wheel_size = wheel_size
+        self._overflow_size = overflow_size
+
+        # Fine wheel slots holding the unit ids whose deadline falls in that tick,
+        # and overflow slots holding the ones due in a later revolution
+        self._slots: List[Set[str]] = [set() for _ in range(wheel_size)]
+        self._overflow: List[Set[str]] = [set() for _ in range(overflow_size)]
+
+        # Structure: {unit_id: (deadline, wheel, slot_index)}; wheel is FINE or OVERFLOW
+        self._deadlines: Dict[str, Tuple[float, int, int]] = {}
+
+        # Expected report interval per unit, learned from observed gaps
+        # Structure: {unit_id: seconds}
+        self._intervals: Dict[str, float] = {}
+        self._last_seen: Dict[str, float] = {}
+
+        self._default_interval = settings.SENSOR_REPORT_INTERVAL_SECONDS
+        self._max_interval = settings.SENSOR_MAX_REPORT_INTERVAL_SECONDS
+        self._missed_reports = settings.STALE_AFTER_MISSED_REPORTS
+
+        self._last_tick: Optional[int] = None
+        self._clock: Optional[Callable[[], datetime]] = None  # Time source override used by replays
+        self._task: Optional[asyncio.Task] = None
+        self._websocket_service = None
+
+    def set_websocket_service(self, ws_service):
+        """Set websocket service to avoid circular import"""
+        self._websocket_service = ws_service
+
+    def set_clock(self, clock: Optional[Callable[[], datetime]]):
+        """Take the time from clock instead of the wall clock (None restores it); see MQTTService.set_clock"""
+        self._clock = clock
+
+    def _now(self) -> float:
+        return self._clock().timestamp() if self._clock is not None else time.time()
+
+    def set_expected_interval(self, unit_id: str, interval_seconds: float):
+        """Override the expected report interval for a unit"""
+        self._intervals[unit_id] = interval_seconds
+
+    def get_expected_interval(self, unit_id: str) -> float:
+        """Get the expected report interval for a unit in seconds"""
+        return self._intervals.get(unit_id, self._default_interval)
+
+    def record_reading(self, unit_id: str, now: Optional[float] = None):
+        """Re-arm the unit's deadline after a reading (constant cost)"""
+        if now is None:
+            now = self._now()
+        if self._last_tick is None:
+            self._last_tick = int(now / self._tick_seconds) - 1
+
+        interval = self.get_expected_interval(unit_id)
+        last_seen = self._last_seen.get(unit_id)
+        if last_seen is not None:
+            gap = now - last_seen
+            if unit_id not in self._intervals:
+                # The first gap seeds the interval, so units reporting slower than the
+                # default are not stale before every reading; later gaps correct an outage
+                if gap > 0:
+                    interval = self._intervals[unit_id] = min(gap, self._max_interval)
+            # Learn from regular gaps only; an outage must not stretch the deadline
+            elif 0 < gap < interval * self._missed_reports:
+                interval = min(0.8 * interval + 0.2 * gap, self._max_interval)
+                self._intervals[unit_id] = interval
+        self._last_seen[unit_id] = now
+
+        self._unlink(unit_id)
+        self._place(unit_id, now + interval * self._missed_reports)
+
+    def _due_tick(self, deadline: float) -> int:
+        # First tick that starts after the deadline, so the slot is always due when visited
+        return int(deadline / self._tick_seconds) + 1
+
+    def _place(self, unit_id: str, deadline: float):
+        tick = self._due_tick(deadline)
+        revolution = tick // self._wheel_size
+        if revolution <= (self._last_tick + 1) // self._wheel_size:
+            slot = tick % self._wheel_size
+            self._slots[slot].add(unit_id)
+            self._deadlines[unit_id] = (deadline, FINE, slot)
+        else:
+            slot = revolution % self._overflow_size
+            self._overflow[slot].add(unit_id)
+            self._deadlines[unit_id] = (deadline, OVERFLOW, slot)
+
+    def _unlink(self, unit_id: str):
+        entry = self._deadlines.pop(unit_id, None)
+        if entry is not None:
+            wheel = self._slots if entry[1] == FINE else self._overflow
+            wheel[entry[2]].discard(unit_id)
+
+    def _cascade(self, revolution: int):
+        """Move the units due in this revolution down to the fine wheel"""
+        slot = self._overflow[revolution % self._overflow_size]
+        if not slot:
+            return
+        # Deadlines more than overflow_size revolutions ahead share the slot and stay
+        due = [u for u in slot if self._due_tick(self._deadlines[u][0]) // self._wheel_size <= revolution]
+        for unit_id in due:
+            slot.discard(unit_id)
+            self._place(unit_id, self._deadlines[unit_id][0])
+
+    def forget_unit(self, unit_id: str):
+        """Stop watching a unit"""
+        self._unlink(unit_id)
+        self._intervals.pop(unit_id, None)
+        self._last_seen.pop(unit_id, None)
+
+    def forget_all(self):
+        """Stop watching every unit"""
+        for slot in self._slots + self._overflow:
+            slot.clear()
+        self._deadlines.clear()
+        self._intervals.clear()
+        self._last_seen.clear()
+
+    def advance(self, now: Optional[float] = None) -> List[str]:
+        """Process every wheel slot that has come due; returns the expired unit ids"""
+        if now is None:
+            now = self._now()
+
+        current_tick = int(now / self._tick_seconds)
+        if self._last_tick is None:
+            self._last_tick = current_tick - 1
+        if current_tick - self._last_tick > self._wheel_size:
+            return self._catch_up(now, current_tick)
+
+        expired = []
+        for tick in range(self._last_tick + 1, current_tick + 1):
+            if tick % self._wheel_size == 0:
+                self._last_tick = tick - 1
+                self._cascade(tick // self._wheel_size)
+            slot = self._slots[tick % self._wheel_size]
+            if not slot:
+                continue
+            for unit_id in [u for u in slot if self._deadlines[u][0] <= now]:
+                slot.discard(unit_id)
+                del self._deadlines[unit_id]
+                expired.append(unit_id)
+        self._last_tick = current_tick
+        return expired
+
+    def _catch_up(self, now: float, current_tick: int) -> List[str]:
+        """After a pause longer than a revolution, expire what is due and re-file the rest"""
+        expired = [unit_id for unit_id, entry in self._deadlines.items() if entry[0] <= now]
+        pending = [(unit_id, entry[0]) for unit_id, entry in self._deadlines.items() if entry[0] > now]
+        for slot in self._slots + self._overflow:
+            slot.clear()
+        self._deadlines.clear()
+        self._last_tick = current_tick
+        for unit_id, deadline in pending:
+            self._place(unit_id, deadline)
+        return expired
+
+    async def _handle_expired(self, unit_id: str):
+        """Mark a silent unit stale and notify alert subscribers"""
+        if not mqtt_cache_manager.mark_unit_stale(unit_id):
+            return
+
+        sensor_data = mqtt_cache_manager.get_latest_sensor_data(unit_id)
+        last_seen = sensor_data["last_updated"].isoformat() if sensor_data else None
+        logger.warning(f"Unit {unit_id} missed its report deadline (last seen: {last_seen})")
+
+        if self._websocket_service:
+            await self._websocket_service.broadcast_alert_data({
+                "type": "unit_stale",
+                "unit_id": unit_id,
+                "status": "stale",
+                "last_seen": last_seen,
+                "expected_interval": round(self.get_expected_interval(unit_id), 1),
+                "time": (self._clock() if self._clock is not None else datetime.now()).isoformat()
+            })
+
+    async def _run(self):
+        """Ticker loop: advance the wheel once per tick"""
+        while True:
+            await asyncio.sleep(self._tick_seconds)
+            try:
+                for unit_id in self.advance():
+                    await self._handle_expired(unit_id)
+            except Exception as e:
+                logger.error(f"Error in stale sensor monitor: {e}")
+
+    def start(self):
+        """Start the ticker on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Stale sensor monitor started (default interval: {self._default_interval}s, "
+                        f"stale after {self._missed_reports} missed reports)")
+
+    async def stop(self):
+        """Stop the ticker"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("Stale sensor monitor stopped")
+
+    def get_stats(self) -> Dict:
+        return {
+            "watched_units": len(self._deadlines),
+            "default_interval_seconds": self._default_interval,
+            "stale_after_missed_reports": self._missed_reports,
+            "tick_seconds": self._tick_seconds,
+            "wheel_size": self._wheel_size,
+            "overflow_size": self._overflow_size
+        }
+
+# Create singleton instance
+stale_sensor_monitor = StaleSensorMonitor(tick_seconds=settings.STALE_CHECK_TICK_SECONDS)
+
+# Units dropped from the caches are no longer watched
+mqtt_cache_manager.attach_stale_monitor(stale_sensor_monitor)
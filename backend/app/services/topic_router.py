@@ -0,0 +1,173 @@
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+from app.services.sensor_protocol import BINARY_READING_SIZE, decode_binary_reading, is_binary_reading
+
+logger = logging.getLogger(__name__)
+
+# Distinct topics remembered by the resolution cache before it starts over
+ROUTE_CACHE_SIZE = 4096
+
+
+class MessageContext(NamedTuple):
+    topic: str
+    params: Tuple[str, ...]     # topic levels matched by the route's + and # wildcards
+    received_at: datetime
+
+
+Decoder = Callable[[bytes], List[Any]]
+Step = Callable[[Dict, MessageContext], Optional[Dict]]
+Handler = Callable[[Dict, MessageContext], Awaitable[None]]
+
+
+# Decoders turn a payload into the messages it carries (a batch carries several)
+
+def decode_json(payload: bytes) -> List[Any]:
+    """A JSON object, or a JSON array of them"""
+    data = json.loads(payload)
+    return data if isinstance(data, list) else [data]
+
+
+def decode_batch(payload: bytes) -> List[Any]:
+    """A JSON array of messages, as gateways send when they forward several readings at once"""
+    data = json.loads(payload)
+    if not isinstance(data, list):
+        raise ValueError("Batch payload must be a JSON array")
+    return data
+
+
+def decode_binary(payload: bytes) -> List[Any]:
+    """One 9-byte sensor frame, or several concatenated"""
+    if len(payload) == BINARY_READING_SIZE:
+        return [decode_binary_reading(payload)]
+    if not payload or len(payload) % BINARY_READING_SIZE:
+        raise ValueError(f"Binary payload must be a multiple of {BINARY_READING_SIZE} bytes, got {len(payload)}")
+    return [
+        decode_binary_reading(payload[offset:offset + BINARY_READING_SIZE])
+        for offset in range(0, len(payload), BINARY_READING_SIZE)
+    ]
+
+
+def decode_sensor(payload: bytes) -> List[Any]:
+    """What the gateways forward: binary frame(s) if the CRC checks out, JSON otherwise"""
+    if len(payload) % BINARY_READING_SIZE == 0 and payload and is_binary_reading(payload[:BINARY_READING_SIZE]):
+        try:
+            return decode_binary(payload)
+        except ValueError:
+            pass
+    return decode_json(payload)
+
+
+DECODERS: Dict[str, Decoder] = {
+    "json": decode_json,
+    "batch": decode_batch,
+    "binary": decode_binary,
+    "sensor": decode_sensor,
+}
+
+
+def unit_id_from_topic(param: int = 0) -> Step:
+    """Pipeline step for per-unit topics (e.g. river/units/+/reading): take the unit id from the topic"""
+    def step(message: Dict, context: MessageContext) -> Dict:
+        message.setdefault("i", context.params[param])
+        return message
+    return step
+
+
+def compile_topic_filter(topic_filter: str) -> Pattern:
+    """
+    Regular expression for an MQTT topic filter, capturing each + level and
+    the # remainder. A $share/<group>/ prefix is ignored, and wildcards in
+    the first level do not match $-topics, as brokers do.
+    """
+    original = topic_filter
+    if topic_filter.startswith("$share/"):
+        parts = topic_filter.split("/", 2)
+        topic_filter = parts[2] if len(parts) == 3 else ""
+    if not topic_filter:
+        raise ValueError(f"Invalid topic filter {original!r}")
+    levels = topic_filter.split("/")
+    for index, level in enumerate(levels):
+        if ("#" in level and (level != "#" or index != len(levels) - 1)) or ("+" in level and level != "+"):
+            raise ValueError(f"Invalid topic filter {topic_filter!r}")
+
+    multi_level = levels[-1] == "#"
+    if multi_level:
+        levels = levels[:-1]
+    body = "/".join("([^/]*)" if level == "+" else re.escape(level) for level in levels)
+    if multi_level:
+        body = f"{body}(?:/(.*))?" if levels else "(.*)"
+    if topic_filter[0] in "+#":
+        body = r"(?!\$)" + body
+    return re.compile(body)
+
+
+class Route(NamedTuple):
+    topic_filter: str
+    pattern: Pattern
+    decoder: Decoder
+    steps: Tuple[Step, ...]
+    handler: Handler
+
+
+class TopicRouter:
+    """
+    Maps MQTT topic filters to a decoder and a handler pipeline.
+
+    Filters are compiled once (compile() runs at subscribe time); the routes
+    a topic resolves to, with their wildcard values, are cached per topic, so
+    after the first message on a topic routing costs one dict lookup.
+    Every route whose filter matches handles the message, as with
+    overlapping MQTT subscriptions.
+    """
+
+    def __init__(self, cache_size: int = ROUTE_CACHE_SIZE):
+        self._registrations: List[Tuple[str, str, Tuple[Step, ...], Handler]] = []
+        self._routes: Optional[List[Route]] = None
+        # Structure: {topic: ((route, params), ...)}; empty for topics nothing handles
+        self._cache: Dict[str, Tuple[Tuple[Route, Tuple[str, ...]], ...]] = {}
+        self._cache_size = cache_size
+
+    def add(self, topic_filter: str, handler: Handler, decoder: str = "json", steps: Sequence[Step] = ()):
+        """Register a route; steps run in order and may change the message or return None to drop it"""
+        if decoder not in DECODERS:
+            raise ValueError(f"Unknown decoder {decoder!r}; expected one of {', '.join(DECODERS)}")
+        compile_topic_filter(topic_filter)
+        self._registrations.append((topic_filter, decoder, tuple(steps), handler))
+        self._routes = None
+        self._cache.clear()
+
+    def compile(self):
+        self._routes = [
+            Route(topic_filter, compile_topic_filter(topic_filter), DECODERS[decoder], steps, handler)
+            for topic_filter, decoder, steps, handler in self._registrations
+        ]
+        self._cache.clear()
+
+    def resolve(self, topic: str) -> Tuple[Tuple[Route, Tuple[str, ...]], ...]:
+        """Routes handling topic, each with the values of its wildcards"""
+        resolved = self._cache.get(topic)
+        if resolved is not None:
+            return resolved
+        if self._routes is None:
+            self.compile()
+        matches = []
+        for route in self._routes:
+            match = route.pattern.fullmatch(topic)
+            if match:
+                matches.append((route, tuple(value for value in match.groups() if value is not None)))
+        resolved = tuple(matches)
+        if not resolved:
+            logger.warning(f"No route for MQTT topic {topic}; its messages are dropped")
+        if len(self._cache) >= self._cache_size:
+            self._cache.clear()
+        self._cache[topic] = resolved
+        return resolved
+
+    def get_routes(self) -> List[Dict]:
+        return [
+            {"topic_filter": topic_filter, "decoder": decoder, "steps": len(steps)}
+            for topic_filter, decoder, steps, _ in self._registrations
+        ]
@@ -0,0 +1,157 @@
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Capture file layout: header, then records appended in arrival order.
+# A topic record assigns a small id to a topic the first time it is seen;
+# message records refer to topics by id.
+CAPTURE_MAGIC = b"RVRCAP"
+CAPTURE_VERSION = 1
+_HEADER = struct.Struct("<6sH")
+_TOPIC = struct.Struct("<BHH")       # record type, topic id, topic length
+_MESSAGE = struct.Struct("<BHdI")    # record type, topic id, arrival (unix seconds), payload length
+_TOPIC_RECORD = 1
+_MESSAGE_RECORD = 2
+
+
+class CapturedMessage(NamedTuple):
+    topic: str
+    payload: bytes
+    arrived_at: float
+
+
+def read_capture(path: str) -> Iterator[CapturedMessage]:
+    """
+    Messages of a capture file in arrival order. A record cut short at the
+    end (recorder killed mid-write) is ignored.
+    """
+    topics: Dict[int, str] = {}
+    with open(path, "rb") as capture:
+        magic, version = _HEADER.unpack(capture.read(_HEADER.size))
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a traffic capture")
+        if version != CAPTURE_VERSION:
+            raise ValueError(f"Unsupported capture version {version}")
+        while True:
+            kind = capture.read(1)
+            if not kind:
+                return
+            if kind[0] == _TOPIC_RECORD:
+                head = kind + capture.read(_TOPIC.size - 1)
+                if len(head) < _TOPIC.size:
+                    return
+                _, topic_id, length = _TOPIC.unpack(head)
+                name = capture.read(length)
+                if len(name) < length:
+                    return
+                topics[topic_id] = name.decode("utf-8")
+            elif kind[0] == _MESSAGE_RECORD:
+                head = kind + capture.read(_MESSAGE.size - 1)
+                if len(head) < _MESSAGE.size:
+                    return
+                _, topic_id, arrived_at, length = _MESSAGE.unpack(head)
+                payload = capture.read(length)
+                if len(payload) < length:
+                    return
+                yield CapturedMessage(topics[topic_id], payload, arrived_at)
+            else:
+                raise ValueError(f"Corrupt capture: unknown record type {kind[0]}")
+
+
+class TrafficRecorder:
+    """
+    Append incoming MQTT messages (topic, payload, arrival time) to a capture
+    file for offline replay.
+
+    record() is called from _on_message on the event loop, so it only appends
+    to an in-memory buffer; the buffer is written out when it fills up, at most
+    every flush interval, and on stop. Recording stops by itself at max_bytes.
+    """
+
+    def __init__(self, capture_dir: str, max_bytes: int, flush_interval: float = 1.0):
+        self._capture_dir = capture_dir
+        self._max_bytes = max_bytes
+        self._flush_interval = flush_interval
+        self._file: Optional[BinaryIO] = None
+        self._path: Optional[str] = None
+        self._topics: Dict[str, int] = {}
+        self._messages = 0
+        self._bytes = 0
+        self._started_at: Optional[float] = None
+        self._last_flush = 0.0
+
+    @property
+    def is_recording(self) -> bool:
+        return self._file is not None
+
+    def start(self, name: Optional[str] = None) -> str:
+        """Start a new capture in the capture directory; returns its path"""
+        if self._file is not None:
+            raise RuntimeError(f"Already recording to {self._path}")
+        name = name or f"capture-{datetime.now().strftime('%Y%m%d-%H%M%S')}.rcap"
+        if os.path.basename(name) != name:
+            raise ValueError("Capture name must be a plain file name")
+        os.makedirs(self._capture_dir, exist_ok=True)
+        path = os.path.join(self._capture_dir, name)
+        capture = open(path, "xb", buffering=64 * 1024)
+        capture.write(_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+        self._file, self._path = capture, path
+        self._topics = {}
+        self._messages = 0
+        self._bytes = _HEADER.size
+        self._started_at = self._last_flush = time.time()
+        logger.info(f"Recording MQTT traffic to {path}")
+        return path
+
+    def stop(self):
+        if self._file is None:
+            return
+        capture, self._file = self._file, None
+        capture.close()
+        logger.info(f"Stopped recording: {self._messages} messages, {self._bytes} bytes in {self._path}")
+
+    def record(self, topic: str, payload: bytes, arrived_at: Optional[float] = None):
+        capture = self._file
+        if capture is None:
+            return
+        now = time.time()
+        topic_id = self._topics.get(topic)
+        if topic_id is None:
+            topic_id = self._topics[topic] = len(self._topics)
+            name = topic.encode("utf-8")
+            capture.write(_TOPIC.pack(_TOPIC_RECORD, topic_id, len(name)))
+            capture.write(name)
+            self._bytes += _TOPIC.size + len(name)
+        capture.write(_MESSAGE.pack(_MESSAGE_RECORD, topic_id, arrived_at or now, len(payload)))
+        capture.write(payload)
+        self._bytes += _MESSAGE.size + len(payload)
+        self._messages += 1
+
+        if self._bytes >= self._max_bytes:
+            logger.warning(f"Capture reached {self._max_bytes} bytes")
+            self.stop()
+        elif now - self._last_flush >= self._flush_interval:
+            capture.flush()
+            self._last_flush = now
+
+    def get_status(self) -> Dict:
+        return {
+            "recording": self.is_recording,
+            "path": self._path,
+            "started_at": self._started_at,
+            "messages": self._messages,
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes
+        }
+
+# Create singleton instance
+traffic_recorder = TrafficRecorder(
+    capture_dir=settings.TRAFFIC_CAPTURE_DIR,
+    max_bytes=settings.TRAFFIC_CAPTURE_MAX_BYTES
+)
@@ -1,6 +1,9 @@
 from fastapi import WebSocket
 from typing import List, Dict, Any, Set
 import logging
+import time
+
+from app.core.metrics import WEBSOCKET_SEND_ERRORS, WEBSOCKET_SEND_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +44,9 @@ class WebSocketService:
         """Broadcast distance-specific data"""
         await self._broadcast_to_subscriptions(data, ["all", "distance"])
 
-    
+    async def broadcast_alert_data(self, data: Dict[str, Any]):
+        """Broadcast alert events (e.g. a unit going stale)"""
+        await self._broadcast_to_subscriptions(data, ["all", "alerts"])
 
     async def _broadcast_to_subscriptions(self, data: Dict[str, Any], subscription_types: List[str]):
         """Send data to specific subscription types"""
@@ -56,9 +61,12 @@ class WebSocketService:
             
         disconnected = []
         for connection in connections:
+            started = time.perf_counter()
             try:
                 await connection.send_json(data)
+                WEBSOCKET_SEND_SECONDS.observe(time.perf_counter() - started)
             except Exception as e:
+                WEBSOCKET_SEND_ERRORS.inc()
                 logger.error(f"Error sending to WebSocket: {e}")
                 disconnected.append(connection)
         
@@ -1,4 +1,7 @@
 from app.services.daily_averages_service import DailyAveragesService
+from app.services.hourly_averages_service import HourlyAveragesService
+from app.services.period_averages_service import PeriodAveragesService
+from app.services.retention_service import RetentionService
 from app.db.sessions import AsyncSessionLocal
 import logging
 
@@ -12,6 +15,11 @@ async def calculate_missing_averages_on_startup():
         try:
             service = DailyAveragesService(db)
             
+            # Weekly/monthly/yearly rollups for daily rows written before they existed.
+            # Runs first: the backfill below refreshes periods incrementally.
+            active_units = await service.get_active_units()
+            await PeriodAveragesService(db).rebuild_missing_units([unit.unit_id for unit in active_units])
+            
             logger.info("Starting calculation of missing daily averages...")
             results = await service.calculate_all_missing_averages()
             
@@ -68,4 +76,30 @@ async def calculate_averages_for_specific_unit(unit_id: str):
             logger.error(f"Error calculating averages for unit {unit_id}: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
-            return 0
\ No newline at end of file
+            return 0
+
+async def calculate_closed_hourly_averages():
+    """
+    Materialize hourly averages for every closed hour (called hourly and on startup)
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            service = HourlyAveragesService(db)
+            return await service.calculate_closed_hours()
+
+        except Exception as e:
+            logger.error(f"Error during hourly average calculation: {str(e)}")
+            return 0
+
+async def prune_raw_measurements():
+    """
+    Apply the raw measurement retention policy (called daily, after the daily averages)
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            service = RetentionService(db)
+            return await service.prune_raw_measurements()
+
+        except Exception as e:
+            logger.error(f"Error during raw measurement retention: {str(e)}")
+            return {}
@@ -4,31 +4,120 @@ import time
 from datetime import datetime
 import logging
 from threading import Thread
+from sqlalchemy import text
 
-from app.startup.calculate_averages import calculate_end_of_day_averages
+from app.startup.calculate_averages import (
+    calculate_end_of_day_averages,
+    calculate_closed_hourly_averages,
+    prune_raw_measurements
+)
+from app.core.config import settings
+from app.db.partitions import ensure_partitions
+from app.db.sessions import engine
 
 logger = logging.getLogger(__name__)
 
+# Advisory lock key ("SCHD") held by the one worker that runs the scheduled jobs
+_SCHEDULER_LOCK_KEY = 0x53434844
+
 class DailyMidnightScheduler:
     def __init__(self):
         self.running = False
         self.thread = None
+        # The app's event loop: jobs run there, since the engine's pooled connections are bound to it
+        self.loop = None
+        self.owner = False
+        self._lock_connection = None
+    
+    async def claim(self) -> bool:
+        """
+        Elect this worker to run the scheduled and startup rollup jobs.
+        On PostgreSQL one worker holds an advisory lock for its lifetime; the others
+        skip the jobs. Other databases run a single worker, which is always the owner.
+        """
+        if self.owner:
+            return True
+        if engine.dialect.name != "postgresql":
+            self.owner = True
+            return True
+        connection = await engine.connect()
+        try:
+            # Autocommit so the lock connection does not sit idle in a transaction
+            await connection.execution_options(isolation_level="AUTOCOMMIT")
+            result = await connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": _SCHEDULER_LOCK_KEY}
+            )
+            self.owner = bool(result.scalar())
+        except Exception:
+            await connection.close()
+            raise
+        if self.owner:
+            self._lock_connection = connection
+        else:
+            await connection.close()
+        return self.owner
+    
+    async def release(self):
+        """Give up the scheduler lock so a restarted worker can take it"""
+        self.owner = False
+        if self._lock_connection is not None:
+            connection, self._lock_connection = self._lock_connection, None
+            try:
+                # The connection goes back to the pool; a session lock would outlive close()
+                await connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": _SCHEDULER_LOCK_KEY}
+                )
+            finally:
+                await connection.close()
+    
+    def run_on_app_loop(self, coroutine):
+        """Run a job on the app's event loop and wait for it from the scheduler thread"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
     
     def run_midnight_calculation(self):
         """Run the midnight calculation"""
         try:
             logger.info("🕛 Running midnight daily averages calculation...")
-            # Run the async function in the event loop
-            asyncio.run(calculate_end_of_day_averages())
+            self.run_on_app_loop(calculate_end_of_day_averages())
             logger.info(" Midnight daily averages calculation completed")
         except Exception as e:
             logger.error(f"Error in midnight calculation: {e}")
     
+    def run_partition_maintenance(self):
+        """Create upcoming sensor_measurements partitions ahead of time"""
+        try:
+            logger.info("Running partition maintenance...")
+            self.run_on_app_loop(ensure_partitions())
+        except Exception as e:
+            logger.error(f"Error in partition maintenance: {e}")
+    
+    def run_hourly_rollup(self):
+        """Materialize the hour that just closed"""
+        try:
+            self.run_on_app_loop(calculate_closed_hourly_averages())
+        except Exception as e:
+            logger.error(f"Error in hourly rollup: {e}")
+    
+    def run_retention(self):
+        """Prune raw measurements whose rollups are confirmed"""
+        try:
+            logger.info("Running raw measurement retention...")
+            self.run_on_app_loop(prune_raw_measurements())
+        except Exception as e:
+            logger.error(f"Error in raw measurement retention: {e}")
+    
     def schedule_daily_tasks(self):
         """Schedule the daily midnight task"""
         # Schedule for midnight (00:01 to ensure it's after midnight)
         schedule.every().day.at("00:01").do(self.run_midnight_calculation)
         logger.info(" Scheduled daily averages calculation for midnight (00:01)")
+        schedule.every().day.at("00:30").do(self.run_partition_maintenance)
+        logger.info(" Scheduled partition maintenance (00:30)")
+        schedule.every().hour.at(":02").do(self.run_hourly_rollup)
+        logger.info(" Scheduled hourly averages rollup (every hour at :02)")
+        if settings.RAW_RETENTION_DAYS > 0:
+            schedule.every().day.at("01:00").do(self.run_retention)
+            logger.info(f" Scheduled raw measurement retention (01:00, keeping {settings.RAW_RETENTION_DAYS} days)")
     
     def run_scheduler(self):
         """Run the scheduler in a separate thread"""
@@ -45,8 +134,9 @@ class DailyMidnightScheduler:
                 time.sleep(1)
     
     def start(self):
-        """Start the scheduler in a background thread"""
+        """Start the scheduler in a background thread (call from the app's event loop)"""
         if not self.running:
+            self.loop = asyncio.get_running_loop()
             self.thread = Thread(target=self.run_scheduler, daemon=True)
             self.thread.start()
             logger.info("✅ Daily scheduler started")
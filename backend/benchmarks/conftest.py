@@ -0,0 +1,87 @@
+"""
+Shared setup for the hot path microbenchmarks.
+
+Baselines are stored next to this file in .benchmarks/ (per machine, since
+timings are only comparable on the same hardware). Typical use, from backend/:
+
+    # Record a baseline on the main branch
+    pytest benchmarks --benchmark-save=baseline
+
+    # On a change: compare with the latest saved run and fail on a regression
+    pytest benchmarks --benchmark-compare
+
+With --benchmark-compare, a benchmark whose best time (min) is more than
+--regression-threshold percent (default 15) slower than the baseline fails
+the run. An explicit --benchmark-compare-fail takes precedence.
+"""
+import asyncio
+import os
+import pytest
+
+# Settings are read at import time; the hot paths benchmarked here never touch the broker or database
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///./benchmark.db")
+os.environ.setdefault("MQTT_BROKER_HOST", "localhost")
+os.environ.setdefault("MQTT_BROKER_PORT", "1883")
+os.environ.setdefault("MQTT_CLIENT_ID", "benchmarks")
+os.environ.setdefault("MQTT_TOPICS", "lora/water_lavel")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), ".benchmarks")
+
+# Fleet size used to populate the caches
+FLEET_SIZE = 1000
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--regression-threshold", type=int, default=15,
+        help="Fail when a benchmark's best time (min) is this many percent slower than the compared run (default: 15)"
+    )
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    from pytest_benchmark.utils import parse_compare_fail
+
+    # Keep baselines in one place regardless of the directory pytest is started from
+    if config.getoption("benchmark_storage", None) == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{BASELINE_DIR}"
+    if config.getoption("benchmark_compare", None) and not config.getoption("benchmark_compare_fail", None):
+        threshold = config.getoption("regression_threshold")
+        config.option.benchmark_compare_fail = [parse_compare_fail(f"min:{threshold:g}%")]
+
+
+def unit_ids(count: int = FLEET_SIZE):
+    return [f"{index + 1:03d}" for index in range(count)]
+
+
+@pytest.fixture
+def event_loop_runner():
+    """Run a coroutine to completion on a private event loop"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def cache_manager():
+    """A cache manager holding a realistic fleet: metadata, normal values, latest data and live status"""
+    from types import SimpleNamespace
+    from app.services.mqtt_cache_manager import MQTTCacheManager
+
+    manager = MQTTCacheManager()
+    for index, unit_id in enumerate(unit_ids()):
+        manager.set_unit_metadata_from_row(SimpleNamespace(
+            unit_id=unit_id, name=f"Unit {unit_id}", location="river",
+            normal_level=100.0, warning_level=0.2, high_level=0.5, critical_level=1.0,
+            is_active=True, created_at=None, updated_at=None
+        ))
+        if index % 10:
+            manager.set_cached_normal_value(unit_id, 100.0)
+        else:
+            # Every tenth unit is still collecting its first readings
+            manager._first_readings_cache[unit_id] = {"readings": [100.0] * 5, "count": 5}
+        manager.update_latest_sensor_data(unit_id, 95.0, 25.0, 80.0, -90, 5.0)
+        manager.update_unit_status(unit_id, "normal", distance=95.0, normal_level=100.0)
+    return manager
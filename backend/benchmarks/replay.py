@@ -0,0 +1,141 @@
+"""
+Replay a captured MQTT traffic file through the ingest pipeline.
+
+Captures are recorded on a running backend with
+POST /api/admin/traffic-capture/start (and .../stop). A replay feeds every
+message back into MQTTService._on_message in its original order. It runs at
+the original pace (--speed 1), N times faster (--speed 10), or as fast as
+the pipeline absorbs it (--speed max). The service clock follows the
+capture, so reading timestamps, the per-unit save interval and the stored
+recorded_at are the same at any speed. Two replays of one capture do the
+same work, so they can be compared before and after an optimization, or
+profiled.
+
+Run from backend/:
+
+    python -m benchmarks.replay captures/capture-20250101-120000.rcap --speed max
+    python -m benchmarks.replay storm.rcap --speed 10 --shift-to 2030-01-01 --database-url postgresql+asyncpg://...
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from benchmarks.load_generator import FakeWebSocket, configure_environment, percentile, prepare_schema
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay a captured MQTT traffic file")
+    parser.add_argument("capture", help="Capture file written by the traffic recorder")
+    parser.add_argument("--speed", default="1",
+                        help="Playback speed: 1 for real time, N for N times faster, max for no delays (default: 1)")
+    parser.add_argument("--shift-to", help="Move the capture in time so it starts at this ISO date/time")
+    parser.add_argument("--subscribers", type=int, default=5, help="Simulated WebSocket clients (default: 5)")
+    parser.add_argument("--max-in-flight", type=int, default=1000,
+                        help="At --speed max, pause feeding while this many readings are being handled (default: 1000)")
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./benchmark.db",
+                        help="Database to write to (default: sqlite+aiosqlite:///./benchmark.db)")
+    parser.add_argument("--drain", type=float, default=30.0,
+                        help="Seconds to wait for in-flight readings at the end (default: 30)")
+    args = parser.parse_args(argv)
+    args.speed = None if args.speed == "max" else float(args.speed)
+    if args.speed is not None and args.speed <= 0:
+        parser.error("--speed must be positive or 'max'")
+    return args
+
+
+class ReplayClock:
+    """Time source handed to MQTTService: the capture's arrival time of the message being fed"""
+
+    def __init__(self, offset: float = 0.0):
+        self.offset = offset
+        self.current = 0.0
+
+    def __call__(self) -> datetime:
+        return datetime.fromtimestamp(self.current + self.offset).astimezone()
+
+
+def other_tasks() -> int:
+    return len(asyncio.all_tasks()) - 1
+
+
+async def main(args: argparse.Namespace):
+    from app.core.metrics import INGEST_STAGE_SECONDS, MQTT_MESSAGE_ERRORS
+    from app.db.sessions import engine
+    from app.services.mqtt_cache_manager import mqtt_cache_manager
+    from app.services.mqtt_service import mqtt_service
+    from app.services.traffic_recorder import read_capture
+    from app.services.websocket_service import websocket_service
+
+    messages = list(read_capture(args.capture))
+    if not messages:
+        print("Capture is empty", file=sys.stderr)
+        return
+    first = messages[0].arrived_at
+    span = messages[-1].arrived_at - first
+
+    await prepare_schema()
+    await mqtt_cache_manager.load_all_unit_metadata_from_db()
+    sockets = [FakeWebSocket() for _ in range(args.subscribers)]
+    websocket_service.connections["all"].extend(sockets)
+    mqtt_service.set_websocket_service(websocket_service)
+
+    offset = datetime.fromisoformat(args.shift_to).timestamp() - first if args.shift_to else 0.0
+    clock = ReplayClock(offset)
+    mqtt_service.set_clock(clock)
+
+    print(f"Replaying {len(messages)} messages spanning {span:.1f}s at "
+          f"{'max' if args.speed is None else f'{args.speed:g}x'} speed...", file=sys.stderr)
+    lateness: List[float] = []
+    start = time.perf_counter()
+    for message in messages:
+        if args.speed is None:
+            while other_tasks() >= args.max_in_flight:
+                await asyncio.sleep(0.001)
+        else:
+            target = start + (message.arrived_at - first) / args.speed
+            delay = target - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lateness.append(max(0.0, time.perf_counter() - target))
+        clock.current = message.arrived_at
+        mqtt_service._on_message(None, message.topic, message.payload, 0, None)
+        if args.speed is None:
+            await asyncio.sleep(0)
+    fed = time.perf_counter() - start
+
+    deadline = time.perf_counter() + args.drain
+    while other_tasks() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    unfinished = other_tasks()
+    await engine.dispose()
+
+    lateness.sort()
+    stages: Dict[str, str] = {}
+    for stage in ("decode", "parse", "normal_lookup", "metadata_lookup", "classify", "broadcast", "persist"):
+        count = INGEST_STAGE_SECONDS.get_count(stage=stage)
+        if count:
+            stages[stage] = f"{INGEST_STAGE_SECONDS.get_sum(stage=stage) / count * 1e6:.1f} us"
+
+    print(f"messages:           {len(messages)}")
+    print(f"wall time:          {elapsed:.2f}s (fed in {fed:.2f}s)")
+    print(f"effective speed:    {span / elapsed:.1f}x" if elapsed else "effective speed:    n/a")
+    print(f"throughput:         {len(messages) / elapsed:.0f} messages/s")
+    if lateness:
+        print(f"behind schedule:    p50 {percentile(lateness, 0.5) * 1000:.2f} ms, "
+              f"p99 {percentile(lateness, 0.99) * 1000:.2f} ms")
+    print(f"errors:             {int(MQTT_MESSAGE_ERRORS.total())}")
+    print(f"unfinished:         {unfinished}")
+    print(f"websocket messages: {sum(socket.received for socket in sockets)}")
+    print("mean stage time:    " + ", ".join(f"{stage} {value}" for stage, value in stages.items()))
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure_environment(arguments.database_url)
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(arguments))
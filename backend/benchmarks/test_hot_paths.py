@@ -0,0 +1,119 @@
+"""
+Microbenchmarks for the functions every MQTT reading goes through.
+
+Async paths are benchmarked in batches of BATCH calls per round, so the cost
+of entering the event loop does not hide the function being measured.
+"""
+import json
+import pytest
+
+from benchmarks.conftest import unit_ids
+
+BATCH = 1000
+
+JSON_MESSAGE = json.dumps({"i": "042", "d": 54.32, "t": 26.69, "b": 75, "rssi": -97, "snr": 7.5})
+
+
+class MockWebSocket:
+    """Accepts messages without a network; counts them so the fan-out can be checked"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_json(self, data):
+        self.sent += 1
+
+
+def test_parse_json_reading(benchmark):
+    from app.services.sensor_protocol import extract_reading_fields
+
+    def parse():
+        return extract_reading_fields(json.loads(JSON_MESSAGE))
+
+    assert benchmark(parse) == ("042", 54.32, 26.69, 75.0, -97.0, 7.5)
+
+
+def test_decode_binary_reading(benchmark):
+    from app.services.sensor_protocol import decode_binary_reading, encode_binary_reading
+
+    frame = encode_binary_reading("042", 54.32, 26.69, 75)
+    assert benchmark(decode_binary_reading, frame) == {"i": "042", "d": 54.32, "t": 26.69, "b": 75}
+
+
+def test_route_and_decode(benchmark):
+    from app.services.topic_router import TopicRouter
+
+    async def handler(message, context):
+        pass
+
+    router = TopicRouter()
+    router.add("lora/water_lavel", handler, decoder="sensor")
+    router.add("river/units/+/reading", handler)
+    router.add("lora/gateway/#", handler)
+    router.compile()
+    payload = JSON_MESSAGE.encode()
+
+    def route():
+        return [route.decoder(payload) for route, params in router.resolve("lora/water_lavel")]
+
+    assert benchmark(route) == [[json.loads(JSON_MESSAGE)]]
+
+
+def test_normal_value_cached(benchmark, cache_manager, event_loop_runner):
+    ids = [unit_id for index, unit_id in enumerate(unit_ids()) if index % 10][:BATCH]
+
+    async def lookups():
+        for unit_id in ids:
+            await cache_manager.get_or_calculate_normal_value(unit_id, 95.0)
+
+    benchmark(lambda: event_loop_runner(lookups()))
+    assert cache_manager.get_cache_stats()["normal_value_lookups"]["misses"] == 0
+
+
+def test_classify_status(benchmark, cache_manager):
+    meta = cache_manager.get_unit_metadata("042")
+    # One reading per status: normal, warning, high, critical
+    heights = [95.0, 130.0, 170.0, 250.0] * (BATCH // 4)
+
+    def classify():
+        return [cache_manager.classify_status(height, 100.0, meta) for height in heights]
+
+    assert benchmark(classify)[:4] == ["normal", "warning", "high", "critical"]
+
+
+def test_update_latest_sensor_data(benchmark, cache_manager):
+    ids = unit_ids()[:BATCH]
+
+    def update():
+        for unit_id in ids:
+            cache_manager.update_latest_sensor_data(unit_id, 95.0, 25.0, 80.0, -90, 5.0)
+
+    benchmark(update)
+    assert cache_manager.get_latest_sensor_data("001")["distance"] == 95.0
+
+
+@pytest.mark.parametrize("subscribers", [1, 10, 100])
+def test_broadcast_to_subscriptions(benchmark, event_loop_runner, subscribers):
+    from app.services.websocket_service import WebSocketService
+
+    service = WebSocketService()
+    sockets = [MockWebSocket() for _ in range(subscribers)]
+    for index, socket in enumerate(sockets):
+        service.connections["all" if index % 2 else "distance"].append(socket)
+    message = {
+        "unit_id": "042", "hight": 54.32, "normal_level": 100.0, "raw_height": 54.32,
+        "temperature": 26.69, "battery": 75.0, "signal": 35, "trend": "up",
+        "sensor_status": "normal", "status": "normal", "time": "2025-01-01T00:00:00"
+    }
+
+    async def broadcasts():
+        for _ in range(BATCH // subscribers or 1):
+            await service._broadcast_to_subscriptions(message, ["all", "distance"])
+
+    benchmark(lambda: event_loop_runner(broadcasts()))
+    assert all(socket.sent for socket in sockets)
+
+
+def test_get_cache_stats(benchmark, cache_manager):
+    stats = benchmark(cache_manager.get_cache_stats)
+    assert stats["units_with_normal_values"] + stats["units_collecting_first_readings"] == len(unit_ids())
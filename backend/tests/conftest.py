@@ -0,0 +1,32 @@
+"""
+Shared setup for the unit tests. Run from backend/:
+
+    pytest tests
+"""
+import os
+import time
+
+import pytest
+
+# Settings are read at import time; the code tested here never touches the broker or database
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///./test.db")
+os.environ.setdefault("MQTT_BROKER_HOST", "localhost")
+os.environ.setdefault("MQTT_BROKER_PORT", "1883")
+os.environ.setdefault("MQTT_CLIENT_ID", "tests")
+os.environ.setdefault("MQTT_TOPICS", "lora/water_lavel")
+os.environ.setdefault("SECRET_KEY", "tests")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+
+@pytest.fixture
+def colombo():
+    """Run with the server clock at UTC+05:30, where local days start half-way through a UTC hour"""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "IST-5:30"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
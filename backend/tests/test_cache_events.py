@@ -0,0 +1,238 @@
+import asyncio
+import json
+
+from app.services import cache_events as cache_events_module
+from app.services.cache_events import CacheEventBus, LocalBroker
+
+
+class FlakyListener:
+    """Postgres-style backend whose LISTEN fails a set number of times before it succeeds"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.listens = 0
+        self.on_lost = None
+
+    async def listen(self, deliver, on_lost):
+        self.listens += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.deliver, self.on_lost = deliver, on_lost
+
+    async def close(self):
+        pass
+
+
+def recorder(events):
+    return lambda event: events.append(event)
+
+
+def test_local_broker_delivers_to_other_buses_but_not_the_origin():
+    async def run():
+        broker = LocalBroker()
+        publisher, other = CacheEventBus(broker), CacheEventBus(broker)
+        published, received = [], []
+        publisher.subscribe("unit", recorder(published))
+        other.subscribe("unit", recorder(received))
+        await publisher.start()
+        await other.start()
+
+        await publisher.publish(None, "unit", unit_id="001")
+        await publisher.stop()
+        await other.stop()
+        return publisher, other, published, received
+
+    publisher, other, published, received = asyncio.run(run())
+
+    assert published == []
+    assert received == [{"kind": "unit", "origin": publisher.origin, "unit_id": "001"}]
+    assert publisher.get_stats()["published"] == 1
+    assert other.get_stats()["received"] == 1
+
+
+def test_handlers_run_only_for_their_kind():
+    async def run():
+        broker = LocalBroker()
+        publisher, other = CacheEventBus(broker), CacheEventBus(broker)
+        units, users = [], []
+        other.subscribe("unit", recorder(units))
+        other.subscribe("user", recorder(users))
+        await other.start()
+
+        await publisher.publish(None, "user", user_id=7)
+        await publisher.publish(None, "daily_average", unit_id="001")
+        await other.stop()
+        return units, users
+
+    units, users = asyncio.run(run())
+
+    assert units == []
+    assert [event["user_id"] for event in users] == [7]
+
+
+def test_coroutine_handlers_and_failures_do_not_stop_delivery():
+    async def run():
+        broker = LocalBroker()
+        publisher, other = CacheEventBus(broker), CacheEventBus(broker)
+        handled = []
+
+        def broken(event):
+            raise RuntimeError("boom")
+
+        async def refresh(event):
+            handled.append(event["unit_id"])
+
+        other.subscribe("unit", broken)
+        other.subscribe("unit", refresh)
+        await other.start()
+        await publisher.publish(None, "unit", unit_id="001")
+        await asyncio.sleep(0)
+        await other.stop()
+        return handled
+
+    assert asyncio.run(run()) == ["001"]
+
+
+def test_detached_bus_receives_nothing():
+    async def run():
+        broker = LocalBroker()
+        publisher, other = CacheEventBus(broker), CacheEventBus(broker)
+        received = []
+        other.subscribe("unit", recorder(received))
+        await other.start()
+        await other.stop()
+        await publisher.publish(None, "unit", unit_id="001")
+        return received
+
+    assert asyncio.run(run()) == []
+
+
+def test_malformed_events_are_ignored():
+    bus = CacheEventBus(LocalBroker())
+    received = []
+    bus.subscribe("unit", recorder(received))
+
+    bus._deliver("not json")
+    bus._deliver(json.dumps({"kind": "unit", "origin": "elsewhere", "unit_id": "001"}))
+
+    assert [event["unit_id"] for event in received] == ["001"]
+
+
+def test_resync_runs_once_after_reconnecting(monkeypatch):
+    monkeypatch.setattr(cache_events_module, "RECONNECT_DELAY", 0.0)
+
+    async def run():
+        backend = FlakyListener()
+        bus = CacheEventBus(backend)
+        resyncs = []
+        bus.on_resync(recorder(resyncs))
+        await bus.start()
+
+        # The LISTEN connection drops, then the next two reconnect attempts fail
+        backend.failures = 2
+        backend.on_lost()
+        backend.on_lost()
+        while bus._reconnect_task is not None:
+            await asyncio.sleep(0)
+        await bus.stop()
+        return backend, resyncs
+
+    backend, resyncs = asyncio.run(run())
+
+    assert backend.listens == 4
+    assert resyncs == [{}]
+
+
+def test_no_reconnect_after_stop(monkeypatch):
+    monkeypatch.setattr(cache_events_module, "RECONNECT_DELAY", 0.0)
+
+    async def run():
+        backend = FlakyListener()
+        bus = CacheEventBus(backend)
+        resyncs = []
+        bus.on_resync(recorder(resyncs))
+        await bus.start()
+        await bus.stop()
+        backend.on_lost()
+        return backend, bus, resyncs
+
+    backend, bus, resyncs = asyncio.run(run())
+
+    assert bus._reconnect_task is None
+    assert backend.listens == 1
+    assert resyncs == []
+
+
+class HangingListener(FlakyListener):
+    """Reconnect attempts never finish until cancelled; records whether the attempt cleaned up"""
+
+    cancelled = False
+
+    async def listen(self, deliver, on_lost):
+        self.listens += 1
+        if self.listens == 1:
+            self.deliver, self.on_lost = deliver, on_lost
+            return
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def test_stop_during_reconnect_skips_the_resync(monkeypatch):
+    monkeypatch.setattr(cache_events_module, "RECONNECT_DELAY", 0.0)
+
+    async def run():
+        backend = HangingListener()
+        bus = CacheEventBus(backend)
+        resyncs = []
+        bus.on_resync(recorder(resyncs))
+        await bus.start()
+
+        backend.on_lost()
+        while backend.listens < 2:
+            await asyncio.sleep(0)
+        await bus.stop()
+        await asyncio.sleep(0)
+        return backend, bus, resyncs
+
+    backend, bus, resyncs = asyncio.run(run())
+
+    assert backend.cancelled
+    assert bus._reconnect_task is None
+    assert resyncs == []
+
+
+def test_connection_opened_after_stop_is_closed(monkeypatch):
+    monkeypatch.setattr(cache_events_module, "RECONNECT_DELAY", 0.0)
+
+    class StopsWhileOpening(FlakyListener):
+        closes = 0
+
+        async def listen(self, deliver, on_lost):
+            await super().listen(deliver, on_lost)
+            if self.listens == 2:
+                # stop() flips the flag before its cancel reaches this attempt
+                bus._running = False
+
+        async def close(self):
+            self.closes += 1
+
+    backend = StopsWhileOpening()
+    bus = CacheEventBus(backend)
+    resyncs = []
+    bus.on_resync(recorder(resyncs))
+
+    async def run():
+        await bus.start()
+        backend.on_lost()
+        while bus._reconnect_task is not None:
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert backend.listens == 2
+    assert backend.closes == 1
+    assert resyncs == []
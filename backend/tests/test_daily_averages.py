@@ -0,0 +1,85 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.db import schema as schema_module
+from app.db.sessions import Base
+from app.models.database.cache_versions import CacheVersionDB  # noqa: F401 (table for create_all)
+from app.models.database.daily_averages import DailyAverageDB
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.models.database.unit import UnitDB
+from app.services.daily_averages_service import DailyAveragesService
+
+DAY = date(2025, 3, 1)
+NOON = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def make_engine():
+    return create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+
+async def count_daily_rows(session):
+    return await session.scalar(select(func.count()).select_from(DailyAverageDB))
+
+
+def test_recalculating_a_day_updates_its_row():
+    engine = make_engine()
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(UnitDB(unit_id="001", name="Unit 001"))
+            session.add(SensorMeasurementDB(unit_id="001", height=100.0, recorded_at=NOON))
+            await session.commit()
+            service = DailyAveragesService(session)
+            first = await service.calculate_daily_averages_for_date("001", DAY)
+
+            session.add(SensorMeasurementDB(unit_id="001", height=110.0, recorded_at=NOON + timedelta(minutes=5)))
+            await session.commit()
+            second = await service.calculate_daily_averages_for_date("001", DAY)
+            return first.id, second, await count_daily_rows(session)
+
+    first_id, second, rows = asyncio.run(run())
+
+    assert rows == 1
+    assert second.id == first_id
+    assert second.measurement_count == 2
+    assert second.avg_height == pytest.approx(105.0)
+
+
+def test_unique_index_is_added_after_dropping_duplicates(monkeypatch):
+    engine = make_engine()
+    monkeypatch.setattr(schema_module, "engine", engine)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            # A database created before the index, holding a day calculated twice
+            await conn.execute(text("DROP INDEX uq_daily_averages_unit_id_date"))
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(UnitDB(unit_id="001", name="Unit 001"))
+            session.add(DailyAverageDB(unit_id="001", date=DAY, avg_height=100.0, measurement_count=1))
+            session.add(DailyAverageDB(unit_id="001", date=DAY, avg_height=105.0, measurement_count=2))
+            session.add(DailyAverageDB(unit_id="001", date=DAY + timedelta(days=1), avg_height=90.0, measurement_count=1))
+            await session.commit()
+
+        await schema_module.ensure_indexes()
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            rows = (await session.execute(
+                select(DailyAverageDB.date, DailyAverageDB.avg_height).order_by(DailyAverageDB.date)
+            )).all()
+            session.add(DailyAverageDB(unit_id="001", date=DAY, avg_height=0.0, measurement_count=0))
+            with pytest.raises(IntegrityError):
+                await session.commit()
+        return rows
+
+    rows = asyncio.run(run())
+
+    assert rows == [(DAY, 105.0), (DAY + timedelta(days=1), 90.0)]
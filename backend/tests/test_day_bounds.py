@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.db.sessions import Base
+from app.db.time_buckets import day_bounds, hour_offset, local_date
+from app.models.database.cache_versions import CacheVersionDB  # noqa: F401 (table for create_all)
+from app.models.database.daily_averages import DailyAverageDB
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.models.database.unit import UnitDB
+from app.services.daily_averages_service import DailyAveragesService
+from app.services.hourly_averages_service import HourlyAveragesService, hour_floor
+from app.services.retention_service import RetentionService
+
+DAY = date(2025, 3, 1)
+UTC = timezone.utc
+
+
+def test_day_bounds_follow_the_local_day(colombo):
+    assert day_bounds(DAY) == (
+        datetime(2025, 2, 28, 18, 30, tzinfo=UTC),
+        datetime(2025, 3, 1, 18, 30, tzinfo=UTC)
+    )
+    assert local_date(datetime(2025, 2, 28, 18, 30, tzinfo=UTC)) == DAY
+    assert local_date(datetime(2025, 2, 28, 18, 29, tzinfo=UTC)) == DAY - timedelta(days=1)
+
+
+def test_hours_start_on_local_hour_boundaries(colombo):
+    assert hour_offset() == 1800
+    assert hour_floor(datetime(2025, 3, 1, 18, 10, tzinfo=UTC)) == datetime(2025, 3, 1, 17, 30, tzinfo=UTC)
+    assert hour_floor(datetime(2025, 3, 1, 18, 30, tzinfo=UTC)) == datetime(2025, 3, 1, 18, 30, tzinfo=UTC)
+
+
+def test_utc_hours_are_unchanged():
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "UTC"
+    time.tzset()
+    try:
+        assert hour_offset() == 0
+        assert day_bounds(DAY) == (datetime(2025, 3, 1, tzinfo=UTC), datetime(2025, 3, 2, tzinfo=UTC))
+    finally:
+        if previous is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = previous
+        time.tzset()
+
+
+def test_rollups_and_retention_count_the_same_rows(colombo):
+    """Readings bunched around local midnight: any disagreement on the day's window shows in the counts"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    day_start, day_end = day_bounds(DAY)
+    readings = (
+        # Late on the previous local day, early and late on DAY, early on the next day
+        [day_start - timedelta(minutes=minutes) for minutes in (1, 5, 20)]
+        + [day_start + timedelta(minutes=minutes) for minutes in (0, 1, 10, 29, 31, 90)]
+        + [day_end - timedelta(minutes=minutes) for minutes in (1, 45)]
+        + [day_end + timedelta(minutes=minutes) for minutes in (0, 15)]
+    )
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(UnitDB(unit_id="001", name="Unit 001"))
+            for index, recorded_at in enumerate(readings):
+                session.add(SensorMeasurementDB(unit_id="001", height=100.0 + index, recorded_at=recorded_at))
+            await session.commit()
+
+            daily = await DailyAveragesService(session).calculate_daily_averages_for_date("001", DAY)
+            await HourlyAveragesService(session).materialize_hours(day_start - timedelta(days=1), day_end + timedelta(days=1))
+            retention = RetentionService(session, retention_days=1)
+            confirmed, unconfirmed = await retention.get_confirmed_units(DAY)
+            deleted = await retention.delete_unit_day("001", DAY)
+            remaining = (await session.execute(select(func.count(SensorMeasurementDB.id)))).scalar()
+            oldest = await retention.get_oldest_measurement_date()
+        await engine.dispose()
+        return daily.measurement_count, confirmed, unconfirmed, deleted, remaining, oldest
+
+    daily_count, confirmed, unconfirmed, deleted, remaining, oldest = asyncio.run(run())
+
+    assert daily_count == 8
+    assert (confirmed, unconfirmed) == (["001"], [])
+    assert deleted == 8
+    assert remaining == len(readings) - 8
+    assert oldest == DAY - timedelta(days=1)
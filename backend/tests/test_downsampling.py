@@ -0,0 +1,72 @@
+import math
+
+from app.services.downsampling import columns_to_rows, downsample_columns, lttb_indices
+
+
+def series(n):
+    x = list(range(n))
+    y = [math.sin(i / 10) * 50 + (i % 7) for i in range(n)]
+    return x, y
+
+
+def test_keeps_endpoints_and_returns_max_points():
+    x, y = series(1000)
+    indices = lttb_indices(x, y, 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0
+    assert indices[-1] == 999
+
+
+def test_indices_are_strictly_increasing():
+    x, y = series(1000)
+    indices = lttb_indices(x, y, 37).tolist()
+
+    assert indices == sorted(set(indices))
+
+
+def test_short_input_passes_through():
+    x, y = series(50)
+
+    assert lttb_indices(x, y, 50).tolist() == list(range(50))
+    assert lttb_indices(x, y, 500).tolist() == list(range(50))
+
+
+def test_too_few_points_requested_passes_through():
+    x, y = series(50)
+
+    assert lttb_indices(x, y, 2).tolist() == list(range(50))
+
+
+def test_keeps_a_spike():
+    x = list(range(200))
+    y = [0.0] * 200
+    y[123] = 100.0
+
+    assert 123 in lttb_indices(x, y, 20).tolist()
+
+
+def test_missing_values_do_not_break_selection():
+    x, y = series(300)
+    y[10] = float("nan")
+
+    assert len(lttb_indices(x, y, 30)) == 30
+
+
+def test_downsample_columns_keeps_columns_aligned():
+    x, y = series(500)
+    columns = {"date": [f"d{i}" for i in x], "avg_height": y, "measurement_count": x}
+    sampled = downsample_columns(columns, x, "avg_height", 50)
+
+    assert all(len(values) == 50 for values in sampled.values())
+    for row in columns_to_rows(sampled):
+        assert row["date"] == f"d{row['measurement_count']}"
+        assert row["avg_height"] == y[row["measurement_count"]]
+
+
+def test_downsample_columns_short_input_is_unchanged():
+    x, y = series(10)
+    columns = {"avg_height": y}
+
+    assert downsample_columns(columns, x, "avg_height", 50) is columns
+    assert downsample_columns(columns, x, "avg_height", None) is columns
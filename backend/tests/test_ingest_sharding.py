@@ -0,0 +1,104 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from app.services import mqtt_service as mqtt_service_module
+from app.services.ingest_sharding import IngestSharding
+from app.services.mqtt_service import MQTTService
+
+UNITS = [f"{index:03d}" for index in range(1, 41)]
+
+
+def make_sharding(mode, worker_index, worker_count=3):
+    return IngestSharding(mode=mode, share_group="river-ingest", worker_count=worker_count,
+                          worker_index=worker_index, fanout_topic="river/fanout/")
+
+
+@pytest.mark.parametrize("mode", ["hash", "shared"])
+def test_every_unit_has_exactly_one_owner(mode):
+    workers = [make_sharding(mode, index) for index in range(3)]
+
+    for unit_id in UNITS:
+        assert sum(worker.owns(unit_id) for worker in workers) == 1
+        assert workers[workers[0].shard_of(unit_id)].owns(unit_id)
+
+
+def test_worker_without_a_shard_owns_nothing():
+    worker = make_sharding("shared", None)
+
+    assert not any(worker.owns(unit_id) for unit_id in UNITS)
+
+
+def test_only_shared_mode_uses_shared_subscriptions():
+    assert make_sharding("shared", 0).subscription_topic("lora/+") == "$share/river-ingest/lora/+"
+    assert make_sharding("hash", 0).subscription_topic("lora/+") == "lora/+"
+    assert make_sharding("shared", 2).shard_topic(2) == "river/fanout/shard/2"
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, json.loads(payload)))
+
+
+@pytest.fixture
+def shared_worker(monkeypatch):
+    """An MQTTService that is worker 0 of 3 in shared mode, with its own state and a fake broker"""
+    sharding = make_sharding("shared", 0)
+    monkeypatch.setattr(mqtt_service_module, "ingest_sharding", sharding)
+    service = MQTTService()
+    service.client = FakeClient()
+    return service, sharding
+
+
+def test_reading_for_another_shard_is_forwarded_to_its_owner(shared_worker):
+    service, sharding = shared_worker
+    unit_id = next(unit_id for unit_id in UNITS if sharding.shard_of(unit_id) == 2)
+    received_at = datetime(2025, 3, 1, 12, 0)
+
+    asyncio.run(service._handle_distance({"i": unit_id, "d": 54.3}, received_at))
+
+    assert service.client.published == [
+        ("river/fanout/shard/2", {"message": {"i": unit_id, "d": 54.3}, "received_at": received_at.isoformat()})
+    ]
+    assert unit_id not in service._last_save_times
+
+
+def test_forwarded_reading_is_handled_with_its_arrival_time(shared_worker, monkeypatch):
+    service, _ = shared_worker
+    handled = []
+
+    async def handle_distance(message, received_at=None):
+        handled.append((message, received_at))
+
+    monkeypatch.setattr(service, "_handle_distance", handle_distance)
+    payload = json.dumps({"message": {"i": "001", "d": 54.3}, "received_at": "2025-03-01T12:00:00"})
+
+    asyncio.run(service._handle_forwarded(payload.encode()))
+    asyncio.run(service._handle_forwarded(b"{not json"))
+
+    assert handled == [({"i": "001", "d": 54.3}, datetime(2025, 3, 1, 12, 0))]
+
+
+def test_shard_topic_messages_are_not_taken_for_fanout(shared_worker, monkeypatch):
+    service, _ = shared_worker
+    calls = []
+
+    async def record(kind, payload):
+        calls.append((kind, payload))
+
+    monkeypatch.setattr(service, "_handle_forwarded", lambda payload: record("forwarded", payload))
+    monkeypatch.setattr(service, "_handle_fanout", lambda payload: record("fanout", payload))
+
+    async def deliver():
+        service._on_message(None, "river/fanout/shard/0", b"a", 0, None)
+        service._on_message(None, "river/fanout/other-worker", b"b", 0, None)
+        await asyncio.sleep(0)
+
+    asyncio.run(deliver())
+
+    assert calls == [("forwarded", b"a"), ("fanout", b"b")]
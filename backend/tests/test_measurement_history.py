@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.api import measurement_routes
+from app.api.measurement_routes import _decode_cursor, _encode_cursor, _parse_datetime, get_unit_measurements
+from app.db.sessions import Base
+from app.models.database.sensor_measurements import SensorMeasurementDB
+from app.models.database.unit import UnitDB
+from app.services.mqtt_cache_manager import MQTTCacheManager
+
+START = datetime(2025, 3, 1, 12, 0, 0)
+
+
+def test_cursor_round_trip():
+    recorded_at = datetime(2025, 3, 1, 12, 30, 15, 123456)
+
+    assert _decode_cursor(_encode_cursor(recorded_at, 42)) == (recorded_at, 42)
+
+
+def test_cursor_is_url_safe():
+    cursor = _encode_cursor(datetime(2025, 3, 1, 12, 0), 10 ** 12)
+
+    assert all(character.isalnum() or character in "-_=" for character in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "", "MjAyNS0wMy0wMQ=="])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_naive_times_are_in_the_server_timezone(colombo):
+    assert _parse_datetime("2025-03-01T12:00:00", "from") == datetime(2025, 3, 1, 6, 30, tzinfo=timezone.utc)
+
+
+def test_aware_times_are_converted_to_utc(colombo):
+    assert _parse_datetime("2025-03-01T12:00:00+00:00", "to") == datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+    assert _parse_datetime("2025-03-01T12:00:00-04:00", "to") == datetime(2025, 3, 1, 16, 0, tzinfo=timezone.utc)
+
+
+def test_invalid_time_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        _parse_datetime("yesterday", "from")
+    assert error.value.status_code == 400
+
+
+@pytest.fixture
+def history(monkeypatch):
+    """An in-memory database with readings that share timestamps across page boundaries"""
+    manager = MQTTCacheManager()
+    manager._unit_meta_loaded = True
+    manager.set_unit_metadata_from_row(SimpleNamespace(
+        unit_id="001", name="Unit 001", location="river", normal_level=100.0, warning_level=0.2,
+        high_level=0.5, critical_level=1.0, is_active=True, created_at=None, updated_at=None
+    ))
+    monkeypatch.setattr(measurement_routes, "mqtt_cache_manager", manager)
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            session.add(UnitDB(unit_id="001", name="Unit 001"))
+            # Three readings per second for four seconds
+            for second in range(4):
+                for _ in range(3):
+                    session.add(SensorMeasurementDB(
+                        unit_id="001", height=100.0 + second, recorded_at=START + timedelta(seconds=second)
+                    ))
+            await session.commit()
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(setup())
+
+    def fetch(**params):
+        async def query():
+            async with AsyncSession(engine) as session:
+                return await get_unit_measurements(
+                    "001", from_=START.isoformat(), to=(START + timedelta(minutes=1)).isoformat(),
+                    bucket=params.get("bucket"), limit=params.get("limit", 1000),
+                    cursor=params.get("cursor"), session=session
+                )
+        return loop.run_until_complete(query())
+
+    yield fetch
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 5, 11, 12, 13])
+def test_pages_cover_every_row_once_with_equal_timestamps(history, limit):
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = history(limit=limit, cursor=cursor)
+        pages += 1
+        assert page["count"] <= limit
+        seen.extend(row["id"] for row in page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == list(range(1, 13))
+    assert pages == -(-12 // limit)
+
+
+def test_last_full_page_has_no_cursor(history):
+    page = history(limit=12)
+
+    assert page["count"] == 12
+    assert page["next_cursor"] is None
+
+
+def test_buckets_aggregate_in_the_database(history):
+    page = history(bucket="2s")
+
+    assert [row["measurement_count"] for row in page["data"]] == [6, 6]
+    assert [row["avg_height"] for row in page["data"]] == [100.5, 102.5]
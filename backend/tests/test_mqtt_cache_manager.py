@@ -0,0 +1,43 @@
+from app.models.database.unit import UnitDB
+from app.services.mqtt_cache_manager import MQTTCacheManager
+
+
+def make_manager(*unit_ids):
+    manager = MQTTCacheManager()
+    for unit_id in unit_ids:
+        manager.set_unit_metadata_from_row(UnitDB(
+            unit_id=unit_id, name=f"Unit {unit_id}", location="river", normal_level=100.0,
+            warning_level=20.0, high_level=40.0, critical_level=60.0, is_active=True
+        ))
+    return manager
+
+
+def test_units_in_the_snapshot_start_unknown():
+    fleet = make_manager("001", "002").get_fleet_status()
+
+    assert fleet["total_units"] == 2
+    assert fleet["counts"]["unknown"] == 2
+
+
+def test_clearing_a_known_unit_keeps_it_in_the_fleet():
+    manager = make_manager("001", "002")
+    manager.update_unit_status("001", "warning", distance=120.0, normal_level=100.0)
+
+    manager.clear_cache("001")
+    fleet = manager.get_fleet_status()
+
+    assert fleet["total_units"] == 2
+    assert fleet["counts"]["warning"] == 0
+    assert fleet["counts"]["unknown"] == 2
+    assert fleet["units"]["001"]["status"] == "unknown"
+
+
+def test_clearing_an_unlisted_unit_drops_it():
+    manager = make_manager("001")
+    manager.update_unit_status("009", "normal", distance=100.0, normal_level=100.0)
+
+    manager.clear_cache("009")
+    fleet = manager.get_fleet_status()
+
+    assert fleet["total_units"] == 1
+    assert "009" not in fleet["units"]
@@ -0,0 +1,131 @@
+import math
+import random
+
+import pytest
+
+from app.services.quantile_sketch import QuantileSketch, _read_varint, _unzigzag, _write_varint, _zigzag
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+
+def exact_quantile(values, q):
+    """The element the sketch ranks: index floor(q * (n - 1)) of the sorted values"""
+    ordered = sorted(values)
+    return ordered[int(math.floor(q * (len(ordered) - 1)))]
+
+
+def assert_within_accuracy(sketch, values):
+    for q in QUANTILES:
+        expected = exact_quantile(values, q)
+        actual = sketch.quantile(q)
+        if expected == 0:
+            assert actual == 0
+        else:
+            assert abs(actual - expected) <= sketch.relative_accuracy * abs(expected) + 1e-12, q
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(relative_accuracy):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(4, 1.5) for _ in range(20000)]
+    sketch = QuantileSketch(relative_accuracy)
+    sketch.update(values)
+
+    assert sketch.count == len(values)
+    assert_within_accuracy(sketch, values)
+
+
+def test_negative_zero_and_positive_values():
+    rng = random.Random(11)
+    values = [rng.uniform(-50, 50) for _ in range(5000)] + [0.0] * 100
+    sketch = QuantileSketch()
+    sketch.update(values)
+
+    assert_within_accuracy(sketch, values)
+
+
+def test_empty_sketch_has_no_quantiles():
+    sketch = QuantileSketch()
+    sketch.update([None])
+
+    assert sketch.count == 0
+    assert sketch.quantile(0.5) is None
+
+
+def test_merge_equals_sketch_of_all_values():
+    rng = random.Random(3)
+    days = [[rng.gauss(120, 15) for _ in range(1000)] for _ in range(7)]
+    week = QuantileSketch()
+    for day in days:
+        daily = QuantileSketch()
+        daily.update(day)
+        week.merge(daily)
+    direct = QuantileSketch()
+    direct.update(value for day in days for value in day)
+
+    assert week.count == direct.count
+    assert [week.quantile(q) for q in QUANTILES] == [direct.quantile(q) for q in QUANTILES]
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+
+def test_serialization_round_trip():
+    rng = random.Random(5)
+    sketch = QuantileSketch()
+    sketch.update([rng.uniform(-10, 300) for _ in range(3000)] + [0.0, 1e-9])
+    restored = QuantileSketch.from_bytes(sketch.to_bytes())
+
+    assert restored.relative_accuracy == sketch.relative_accuracy
+    assert restored.count == sketch.count
+    assert restored._positive == sketch._positive
+    assert restored._negative == sketch._negative
+    assert restored._zero_count == sketch._zero_count
+    # Still mergeable with sketches built in this process
+    restored.merge(sketch)
+    assert restored.count == 2 * sketch.count
+
+
+def test_serialized_day_is_small():
+    rng = random.Random(9)
+    sketch = QuantileSketch()
+    sketch.update(rng.gauss(120, 10) for _ in range(8640))
+
+    assert len(sketch.to_bytes()) < 1024
+
+
+def test_unknown_version_is_rejected():
+    data = bytearray(QuantileSketch().to_bytes())
+    data[0] = 99
+    with pytest.raises(ValueError):
+        QuantileSketch.from_bytes(bytes(data))
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 255, 300, 16383, 16384, 2 ** 32, 2 ** 63 - 1])
+def test_varint_round_trip(value):
+    out = bytearray(b"\xff")
+    _write_varint(out, value)
+    out.append(0xAB)
+
+    decoded, pos = _read_varint(bytes(out), 1)
+    assert decoded == value
+    assert out[pos] == 0xAB
+
+
+def test_varint_uses_one_byte_below_128():
+    out = bytearray()
+    _write_varint(out, 127)
+    _write_varint(out, 128)
+
+    assert bytes(out) == b"\x7f\x80\x01"
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 2, -2, 1000, -1000, 2 ** 40, -(2 ** 40)])
+def test_zigzag_round_trip(value):
+    encoded = _zigzag(value)
+
+    assert encoded >= 0
+    assert _unzigzag(encoded) == value
+    assert abs(value) <= 1 or encoded <= 2 * abs(value)
@@ -0,0 +1,198 @@
+import os
+import struct
+import time
+import uuid
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import pytest
+
+from app.services import shared_state as shared_state_module
+from app.services.shared_state import SharedStateTable, _HEARTBEAT_OFFSET, _SEQ
+
+READING = {"distance": 54.3, "temperature": 26.8, "battery": 75.0, "rssi": -90.0, "snr": 7.5,
+           "last_updated": datetime(2025, 3, 1, 12, 0)}
+
+
+@pytest.fixture
+def segment_name():
+    name = f"rvr-test-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    yield name
+    try:
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+@pytest.fixture
+def writer(segment_name):
+    table = SharedStateTable(segment_name, capacity=4)
+    table.open_writer()
+    yield table
+    table.close()
+
+
+@pytest.fixture
+def reader(segment_name):
+    table = SharedStateTable(segment_name, capacity=4)
+    yield table
+    table.close()
+
+
+class FakeTime:
+    """Stands in for the time module inside shared_state; on_sleep plays the writer"""
+
+    def __init__(self, on_sleep=None):
+        self.sleeps = 0
+        self.on_sleep = on_sleep
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        if self.on_sleep:
+            self.on_sleep()
+
+    def time(self):
+        return 0.0
+
+
+class CountingBody:
+    """Wraps the record struct so a test can change the seqlock counter mid-read"""
+
+    def __init__(self, body, during_read):
+        self._body = body
+        self.during_read = during_read
+        self.reads = 0
+
+    def unpack_from(self, buf, offset):
+        values = self._body.unpack_from(buf, offset)
+        self.reads += 1
+        self.during_read(self.reads)
+        return values
+
+    def __getattr__(self, name):
+        return getattr(self._body, name)
+
+
+def seq_offset(table, unit_id):
+    return table._offset(table._slots[unit_id])
+
+
+def set_seq(table, unit_id, value):
+    _SEQ.pack_into(table._shm.buf, seq_offset(table, unit_id), value)
+
+
+def get_seq(table, unit_id):
+    return _SEQ.unpack_from(table._shm.buf, seq_offset(table, unit_id))[0]
+
+
+def test_reader_sees_writer_state(writer, reader):
+    writer.write("001", READING, {"status": "warning", "last_updated": READING["last_updated"]}, 50.0)
+
+    assert reader.get_latest_sensor_data("001") == READING
+    assert reader.get_cached_normal_value("001") == 50.0
+    assert reader.get_fleet_status()["units"]["001"]["status"] == "warning"
+    assert reader.get_latest_sensor_data("002") is None
+
+
+def test_reader_waits_out_a_write_in_progress(writer, reader, monkeypatch):
+    writer.write("001", READING, None, 50.0)
+    reader.get_cached_normal_value("001")
+    seq = get_seq(writer, "001")
+    # The writer is mid-write: odd counter; it finishes while the reader backs off
+    set_seq(writer, "001", seq + 1)
+    fake_time = FakeTime(on_sleep=lambda: set_seq(writer, "001", seq + 2))
+    monkeypatch.setattr(shared_state_module, "time", fake_time)
+
+    assert reader.get_cached_normal_value("001") == 50.0
+    assert fake_time.sleeps == 1
+
+
+def test_reader_retries_when_the_record_changes_mid_read(writer, reader, monkeypatch):
+    writer.write("001", READING, None, 50.0)
+    reader.get_cached_normal_value("001")
+    seq = get_seq(writer, "001")
+
+    def writer_runs(reads):
+        # The first copy races a whole write: the counter is even before and after, but different
+        if reads == 1:
+            writer.write("001", READING, None, 60.0)
+
+    body = CountingBody(shared_state_module._BODY, writer_runs)
+    monkeypatch.setattr(shared_state_module, "_BODY", body)
+
+    assert reader.get_cached_normal_value("001") == 60.0
+    assert body.reads == 2
+    assert get_seq(writer, "001") == seq + 2
+
+
+def test_reader_gives_up_on_a_writer_stuck_mid_write(writer, reader, monkeypatch):
+    writer.write("001", READING, None, 50.0)
+    reader.get_cached_normal_value("001")
+    set_seq(writer, "001", get_seq(writer, "001") + 1)
+    fake_time = FakeTime()
+    monkeypatch.setattr(shared_state_module, "time", fake_time)
+
+    assert reader.get_cached_normal_value("001") is None
+    assert fake_time.sleeps == 100
+
+
+def test_new_writer_closes_a_write_left_in_progress(segment_name, writer):
+    writer.write("001", READING, None, 50.0)
+    set_seq(writer, "001", get_seq(writer, "001") + 1)
+    writer.close()
+
+    restarted = SharedStateTable(segment_name, capacity=4)
+    restarted.open_writer()
+    try:
+        assert get_seq(restarted, "001") % 2 == 0
+        assert restarted.get_cached_normal_value("001") == 50.0
+    finally:
+        restarted.close()
+
+
+def test_reader_reattaches_when_the_segment_is_replaced(segment_name, writer, reader):
+    writer.write("001", READING, None, 50.0)
+    assert reader.get_cached_normal_value("001") == 50.0
+    writer.close()
+
+    # A restarted ingest process with a different capacity replaces the segment
+    replacement = SharedStateTable(segment_name, capacity=8)
+    replacement.open_writer()
+    try:
+        replacement.write("002", READING, None, 70.0)
+
+        assert reader.get_cached_normal_value("002") == 70.0
+        assert reader.get_cached_normal_value("001") is None
+        assert reader.get_status()["capacity"] == 8
+    finally:
+        replacement.close()
+
+
+def set_heartbeat(table, value):
+    struct.pack_into("<d", table._shm.buf, _HEARTBEAT_OFFSET, value)
+
+
+def test_reader_ignores_a_writer_that_stopped_heartbeating(writer, reader):
+    writer.write("001", READING, {"status": "warning", "last_updated": READING["last_updated"]}, 50.0)
+    assert reader.get_cached_normal_value("001") == 50.0
+
+    # The ingest process died without closing the table
+    set_heartbeat(writer, time.time() - reader.stale_after - 1)
+
+    assert reader.get_latest_sensor_data("001") is None
+    assert reader.get_cached_normal_value("001") is None
+    assert reader.get_fleet_status()["total_units"] == 0
+    assert reader.get_status()["writer_alive"] is False
+
+    writer.heartbeat()
+    assert reader.get_cached_normal_value("001") == 50.0
+
+
+def test_reader_ignores_a_closed_writer(writer, reader):
+    writer.write("001", READING, None, 50.0)
+    assert reader.get_cached_normal_value("001") == 50.0
+    writer.close()
+
+    assert reader.get_cached_normal_value("001") is None
@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta
+
+from app.services.stale_sensor_monitor import FINE, OVERFLOW, StaleSensorMonitor
+
+
+def make_monitor(tick_seconds=1.0, wheel_size=8):
+    monitor = StaleSensorMonitor(tick_seconds=tick_seconds, wheel_size=wheel_size)
+    monitor._default_interval = 10.0
+    monitor._missed_reports = 3
+    monitor._max_interval = 3600.0
+    return monitor
+
+
+def test_reading_lands_in_first_slot_after_deadline():
+    monitor = make_monitor(tick_seconds=1.0, wheel_size=256)
+    monitor.record_reading("001", now=100.0)
+
+    deadline, wheel, slot = monitor._deadlines["001"]
+    assert deadline == 130.0
+    assert wheel == FINE
+    assert slot == 131
+    assert "001" in monitor._slots[slot]
+
+
+def test_rearming_moves_unit_to_new_slot():
+    monitor = make_monitor(wheel_size=256)
+    monitor.set_expected_interval("001", 10.0)
+    monitor.record_reading("001", now=100.0)
+    old_slot = monitor._deadlines["001"][2]
+    monitor.record_reading("001", now=105.0)
+
+    new_slot = monitor._deadlines["001"][2]
+    assert new_slot != old_slot
+    assert "001" not in monitor._slots[old_slot]
+    assert sum("001" in slot for slot in monitor._slots) == 1
+
+
+def test_deadline_in_a_later_revolution_waits_in_the_overflow_wheel():
+    monitor = make_monitor(wheel_size=8)
+    monitor.advance(now=0.0)
+    monitor.record_reading("001", now=0.0)
+
+    deadline, wheel, slot = monitor._deadlines["001"]
+    assert (wheel, slot) == (OVERFLOW, 31 // 8)
+    assert not any(monitor._slots)
+
+
+def test_overflow_units_are_only_touched_when_their_revolution_starts():
+    monitor = make_monitor(wheel_size=8)
+    monitor.advance(now=0.0)
+    monitor.record_reading("001", now=0.0)
+    cascaded = []
+    cascade = monitor._cascade
+    monitor._cascade = lambda revolution: (cascaded.append(revolution), cascade(revolution))
+
+    for now in range(1, 31):
+        assert monitor.advance(now=float(now)) == [], now
+        # Moved down to the fine wheel for the revolution holding its deadline, not before
+        assert (monitor._deadlines["001"][1] == FINE) == (now >= 24), now
+    assert monitor.advance(now=31.0) == ["001"]
+    assert cascaded == [1, 2, 3]
+
+
+def test_overflow_wraps_for_deadlines_beyond_its_range():
+    monitor = StaleSensorMonitor(tick_seconds=1.0, wheel_size=4, overflow_size=2)
+    monitor._missed_reports = 1
+    monitor.set_expected_interval("001", 20.0)
+    monitor.advance(now=0.0)
+    monitor.record_reading("001", now=0.0)
+
+    for now in range(1, 21):
+        assert monitor.advance(now=float(now)) == [], now
+    assert monitor.advance(now=21.0) == ["001"]
+
+
+def test_readings_and_ticks_follow_the_clock():
+    clock = [datetime(2025, 3, 1, 12, 0)]
+    monitor = make_monitor(wheel_size=64)
+    monitor.set_clock(lambda: clock[0])
+    monitor.advance()
+    monitor.record_reading("001")
+
+    clock[0] += timedelta(seconds=30)
+    assert monitor.advance() == []
+    clock[0] += timedelta(seconds=1)
+    assert monitor.advance() == ["001"]
+
+
+def test_unit_expires_only_after_deadline():
+    monitor = make_monitor(wheel_size=64)
+    monitor.record_reading("001", now=100.0)
+    monitor.advance(now=100.0)
+
+    assert monitor.advance(now=130.5) == []
+    assert monitor.advance(now=131.0) == ["001"]
+    assert "001" not in monitor._deadlines
+
+
+def test_deadline_beyond_one_revolution_waits_for_later_pass():
+    # 8 one-second slots, deadline 30 s away: the slot comes round three times first
+    monitor = make_monitor(wheel_size=8)
+    monitor.record_reading("001", now=0.0)
+    monitor.advance(now=0.0)
+
+    for now in range(1, 31):
+        assert monitor.advance(now=float(now)) == [], now
+    assert monitor.advance(now=31.0) == ["001"]
+
+
+def test_long_pause_visits_every_slot_once():
+    monitor = make_monitor(wheel_size=8)
+    monitor.advance(now=0.0)
+    monitor.record_reading("001", now=0.0)
+    monitor.record_reading("002", now=2.0)
+
+    assert sorted(monitor.advance(now=500.0)) == ["001", "002"]
+
+
+def test_slow_unit_seeds_interval_from_first_gap():
+    monitor = make_monitor(wheel_size=64)
+    monitor.record_reading("001", now=0.0)
+    monitor.record_reading("001", now=60.0)
+
+    assert monitor.get_expected_interval("001") == 60.0
+    assert monitor._deadlines["001"][0] == 240.0
+    monitor.advance(now=60.0)
+    # Regular 60 s reports never expire
+    for now in range(120, 1200, 60):
+        assert monitor.advance(now=float(now)) == []
+        monitor.record_reading("001", now=float(now))
+
+
+def test_outage_does_not_stretch_learned_interval():
+    monitor = make_monitor()
+    monitor.record_reading("001", now=0.0)
+    monitor.record_reading("001", now=10.0)
+    monitor.record_reading("001", now=500.0)
+
+    assert monitor.get_expected_interval("001") == 10.0
+
+
+def test_learned_interval_is_capped():
+    monitor = make_monitor()
+    monitor._max_interval = 120.0
+    monitor.record_reading("001", now=0.0)
+    monitor.record_reading("001", now=1000.0)
+
+    assert monitor.get_expected_interval("001") == 120.0
+
+
+def test_forget_unit_removes_it_from_the_wheel():
+    monitor = make_monitor()
+    monitor.record_reading("001", now=0.0)
+    monitor.forget_unit("001")
+
+    assert monitor.advance(now=1000.0) == []
+    assert not any(monitor._slots)
+
+
+def test_clearing_the_cache_stops_watching_the_unit():
+    from app.services.mqtt_cache_manager import MQTTCacheManager
+
+    monitor = make_monitor()
+    manager = MQTTCacheManager()
+    manager.attach_stale_monitor(monitor)
+    monitor.record_reading("001", now=0.0)
+    monitor.record_reading("002", now=0.0)
+
+    manager.clear_cache("001")
+    assert "001" not in monitor._deadlines and "002" in monitor._deadlines
+    manager.clear_cache()
+    assert monitor.advance(now=1000.0) == []
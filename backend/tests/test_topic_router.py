@@ -0,0 +1,119 @@
+import pytest
+
+from app.services.topic_router import TopicRouter, compile_topic_filter
+
+
+def matches(topic_filter, topic):
+    return compile_topic_filter(topic_filter).fullmatch(topic) is not None
+
+
+def groups(topic_filter, topic):
+    return compile_topic_filter(topic_filter).fullmatch(topic).groups()
+
+
+@pytest.mark.parametrize("topic, expected", [
+    ("river/units/001/reading", True),
+    ("river/units//reading", True),
+    ("river/units/001/002/reading", False),
+    ("river/units/reading", False),
+    ("river/units/001/reading/extra", False),
+])
+def test_plus_matches_exactly_one_level(topic, expected):
+    assert matches("river/units/+/reading", topic) is expected
+
+
+def test_plus_captures_each_level():
+    assert groups("+/units/+/reading", "river/units/001/reading") == ("river", "001")
+
+
+@pytest.mark.parametrize("topic, expected", [
+    ("river", True),
+    ("river/units", True),
+    ("river/units/001/reading", True),
+    ("rivers/units", False),
+    ("lake/river", False),
+])
+def test_hash_matches_the_parent_and_every_level_below(topic, expected):
+    assert matches("river/#", topic) is expected
+
+
+def test_hash_captures_the_remainder():
+    assert groups("river/#", "river/units/001") == ("units/001",)
+    assert groups("river/#", "river") == (None,)
+
+
+def test_special_characters_are_literal():
+    assert matches("lora/water.level", "lora/water.level")
+    assert not matches("lora/water.level", "lora/waterXlevel")
+
+
+@pytest.mark.parametrize("topic_filter", ["#", "+/broker", "+/#"])
+def test_leading_wildcards_do_not_match_dollar_topics(topic_filter):
+    assert not matches(topic_filter, "$SYS/broker")
+
+
+def test_leading_wildcards_match_ordinary_topics():
+    assert matches("#", "river/units")
+    assert matches("+/broker", "sys/broker")
+
+
+def test_dollar_topics_match_explicit_filters():
+    assert matches("$SYS/#", "$SYS/broker/uptime")
+    assert matches("$SYS/+/uptime", "$SYS/broker/uptime")
+    assert matches("river/+", "river/$status")
+
+
+def test_shared_subscription_prefix_is_ignored():
+    assert matches("$share/ingest/river/units/+/reading", "river/units/001/reading")
+    assert not matches("$share/ingest/river/units/+/reading", "$share/ingest/river/units/001/reading")
+
+
+@pytest.mark.parametrize("topic_filter", [
+    "", "river/#/reading", "river#", "river/units+", "river/+units/reading", "$share/ingest", "$share/ingest/"
+])
+def test_invalid_filters_raise(topic_filter):
+    with pytest.raises(ValueError):
+        compile_topic_filter(topic_filter)
+
+
+async def handler(message, context):
+    pass
+
+
+def test_router_rejects_invalid_filters_and_decoders():
+    router = TopicRouter()
+    with pytest.raises(ValueError):
+        router.add("river/#/reading", handler)
+    with pytest.raises(ValueError):
+        router.add("river/#", handler, decoder="xml")
+    assert router.get_routes() == []
+
+
+def test_resolve_returns_every_matching_route_with_its_params():
+    router = TopicRouter()
+    router.add("river/units/+/reading", handler)
+    router.add("river/#", handler, decoder="batch")
+    router.add("lake/#", handler)
+
+    resolved = router.resolve("river/units/001/reading")
+
+    assert [(route.topic_filter, params) for route, params in resolved] == [
+        ("river/units/+/reading", ("001",)),
+        ("river/#", ("units/001/reading",)),
+    ]
+    assert router.resolve("sea/units") == ()
+
+
+def test_resolve_caches_per_topic_until_routes_change():
+    router = TopicRouter(cache_size=2)
+    router.add("river/+", handler)
+
+    first = router.resolve("river/001")
+    assert router.resolve("river/001") is first
+
+    router.resolve("river/002")
+    router.resolve("river/003")
+    assert len(router._cache) == 1
+
+    router.add("river/#", handler)
+    assert len(router.resolve("river/001")) == 2